@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark for KP_Cache at 1M keys
+
+Measures set, get, and set-at-capacity (eviction) throughput, plus the
+cost of purging a large batch of expired items.
+
+    python bench/bench_cache.py [--keys 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# make the source tree importable
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' ) )
+
+from utils.cache import KP_Cache
+
+# time a callable and return ops/sec
+def _rate( label, count, func ):
+    start = time.perf_counter( )
+    func( )
+    elapsed = time.perf_counter( ) - start
+    print( f"{label:<34} {count:>10} ops  {elapsed:>8.3f}s  {count / elapsed:>12,.0f} ops/s" )
+    return elapsed
+
+# run the benchmark
+def main( ):
+
+    _args = argparse.ArgumentParser( description="KP_Cache micro-benchmark" )
+    _args.add_argument( "--keys", type=int, default=1_000_000 )
+    args = _args.parse_args( )
+    n = args.keys
+
+    # fill the cache
+    cache = KP_Cache( max_size=n, default_ttl=3600.0 )
+    _rate( "set (fill)", n, lambda: [cache.set( i, i ) for i in range( n )] )
+
+    # read every key back
+    _rate( "get (hit)", n, lambda: [cache.get( i ) for i in range( n )] )
+
+    # keep setting new keys while full, every set evicts the LRU item
+    _rate( "set at capacity (LRU evict)", n // 10, lambda: [cache.set( n + i, i ) for i in range( n // 10 )] )
+
+    # overwrite existing keys, leaving stale heap entries to compact
+    _rate( "set (overwrite)", n, lambda: [cache.set( n + i, i ) for i in range( n )] )
+
+    # expiry: a full cache where half the items have already expired
+    cache = KP_Cache( max_size=n, default_ttl=3600.0 )
+    for i in range( n ):
+        cache.set( i, i, ttl_seconds=( -1 if i % 2 else 3600.0 ) )
+
+    # the first set at capacity purges all the expired items from the heap
+    _rate( "set at capacity (purge n/2 expired)", 1, lambda: cache.set( -1, -1 ) )
+
+    # after the purge, sets at capacity only pop the heap top
+    _rate( "set after purge", n // 10, lambda: [cache.set( -2 - i, i ) for i in range( n // 10 )] )
+    print( f"entries: {len( cache )}" )
+
+if __name__ == "__main__":
+    main( )
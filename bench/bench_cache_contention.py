@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Contention benchmark for KP_Cache vs KP_Sharded_Cache
+
+A ThreadPoolExecutor drives mixed get/set traffic (90% get, 10% set by
+default) from several worker threads against one shared cache.
+
+    python bench/bench_cache_contention.py [--threads 8 16] [--ops 200000] [--shards 16]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# make the source tree importable
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' ) )
+
+from utils.cache import KP_Cache, KP_Sharded_Cache
+
+# a single workers traffic
+def _worker( cache, ops, keyspace, write_ratio, seed ):
+
+    rnd = random.Random( seed )
+    keys = [rnd.randrange( keyspace ) for _ in range( ops )]
+    writes = [rnd.random( ) < write_ratio for _ in range( ops )]
+    hits = 0
+
+    # run the traffic
+    for key, write in zip( keys, writes ):
+        if write:
+            cache.set( key, key )
+        elif cache.get( key ) is not None:
+            hits += 1
+
+    return hits
+
+# run one configuration
+def _run( label, cache, threads, ops, keyspace, write_ratio ):
+
+    # warm it up
+    for key in range( 0, keyspace, 2 ):
+        cache.set( key, key )
+
+    # drive it
+    per_thread = ops // threads
+    start = time.perf_counter( )
+    with ThreadPoolExecutor( max_workers=threads ) as executor:
+        hits = sum( executor.map( lambda i: _worker( cache, per_thread, keyspace, write_ratio, i ), range( threads ) ) )
+    elapsed = time.perf_counter( ) - start
+
+    total = per_thread * threads
+    print( f"{label:<22} threads={threads:<3} {total:>9} ops  {elapsed:>7.3f}s  {total / elapsed:>11,.0f} ops/s  hits={hits}" )
+
+# run the benchmark
+def main( ):
+
+    _args = argparse.ArgumentParser( description="KP_Cache contention benchmark" )
+    _args.add_argument( "--threads", type=int, nargs="+", default=[1, 8, 16] )
+    _args.add_argument( "--ops", type=int, default=400_000 )
+    _args.add_argument( "--keys", type=int, default=50_000 )
+    _args.add_argument( "--shards", type=int, default=16 )
+    _args.add_argument( "--write-ratio", type=float, default=0.1 )
+    args = _args.parse_args( )
+
+    # run each thread count against both caches
+    for threads in args.threads:
+        _run( "KP_Cache", KP_Cache( max_size=args.keys ), threads, args.ops, args.keys, args.write_ratio )
+        _run( f"KP_Sharded_Cache({args.shards})", KP_Sharded_Cache( max_size=args.keys, shards=args.shards ), threads, args.ops, args.keys, args.write_ratio )
+
+if __name__ == "__main__":
+    main( )
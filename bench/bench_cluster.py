@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Multi node claiming check for KP_Cluster against a local MySQL
+
+Starts several node processes on one cluster round of synthetic provider
+ids (no providers are fetched, nothing is staged), each claiming with a
+couple of threads and sleeping for the provider's "work". Optionally one
+node dies mid-round, so its leases have to expire and be taken over.
+Checks every provider finished exactly once and the final step ran once,
+and reports the wall time against a single node. With --kill, a provider
+the dead node finished but never marked done is redone by another node,
+so only those may show up twice.
+
+Uses the database in .kptvconf, creating the sync_rounds and sync_claims
+tables if they're missing. Each run uses its own cluster name.
+
+    python bench/bench_cluster.py [--nodes 1 3] [--providers 60] [--threads 2] [--work 0.2] [--lease 10] [--kill]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+# make the source tree importable
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' ) )
+
+# one node: claim until the round is done, then try to close it
+def _node( name, node, providers, threads, work, lease, die_after, done, finals ):
+
+    from sync.cluster import KP_Cluster
+
+    # join the round, the first node in opens it
+    cluster = KP_Cluster( name, lease, node=node )
+    cluster.setup( )
+    cluster.join( [{ 'id': p_id } for p_id in range( 1, providers + 1 )], { p_id: random.random( ) for p_id in range( 1, providers + 1 ) } )
+
+    # each provider sleeps for its work, a dying node goes down holding its claims
+    _count = [0]
+    _lock = threading.Lock( )
+    def _work( p_id ):
+        with _lock:
+            _count[0] += 1
+            if die_after and _count[0] > die_after:
+                os._exit( 1 )
+        time.sleep( work )
+        done.put( ( node, p_id ) )
+        return True
+
+    # claim from a few threads
+    _threads = [threading.Thread( target=cluster.work, args=( _work, ) ) for _ in range( threads )]
+    for thread in _threads:
+        thread.start( )
+    for thread in _threads:
+        thread.join( )
+
+    # and close it, only one node runs the final step
+    cluster.close( lambda: finals.put( node ) )
+
+# run one configuration
+def _run( nodes, providers, threads, work, lease, kill ):
+
+    # a fresh cluster name, so runs never share a round
+    _name = f"bench-{uuid.uuid4( ).hex[:8]}"
+    _done = multiprocessing.Queue( )
+    _finals = multiprocessing.Queue( )
+
+    # start the nodes, a little apart like cron on different hosts, the first one dies if asked
+    start = time.perf_counter( )
+    _procs = []
+    for i in range( nodes ):
+        _die = providers // ( nodes * threads * 2 ) if kill and i == 0 and nodes > 1 else 0
+        _proc = multiprocessing.Process( target=_node, args=( _name, f"node{i}", providers, threads, work, lease, _die, _done, _finals ) )
+        _proc.start( )
+        _procs.append( _proc )
+        time.sleep( 0.2 )
+    for proc in _procs:
+        proc.join( )
+    elapsed = time.perf_counter( ) - start
+
+    # collect what finished
+    _finished = []
+    while not _done.empty( ):
+        _finished.append( _done.get( ) )
+    _final = []
+    while not _finals.empty( ):
+        _final.append( _finals.get( ) )
+
+    # check it: everything finished, and only the dead node's work was done twice
+    _by_id = { }
+    _per_node = { }
+    for node, p_id in _finished:
+        _by_id.setdefault( p_id, [] ).append( node )
+        _per_node[node] = _per_node.get( node, 0 ) + 1
+    _repeats = { p_id: _nodes for p_id, _nodes in _by_id.items( ) if len( _nodes ) > 1 }
+    _ok = sorted( _by_id ) == list( range( 1, providers + 1 ) ) and len( _final ) == 1 and all( kill and 'node0' in _nodes for _nodes in _repeats.values( ) )
+    print( f"nodes={nodes:<3} providers={providers:<5} {elapsed:>8.2f}s  finished={len( _finished ):<5} redone={len( _repeats ):<3} final_runs={len( _final )}  per node={_per_node}  {'OK' if _ok else 'MISMATCH'}" )
+    return _ok
+
+# run the check
+def main( ):
+
+    _args = argparse.ArgumentParser( description="KP_Cluster multi node claiming check" )
+    _args.add_argument( "--nodes", type=int, nargs="+", default=[1, 3] )
+    _args.add_argument( "--providers", type=int, default=60 )
+    _args.add_argument( "--threads", type=int, default=2 )
+    _args.add_argument( "--work", type=float, default=0.2 )
+    _args.add_argument( "--lease", type=float, default=10 )
+    _args.add_argument( "--kill", action="store_true", help="kill the first node partway through its claims" )
+    args = _args.parse_args( )
+
+    # run each node count
+    _ok = all( [_run( nodes, args.providers, args.threads, args.work, args.lease, args.kill ) for nodes in args.nodes] )
+    sys.exit( 0 if _ok else 1 )
+
+if __name__ == "__main__":
+    main( )
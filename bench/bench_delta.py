@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Contract check and benchmark for the --delta diff
+
+Runs one provider's catalog through KP_Delta against a throwaway snapshot
+store: the first sync, an unchanged sync, then a stream added, changed and
+removed. Checks each provider is staged all or nothing: the whole catalog
+whenever anything differs from the snapshot, nothing when nothing does,
+since the final procedures reconcile a staged provider against every row it
+staged. Exits non-zero if it isn't, and reports how long each diff took.
+
+    python bench/bench_delta.py [--streams 100000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# make the source tree importable
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' ) )
+
+from sync.delta import KP_Delta, KP_Delta_Store
+
+# a converted row
+def _row( i, name=None ):
+    return { 's_orig_name': name or f"Stream {i}", 's_stream_uri': f"http://example.com/live/u/p/{i}.ts", 's_tvg_id': f"tvg{i}", 's_tvg_logo': '', 's_group': 'live', 's_type_id': 0 }
+
+# diff a catalog, save it as the snapshot, and check what was staged: returns whether it held
+def _check( delta, label, rows, expect_full ):
+
+    # diff it, and save it like the end of a sync does
+    start = time.perf_counter( )
+    staged, fingerprints, counts = delta.diff( 1, rows )
+    elapsed = time.perf_counter( ) - start
+    delta.record( 1, fingerprints )
+    delta.commit( )
+
+    # all of it or none of it
+    ok = ( staged is rows or staged == rows ) if expect_full else staged == []
+    print( f"{label:<20} {len( rows ):>8} rows  {elapsed:>8.3f}s  staged {len( staged ):>8}  "
+           f"+{counts['added']} ~{counts['changed']} -{counts['removed']} ={counts['unchanged']}  {'ok' if ok else 'FAILED'}" )
+    return ok
+
+# run the check
+def main( ):
+
+    _args = argparse.ArgumentParser( description="--delta contract check and benchmark" )
+    _args.add_argument( "--streams", type=int, default=100_000 )
+    args = _args.parse_args( )
+    n = args.streams
+
+    # a throwaway store
+    with tempfile.TemporaryDirectory( ) as tmp:
+        delta = KP_Delta( KP_Delta_Store( os.path.join( tmp, 'delta.sqlite3' ) ) )
+        rows = [_row( i ) for i in range( n )]
+        added = rows + [_row( n )]
+        changed = rows[:-1] + [_row( n - 1, "Renamed" ), _row( n )]
+        removed = changed[1:]
+
+        # each step against the one before: what changed, and whether the whole catalog has to go
+        results = [
+            _check( delta, "first sync", rows, True ),
+            _check( delta, "unchanged", list( rows ), False ),
+            _check( delta, "one added", added, True ),
+            _check( delta, "one changed", changed, True ),
+            _check( delta, "one removed", removed, True ),
+            _check( delta, "unchanged again", list( removed ), False ),
+        ]
+
+    # fail loudly if the contract broke
+    if not all( results ):
+        print( "delta contract broken: a provider has to be staged in full or not at all" )
+        sys.exit( 1 )
+    print( "delta contract holds" )
+
+if __name__ == "__main__":
+    main( )
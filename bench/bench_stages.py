@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Thread-only vs process-pool benchmark for the parse/filter/convert stages
+
+Builds synthetic API and M3U payloads for a set of providers (no network,
+no database), then runs the stages the way KP_Sync does: once entirely on
+a ThreadPoolExecutor, and once with the threads handing chunks to a
+KP_Stage_Pool. Both runs must produce the same rows.
+
+    python bench/bench_stages.py [--providers 16] [--streams 50000] [--threads 8] [--processes 0] [--chunk-size 5000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# make the source tree importable
+sys.path.insert( 0, os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), '..', 'src' ) )
+
+# some words to build stream names from
+WORDS = ['news', 'sports', 'movie', 'series', 'kids', 'music', 'hd', 'fhd', 'uk', 'us', 'de', 'fr', '24/7', 'live', 'plus', 'max', 'cinema', 'doc']
+
+# the filters every provider uses
+FILTERS = [
+    { 'id': 1, 'sf_type_id': 0, 'sf_filter': r'^(US|UK)\b.*HD' },
+    { 'id': 2, 'sf_type_id': 1, 'sf_filter': 'kids' },
+    { 'id': 3, 'sf_type_id': 2, 'sf_filter': r'\b(de|fr)\b' },
+    { 'id': 4, 'sf_type_id': 3, 'sf_filter': r'/live/[^/]+/[^/]+/9\d+\.' },
+]
+
+# build a providers payload
+def _payload( rnd, streams, m3u ):
+
+    # the names, with some duplicates like real panels have
+    names = [" ".join( rnd.choice( WORDS ) for _ in range( rnd.randint( 2, 5 ) ) ).title( ) + f" {rnd.randrange( streams // 2 )}" for _ in range( streams )]
+
+    # m3u text
+    if m3u:
+        lines = ["#EXTM3U"]
+        for idx, name in enumerate( names ):
+            lines.append( f'#EXTINF:-1 tvg-id="id{idx}" tvg-logo="http://logo/{idx}.png" group-title="Group {idx % 40}",{name}' )
+            lines.append( f"http://panel.example/live/user/pass/{idx}.ts" )
+        return 'm3u', "\n".join( lines )
+
+    # api items
+    return 'live', [{ 'stream_id': idx, 'name': name, 'category_id': str( idx % 40 ), 'epg_channel_id': f"id{idx}", 'stream_icon': f"http://logo/{idx}.png", 'is_adult': 0 } for idx, name in enumerate( names )]
+
+# run everything on threads
+def _thread_only( getter, sync, jobs, threads ):
+
+    from sync.filter import KP_Filter
+
+    # a single provider
+    def _one( job ):
+        provider, stream_type, payload = job
+        _compiled = KP_Filter.compile_filters( FILTERS )
+        data = getter._normalize_data( payload, stream_type, provider, _compiled, set( ) )
+        return sync._convert_streams( data or {}, provider )
+
+    # run them
+    with ThreadPoolExecutor( max_workers=threads ) as executor:
+        return list( executor.map( _one, jobs ) )
+
+# run the cpu stages in worker processes
+def _process_pool( pool, sync, jobs, threads ):
+
+    # a single provider
+    def _one( job ):
+        provider, stream_type, payload = job
+        rows, _, _, _ = pool.process( provider, [( stream_type, payload )], FILTERS )
+        return sync._convert_rows( rows, provider )
+
+    # run them
+    with ThreadPoolExecutor( max_workers=threads ) as executor:
+        return list( executor.map( _one, jobs ) )
+
+# run the benchmark
+def main( ):
+
+    # setup the arguments
+    parser = argparse.ArgumentParser( description="Thread-only vs process-pool stage benchmark" )
+    parser.add_argument( "--providers", type=int, default=16 )
+    parser.add_argument( "--streams", type=int, default=50000, help="streams per provider" )
+    parser.add_argument( "--threads", type=int, default=8 )
+    parser.add_argument( "--processes", type=int, default=0, help="worker processes, 0 for one per cpu" )
+    parser.add_argument( "--chunk-size", dest='chunk_size', type=int, default=5000 )
+    parser.add_argument( "--m3u", action="store_true", help="build m3u payloads instead of api ones" )
+    args = parser.parse_args( )
+
+    # the app parses its own arguments when it's imported
+    sys.argv = [sys.argv[0], "-a", "sync"]
+    from sync.get import KP_Get
+    from sync.stage import KP_Stage_Pool
+    from sync.sync import KP_Sync
+
+    # setup the payloads
+    rnd = random.Random( 42 )
+    jobs = []
+    for pid in range( args.providers ):
+        provider = { 'id': pid, 'u_id': pid % 4, 'sp_name': f"provider {pid}", 'sp_domain': "http://panel.example", 'sp_username': "user", 'sp_password': "pass", 'sp_stream_type': 0, 'sp_type': 1 if args.m3u else 0 }
+        jobs.append( ( provider, *_payload( rnd, args.streams, args.m3u ) ) )
+
+    # we only need the converters, not a real sync
+    getter = KP_Get( )
+    sync = KP_Sync.__new__( KP_Sync )
+
+    print( f"cpus={os.cpu_count( )} providers={args.providers} streams/provider={args.streams} threads={args.threads} payload={'m3u' if args.m3u else 'api'}" )
+
+    # thread only
+    start = time.perf_counter( )
+    threaded = _thread_only( getter, sync, jobs, args.threads )
+    elapsed = time.perf_counter( ) - start
+    print( f"{'threads only':<28} {elapsed:>8.3f}s  {sum( len( r ) for r in threaded ):>10} rows" )
+
+    # process pool, started outside the timing
+    with KP_Stage_Pool( args.processes or None, args.chunk_size ) as pool:
+        pool.process( jobs[0][0], [], FILTERS )
+        start = time.perf_counter( )
+        pooled = _process_pool( pool, sync, jobs, args.threads )
+        elapsed = time.perf_counter( ) - start
+        print( f"{f'process pool ({pool.workers} procs)':<28} {elapsed:>8.3f}s  {sum( len( r ) for r in pooled ):>10} rows" )
+
+    # they have to agree
+    _key = lambda rows: sorted( ( r['s_orig_name'], r['s_stream_uri'] ) for r in rows )
+    same = all( _key( a ) == _key( b ) for a, b in zip( threaded, pooled ) )
+    print( f"results match: {same}" )
+
+if __name__ == "__main__":
+    main( )
@@ -32,6 +32,7 @@ pyinstaller \
     --clean \
     --hidden-import pymysql \
     --hidden-import pymysql.cursors \
+    --hidden-import utils.profiling \
     -F \
     -n kptv \
     -p $CODEPATH/src/ \
@@ -4,6 +4,12 @@
 import subprocess, sys, argparse
 from argparse import RawTextHelpFormatter, SUPPRESS
 
+# Import debug utilities
+try:
+    from utils.debug import flush as debug_flush
+except ImportError:
+    def debug_flush( ): pass
+
 # our common class
 class KP_Common:
 
@@ -27,7 +33,11 @@ class KP_Common:
         # Set debug state for the entire application
         try:
             from utils.debug import set_debug
-            set_debug(self.args.debug if self.args else False)
+            if self.args:
+                _categories = self.args.debug_categories.split( "," ) if self.args.debug_categories else None
+                set_debug( self.args.debug, self.args.debug_level, _categories )
+            else:
+                set_debug( False )
         except ImportError:
             # Debug utils not available, skip
             pass
@@ -58,7 +68,32 @@ class KP_Common:
         _args.add_argument( "--vod", action="store_true", help=SUPPRESS )
         _args.add_argument( "--provider", type=int, help=SUPPRESS )
         _args.add_argument( "--debug", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--debug-level", dest='debug_level', choices=['trace', 'debug', 'info', 'warn', 'error'], default='debug', help=SUPPRESS )
+        _args.add_argument( "--debug-categories", dest='debug_categories', help=SUPPRESS )
         _args.add_argument( "--fix", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--filter-stats", dest='filter_stats', action="store_true", help=SUPPRESS )
+        _args.add_argument( "--no-disk-cache", dest='no_disk_cache', action="store_true", help=SUPPRESS )
+        _args.add_argument( "--report", nargs='?', const='', default=None, help=SUPPRESS )
+        _args.add_argument( "--metrics-file", dest='metrics_file', default=None, help=SUPPRESS )
+        _args.add_argument( "--profile", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--profile-memory", dest='profile_memory', action="store_true", help=SUPPRESS )
+        _args.add_argument( "--processes", type=int, nargs='?', const=0, default=None, help=SUPPRESS )
+        _args.add_argument( "--force", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--delta", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--dry-run", dest='dry_run', nargs='?', const='null', default=None, choices=['null', 'jsonl', 'csv'], help=SUPPRESS )
+        _args.add_argument( "--output", default=None, help=SUPPRESS )
+        _args.add_argument( "--fixtures", default=None, help=SUPPRESS )
+        _args.add_argument( "--cluster", nargs='?', const='default', default=None, help=SUPPRESS )
+        _args.add_argument( "--lease", type=float, default=300.0, help=SUPPRESS )
+        _args.add_argument( "--interval", type=float, default=60.0, help=SUPPRESS )
+        _args.add_argument( "--test-interval", dest='test_interval', type=float, default=24.0, help=SUPPRESS )
+        _args.add_argument( "--engine", choices=['thread', 'async'], default='thread', help=SUPPRESS )
+        _args.add_argument( "--concurrency", type=int, default=None, help=SUPPRESS )
+        _args.add_argument( "--memory-budget", dest='memory_budget', type=float, default=None, help=SUPPRESS )
+        _args.add_argument( "--run-timeout", dest='run_timeout', type=float, default=3600.0, help=SUPPRESS )
+        _args.add_argument( "--provider-timeout", dest='provider_timeout', type=float, default=None, help=SUPPRESS )
+        _args.add_argument( "--resume", action="store_true", help=SUPPRESS )
+        _args.add_argument( "--reuse-tests", dest='reuse_tests', action="store_true", help=SUPPRESS )
 
         # Safe init
         _the_args = None
@@ -91,7 +126,7 @@ class KP_Common:
             sys.exit( )
 
         # Validate action manually
-        if _action not in ['sync', 'fixup', 'teststreams']:
+        if _action not in ['sync', 'fixup', 'teststreams', 'daemon']:
             print("*" * 76)
             self.kp_print("error", f"'{_action}' is not a valid action.")
             self.custom_help( )
@@ -111,19 +146,47 @@ class KP_Common:
     # our custom help message
     def custom_help( self ):
         print( "*" * 76 )
-        print( '''usage: \033[92m./main.py [-h] -a {sync,fixup,teststreams} [options]\033[37m
+        print( '''usage: \033[92m./main.py [-h] -a {sync,fixup,teststreams,daemon} [options]\033[37m
 \t\033[94msync\033[37m: Sync the streams from the providers to the stream manager.
 \t\t\033[93mOPTIONS:\033[37m
 \t\t\t\033[94m--live\033[37m Sync all live streams.
 \t\t\t\033[94m--series\033[37m Sync all series streams.
 \t\t\t\033[94m--vod\033[37m Sync all vod streams.
 \t\t\t\033[94m--provider [###]\033[37m Sync only the streams for the specified provider id.              
+\t\t\t\033[94m--force\033[37m Sync every provider, even those whose refresh period hasn't passed.
+\t\t\t\033[94m--delta\033[37m Skip staging the providers whose streams haven't changed since the last sync.
+\t\t\t\033[94m--resume\033[37m Pick up the last sync that never finished, skipping the providers it already staged.
+\t\t\t\033[94m--dry-run [null|jsonl|csv]\033[37m Run the whole pipeline without touching the database, rows go to a null sink (default) or a file.
+\t\t\t\033[94m--output [path]\033[37m Where --dry-run jsonl or csv writes the rows (default: dry_run_<timestamp>.<ext>).
+\t\t\t\033[94m--fixtures [dir]\033[37m With --dry-run, read the providers, filters and payloads from a local directory.
+\t\t\t\033[94m--cluster [name]\033[37m Split the providers with the other nodes running the same cluster, claiming them through the database.
+\t\t\t\033[94m--lease [###]\033[37m Seconds a claimed provider is held before another node can take it over (default: 300).
+\t\t\t\033[94m--engine [thread|async]\033[37m Run providers on a thread each (default), or on the asyncio engine.
+\t\t\t\033[94m--concurrency [###]\033[37m Providers in flight at once with --engine async (default: 64).
+\t\t\t\033[94m--memory-budget [###]\033[37m Hold back new providers while the process RSS is over this many MiB.
+\t\t\t\033[94m--run-timeout [###]\033[37m Seconds before the run stops its providers and finishes with what it has, 0 for none (default: 3600).
+\t\t\t\033[94m--provider-timeout [###]\033[37m Seconds each provider gets, 0 for none (default: 5x its usual runtime, at least 300).
+\t\t\t\033[94m--processes [###]\033[37m Parse, filter and convert in worker processes (default: one per cpu).
+\t\t\t\033[94m--filter-stats\033[37m Profile each filter and write a filter_stats_*.json report (on with --debug).
 \t\033[94mfixup\033[37m: Fix all streams.
 \t\tThis attempts to match channel numbers, logos, and tvg-id's for all streams.
 \t\033[94mteststreams\033[37m: Test all active live and series streams for validity.
 \t\tThis tests each stream URL to verify it contains valid video data.
+\t\t\t\033[94m--reuse-tests\033[37m Reuse a stream's test result from the last 6 hours instead of testing it again.
 \t\t\t\033[94m--fix\033[37m Move invalid streams to the other table.
 \t\t\tThis reads the latest invalid_streams_*.log file and moves those streams.
+\t\033[94mdaemon\033[37m: Keep running, syncing each provider when its refresh period passes.
+\t\tCaches, compiled filters and http sessions stay warm between syncs. Takes the sync options too.
+\t\t\t\033[94m--interval [###]\033[37m Seconds between checks for due providers (default: 60).
+\t\t\t\033[94m--test-interval [###]\033[37m Hours between stream tests, 0 to never test (default: 24).
+\t\033[94m--no-disk-cache\033[37m Keep the caches in memory only, ignoring the on disk cache from earlier runs.
+\t\033[94m--report [file]\033[37m Write a JSON run report for sync and teststreams (default: <action>_report_*.json).
+\t\033[94m--metrics-file [file]\033[37m Write the run metrics in Prometheus text format, for the node_exporter textfile collector.
+\t\033[94m--profile\033[37m Profile sync or teststreams with cProfile: writes profile_<action>_*.pstats and a top functions report.
+\t\033[94m--profile-memory\033[37m Trace allocations with tracemalloc: writes profile_<action>_memory_*.txt with the top sites per provider stage.
+\t\033[94m--debug\033[37m Show debug output for any action.
+\t\t\033[94m--debug-level [trace|debug|info|warn|error]\033[37m Minimum debug level to show, trace adds per-stream output.
+\t\t\033[94m--debug-categories [config,db,sync,request]\033[37m Only show debug output for these categories.
 ''' )
         print( "*" * 76 )
 
@@ -157,6 +220,9 @@ class KP_Common:
             # blue
             _prefix = "\033[94m"
 
+        # make sure any queued debug output lands before this
+        debug_flush( )
+
         # print the output based on the selected message type
         print( "{}{}{}".format( _prefix, _str, _reset ) )
 
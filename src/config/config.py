@@ -16,7 +16,7 @@ def find_config(start_path: Path = Path(__file__)) -> Path:
         from utils.debug import debug_print_config_search
     except ImportError:
         # Fallback if debug utils not available
-        def debug_print_config_search(msg): pass
+        def debug_print_config_search(msg, *args): pass
     
     debug_print_config_search(f"Looking for .kptvconf file...")
     debug_print_config_search(f"__file__ = {__file__}")
@@ -126,6 +126,22 @@ def get_dbschema() -> str:
 def get_db_tblprefix() -> str:
     return load_config()['db_tblprefix']
 
+def get_cache_path() -> Optional[str]:
+    """Get the optional path for the on disk cache"""
+    return load_config().get('cache_path')
+
+def get_delta_path() -> Optional[str]:
+    """Get the optional path for the delta sync snapshots"""
+    return load_config().get('delta_path')
+
+def get_history_path() -> Optional[str]:
+    """Get the optional path for the provider runtime history"""
+    return load_config().get('history_path')
+
+def get_checkpoint_path() -> Optional[str]:
+    """Get the optional path for the sync run checkpoints"""
+    return load_config().get('checkpoint_path')
+
 # For backward compatibility - these will be loaded when first accessed
 # Using module-level __getattr__ (Python 3.7+)
 def __getattr__(name: str):
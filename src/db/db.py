@@ -28,7 +28,7 @@ except:
 try:
     from utils.debug import debug_print_db
 except ImportError:
-    def debug_print_db(msg): pass
+    def debug_print_db(msg, *args): pass
 
 debug_print_db("Using PyMySQL for database connections")
 
@@ -259,9 +259,9 @@ class KP_DB:
     # execute a query with the cursor
     def _execute( self, query: str, params=None, fetch: bool = True, dictionary: bool = True, stream: bool = False ) -> Any:
 
-        debug_print_db(f"Executing query: {query[:100]}{'...' if len(query) > 100 else ''}")
+        debug_print_db("Executing query: %.100s", query)
         if params:
-            debug_print_db(f"Query parameters: {params}")
+            debug_print_db("Query parameters: %s", params)
 
         # if we're streaming results, we need to set the buffered flag to False
         if stream:
@@ -275,7 +275,7 @@ class KP_DB:
 
             # if we're not fetching results, return None
             if not fetch:
-                debug_print_db(f"Query executed, {cursor.rowcount} rows affected")
+                debug_print_db("Query executed, %s rows affected", cursor.rowcount)
                 return None
             
             # if we're streaming results, return an iterator
@@ -285,7 +285,7 @@ class KP_DB:
             
             # otherwise, fetch the results and return them
             results = cursor.fetchall( )
-            debug_print_db(f"Query returned {len(results) if results else 0} rows")
+            debug_print_db("Query returned %d rows", len(results) if results else 0)
             return results
 
     # stream results from the cursor
@@ -301,7 +301,7 @@ class KP_DB:
             if not rows:
                 break
 
-            debug_print_db(f"Streaming {len(rows)} rows")
+            debug_print_db("Streaming %d rows", len(rows))
             # yield the rows
             yield from rows
 
@@ -312,7 +312,7 @@ class KP_DB:
         if not where:
             return "", []
         
-        debug_print_db(f"Building WHERE clause with {len(where)} conditions")
+        debug_print_db("Building WHERE clause with %d conditions", len(where))
         
         # setup the where clause and parameters
         where_parts = []
@@ -356,7 +356,7 @@ class KP_DB:
         
         # join the where parts and return the where clause and parameters
         where_clause = " WHERE " + " ".join( where_parts )
-        debug_print_db(f"Built WHERE clause: {where_clause}")
+        debug_print_db("Built WHERE clause: %s", where_clause)
         return where_clause, where_params
 
     # build the SELECT query with all options
@@ -443,7 +443,7 @@ class KP_DB:
                 debug_print_db(f"Adding OFFSET: {offset}")
                 query += f" OFFSET {offset}"
 
-        debug_print_db(f"Built query: {query}")
+        debug_print_db("Built query: %s", query)
         # return the query and parameters
         return query, params
 
@@ -580,7 +580,7 @@ class KP_DB:
                 # break the loop
                 break
 
-            debug_print_db(f"Yielding chunk with {len(results)} records (offset: {offset})")
+            debug_print_db("Yielding chunk with %d records (offset: %d)", len(results), offset)
             # yield the results
             yield results
 
@@ -671,7 +671,7 @@ class KP_DB:
 
                             # ignore duplicates
                             if ignore_duplicates and ("Duplicate entry" in str(e) or "1062" in str(e)):
-                                debug_print_db(f"Ignoring duplicate key error for row")
+                                debug_print_db("Ignoring duplicate key error for row")
                                 continue
                             raise
 
@@ -691,7 +691,7 @@ class KP_DB:
 
                         # setup a batch to run
                         batch = values[i:i + batch_size]
-                        debug_print_db(f"Processing batch {i//batch_size + 1}: {len(batch)} records")
+                        debug_print_db("Processing batch %d: %d records", i//batch_size + 1, len(batch))
 
                         # try to execute
                         try:
@@ -798,7 +798,7 @@ class KP_DB:
         
         debug_print_db(f"Calling stored procedure: {procedure_name}")
         if args:
-            debug_print_db(f"Procedure arguments: {args}")
+            debug_print_db("Procedure arguments: %s", args)
         
         # with our cursor
         with self._get_cursor( dictionary=True ) as cursor:
@@ -834,7 +834,7 @@ class KP_DB:
     # execute a raw query
     def execute_raw( self, query: str, params=None, fetch: bool = False, dictionary: bool = True ):
         
-        debug_print_db(f"Executing raw query: {query[:100]}{'...' if len(query) > 100 else ''}")
+        debug_print_db("Executing raw query: %.100s", query)
         
         # with the cursor
         with self._get_cursor( dictionary=dictionary ) as cursor:
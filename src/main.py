@@ -1,109 +1,147 @@
 #!/usr/bin/env python3
 
 # import common imports
-import sys, time
+import sys
+import multiprocessing
 
 # Import debug utilities
 try:
     from utils.debug import debug_print, set_debug
 except ImportError:
-    def debug_print(msg): pass
-    def set_debug(enabled): pass
+    def debug_print(*args): pass
+    def set_debug(enabled, *args): pass
 
 from common.common import KP_Common
 from db.db import KP_DB
+from utils.cancel import KP_Cancel_Token
 # import the sync class
 from sync.sync import KP_Sync
 
-# fire up the common class
-common = KP_Common( )
+# run the app
+def main( ):
 
-# Initialize debug mode based on args
-if hasattr(common.args, 'debug'):
-    set_debug(common.args.debug)
+    # fire up the common class
+    common = KP_Common( )
 
-debug_print("Starting application")
-debug_print(f"Action: {common.actions}")
+    # Initialize debug mode based on args
+    if hasattr(common.args, 'debug'):
+        set_debug(common.args.debug)
 
-sync = KP_Sync( )
+    debug_print("Starting application")
+    debug_print(f"Action: {common.actions}")
 
-# wrap all the actions in a try block
-try:
+    sync = KP_Sync( )
+
+    # profile the sync and test actions, if asked
+    profiler = None
+    if common.actions in ( "sync", "teststreams" ) and ( common.args.profile or common.args.profile_memory ):
+        from utils.profiling import KP_Profiler
+        profiler = KP_Profiler( cpu=common.args.profile, memory=common.args.profile_memory, prefix=f"profile_{common.actions}" )
+        profiler.start( )
+
+    # wrap all the actions in a try block
+    try:
+
+        # use the new match statement to handle the actions
+        match common.actions:
+
+            # sync the streams
+            case "sync":
+
+                debug_print("Starting sync operation")
+
+                # NO PRINT STATEMENTS HERE - only the sync summary should show
+
+                # run the sync
+                sync.sync( )
+                del sync
+
+                debug_print("Sync operation completed")
+                sys.exit( )
+
+            # fixup the streams
+            case "fixup":
+
+                debug_print("Starting fixup operation")
+
+                # NO PRINT STATEMENTS HERE - only essential output should show
+
+                # the fixup method
+                sync.fixup( )
+                del sync
+
+                debug_print("Fixup operation completed")
+                sys.exit( )
+
+            # test the streams
+            case "teststreams":
+
+                debug_print("Starting stream testing operation")
+
+                # now fix the streams if we have the flah added
+                fix_mode = hasattr(common.args, 'fix') and common.args.fix
+                if fix_mode:
+                    sync.fix_from_log( )
+
+                else:
+                    # test the streams
+                    sync.test_streams( )
+
+                # clean up
+                del sync
+
+                debug_print("Stream testing operation completed")
+                sys.exit( )
+
+            # keep running, syncing providers as they come due
+            case "daemon":
+
+                debug_print("Starting daemon")
+
+                # run it until we're stopped
+                from sync.daemon import KP_Daemon
+                KP_Daemon( sync, interval=common.args.interval, test_interval=common.args.test_interval * 3600 ).run( )
+                del sync
+
+                debug_print("Daemon stopped")
+                sys.exit( )
+
+
+            # if we don't have a match, show the help
+            case _:
+
+                # This should still show - it's user-facing help
+                common.kp_print_line( )
+                common.kp_print( "error", "You must pass at least 1 argument." )
+                common.custom_help( )
+                sys.exit( )
+
+    # catch the keyboard interrupt
+    except KeyboardInterrupt:
+
+        # stop whatever's still running at its next check, show a message then exit - this should still be visible
+        KP_Cancel_Token.cancel_all( "interrupted" )
+        print()
+        common.kp_print_line( )
+        common.kp_print( "info", "Exitting the app, please hold." )
+        common.kp_print_line( )
+        sys.exit( 130 )
+
+    except Exception as e:
+        # Error messages should still be visible
+        debug_print(f"Unexpected error: {e}")
+        common.kp_print( "error", f"An unexpected error occurred: {str(e)}" )
+        sys.exit( 1 )
+
+    # and finally, write the profiles
+    finally:
+        if profiler is not None:
+            for _file in profiler.stop( ):
+                common.kp_print( "info", f"Profile written to: {_file}" )
+
+# only when we're run, the --processes workers import this module too
+if __name__ == "__main__":
 
-    # use the new match statement to handle the actions
-    match common.actions:
-
-        # sync the streams
-        case "sync":
-
-            debug_print("Starting sync operation")
-            
-            # NO PRINT STATEMENTS HERE - only the sync summary should show
-            
-            # run the sync
-            sync.sync( )
-            del sync
-
-            debug_print("Sync operation completed")
-            sys.exit( )
-
-        # fixup the streams
-        case "fixup":
-
-            debug_print("Starting fixup operation")
-            
-            # NO PRINT STATEMENTS HERE - only essential output should show
-            
-            # the fixup method
-            sync.fixup( )
-            del sync
-
-            debug_print("Fixup operation completed")
-            sys.exit( )
-
-        # test the streams
-        case "teststreams":
-
-            debug_print("Starting stream testing operation")
-            
-            # now fix the streams if we have the flah added
-            fix_mode = hasattr(common.args, 'fix') and common.args.fix
-            if fix_mode:
-                sync.fix_from_log( )
-
-            else:
-                # test the streams
-                sync.test_streams( )
-
-            # clean up
-            del sync
-
-            debug_print("Stream testing operation completed")
-            sys.exit( )
-
-
-        # if we don't have a match, show the help
-        case _:
-
-            # This should still show - it's user-facing help
-            common.kp_print_line( )
-            common.kp_print( "error", "You must pass at least 1 argument." )
-            common.custom_help( )
-            sys.exit( )
-
-# catch the keyboard interrupt
-except KeyboardInterrupt:
-
-    # show a message then exit - this should still be visible
-    print()
-    common.kp_print_line( )
-    common.kp_print( "info", "Exitting the app, please hold." )
-    common.kp_print_line( )
-    time.sleep( 5 )
-    sys.exit( )
-    
-except Exception as e:
-    # Error messages should still be visible
-    debug_print(f"Unexpected error: {e}")
-    common.kp_print( "error", f"An unexpected error occurred: {str(e)}" )
-    sys.exit( 1 )
\ No newline at end of file
+    # the compiled binary starts its worker processes through here
+    multiprocessing.freeze_support( )
+    main( )
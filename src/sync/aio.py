@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import asyncio
+import os
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+# our cooperative cancellation
+from utils.cancel import KP_Cancelled
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# our asyncio provider sync engine
+class KP_Async_Engine:
+
+    # fire us up
+    def __init__( self, sync, concurrency: int = 64, per_host: int = 2, cpu_workers: Optional[int] = None ):
+
+        # setup the internal variables
+        self.sync = sync
+        self.concurrency = max( 1, int( concurrency ) )
+        self.per_host = max( 1, int( per_host ) )
+        self.cpu_workers = cpu_workers or os.cpu_count( ) or 1
+
+        # the executors and semaphores only exist while we're running
+        self._loop = None
+        self._io = None
+        self._cpu = None
+        self._db = None
+        self._limit = None
+        self._hosts = None
+
+    # run the providers, calling on_result with each result as it completes
+    def run( self, providers: List[Dict[str, Any]], on_result: Optional[Callable] = None ) -> list:
+        return asyncio.run( self._run( providers, on_result ) )
+
+    # run them all
+    async def _run( self, providers: List[Dict[str, Any]], on_result: Optional[Callable] ) -> list:
+
+        # the downloads block in requests, so they wait on a wide pool of io threads
+        self._loop = asyncio.get_running_loop( )
+        self._io = ThreadPoolExecutor( max_workers=self.concurrency, thread_name_prefix="kptv-io" )
+
+        # parsing gets a pool the size of the cpu, unless the stage pool takes it
+        self._cpu = ThreadPoolExecutor( max_workers=self.cpu_workers, thread_name_prefix="kptv-cpu" )
+
+        # and the database gets one thread, so writes are serialized like the threaded engine does
+        self._db = ThreadPoolExecutor( max_workers=1, thread_name_prefix="kptv-db" )
+
+        # limit how many providers are in flight, and how many requests hit one host at once
+        self._limit = asyncio.Semaphore( self.concurrency )
+        self._hosts = defaultdict( lambda: asyncio.Semaphore( self.per_host ) )
+
+        debug_print_sync(f"Async engine starting {len(providers)} providers: {self.concurrency} in flight, {self.per_host} per host")
+
+        # hold the results, and the runs cancel token
+        results = []
+        _cancel = self.sync._cancel
+
+        # hand over a result
+        def _deliver( res ):
+            results.append( res )
+            if on_result is not None:
+                on_result( res )
+
+        # try to run them
+        try:
+
+            # schedule every provider, and handle them as they finish until the run deadline
+            tasks = { asyncio.ensure_future( self._provider( prov ) ): prov for prov in providers }
+            _pending = set( tasks )
+            try:
+                while _pending:
+                    _remaining = _cancel.remaining( )
+                    _done, _pending = await asyncio.wait( _pending, timeout=max( 0.0, _remaining ) if _remaining is not None else None, return_when=asyncio.FIRST_COMPLETED )
+                    for task in _done:
+                        _deliver( task.result( ) )
+                    if not _done:
+                        _cancel.cancel( f"run deadline of {_cancel.timeout:g}s passed", True )
+                        self.sync.common.kp_print( "warn", f"The run deadline of {_cancel.timeout:g}s passed, stopping the {len( _pending )} providers still running" )
+                        break
+
+            # on an interrupt the runner cancels us, we stop the providers instead so the final operations still run
+            except asyncio.CancelledError:
+                _uncancel = getattr( asyncio.current_task( ), 'uncancel', None )
+                if _uncancel is not None:
+                    _uncancel( )
+                _cancel.cancel( "interrupted" )
+                self.sync.common.kp_print( "warn", f"Interrupted, stopping the {len( _pending )} providers still running (Ctrl-C again to quit now)" )
+
+            # the running providers stop at their next check, give them a little while to get there
+            if _pending:
+                _done, _pending = await asyncio.wait( _pending, timeout=30.0 )
+                for task in _done:
+                    _deliver( task.result( ) )
+
+            # whatever's left is stuck somewhere we can't check, it's reported as stopped
+            if _pending:
+                _reason, _timed_out = _cancel.state( )
+                for task in _pending:
+                    task.cancel( )
+                    _deliver( self.sync._cancelled_result( tasks[task], _reason, _timed_out ) )
+
+        # and finally, clean up the executors
+        finally:
+            self._io.shutdown( wait=False )
+            self._cpu.shutdown( wait=False )
+            self._db.shutdown( wait=True )
+
+        debug_print_sync("Async engine completed")
+
+        # return the results
+        return results
+
+    # run a blocking call on the database thread
+    async def _db_call( self, func: Callable, *args ) -> Any:
+        return await self._loop.run_in_executor( self._db, func, *args )
+
+    # run a blocking call on a cpu thread
+    async def _cpu_call( self, func: Callable, *args ) -> Any:
+        return await self._loop.run_in_executor( self._cpu, func, *args )
+
+    # await something, adding how long it took to a stage
+    @staticmethod
+    async def _timed( timer, stage: str, awaitable ) -> Any:
+        _start = time.perf_counter( )
+        try:
+            return await awaitable
+        finally:
+            timer.add( stage, time.perf_counter( ) - _start )
+
+    # await something, but not past the tokens deadline
+    @staticmethod
+    async def _until( token, awaitable ) -> Any:
+
+        # not at all once it's cancelled
+        token.check( )
+
+        # the request timeouts cap most waits, this catches the rest
+        try:
+            return await asyncio.wait_for( awaitable, token.remaining( ) )
+        except asyncio.TimeoutError:
+            token.check( )
+            raise
+
+    # get the host a provider is served from
+    @staticmethod
+    def _host( provider: Dict[str, Any] ) -> str:
+        return urllib.parse.urlsplit( provider.get( 'sp_domain' ) or '' ).hostname or ''
+
+    # fetch a providers payloads, one request at a time per provider and per_host at a time per host
+    async def _payloads( self, _get, provider: Dict[str, Any] ):
+
+        # setup the payload iterator and the hosts semaphore
+        _payloads = _get.iter_payloads( provider )
+        _host = self._hosts[self._host( provider )]
+
+        # pull each payload on an io thread, giving up on it at the providers deadline
+        while True:
+            async with _host:
+                item = await self._timed( _get.timings, 'fetch', self._until( _get.cancel, self._loop.run_in_executor( self._io, next, _payloads, None ) ) )
+            if item is None:
+                return
+            yield item
+
+    # process a single provider: returns ( total, filtered, name, error, timings, counts ) like KP_Sync._process_provider
+    async def _provider( self, _prov: Dict[str, Any] ) -> tuple:
+
+        # only so many at once
+        async with self._limit:
+
+            debug_print_sync(f"Processing provider: {_prov['sp_name']}")
+
+            # hold off while we're over the memory budget, then start it like the threads do
+            await self.sync._memory.wait_for_budget_async( _prov['sp_name'], self.sync._cancel )
+            _timer, _counts, _mem_token, _probe, _token = self.sync._start_provider( _prov )
+
+            # try to process
+            try:
+
+                # the run may have been cancelled while we waited
+                _token.check( )
+
+                # grab the users filters, normally already preloaded
+                _filters = await self._db_call( self.sync._data._get_filters, _prov["u_id"] )
+                if _filters is None:
+                    return ( 0, 0, _prov['sp_name'], "No filters found", _timer.timings, _counts )
+
+                # setup the retriever on an io thread, it parses the arguments
+                from sync.get import KP_Get
+                _get = await self._loop.run_in_executor( self._io, KP_Get )
+                _get.timings = _timer
+                _get.cancel = _token
+
+                # in process mode, the worker processes parse, filter and convert
+                _pool = self.sync._stage_pool
+                if _pool is not None:
+
+                    # queue each payloads chunks as it arrives
+                    _futures = []
+                    async for stream_type, payload in self._payloads( _get, _prov ):
+                        _futures.extend( _pool.submit( stream_type, payload, _prov, _filters, self.sync._profile_filters ) )
+
+                    # merge them in order, the workers time their own parsing
+                    try:
+                        _results = [await self._until( _token, asyncio.wrap_future( _future ) ) for _future in _futures]
+                    except BaseException:
+                        for _future in _futures:
+                            _future.cancel( )
+                        raise
+                    _rows, _total, _stats, _elapsed = _pool.merge( _results )
+                    _timer.add( 'parse', _elapsed )
+                    for _chunk_stats in _stats:
+                        self.sync._filter_stats.merge_stats( _chunk_stats )
+                        _get.split_filter_time( _chunk_stats )
+                    _probe.mark( 'fetch+parse' )
+
+                    # expand the rows
+                    _converted_streams = await self._timed( _timer, 'convert', self._cpu_call( self.sync._convert_rows, _rows, _prov ) )
+
+                # otherwise they run on the cpu threads
+                else:
+
+                    # compile the filters once
+                    _compiled = self.sync._get_compiled_filters( _prov["u_id"], _filters )
+
+                    # normalize and filter each payload as it arrives
+                    combined = {}
+                    dropped = set( )
+                    async for stream_type, payload in self._payloads( _get, _prov ):
+                        _token.check( )
+                        try:
+                            batch_dropped = set( )
+                            data = await self._timed( _timer, 'parse', self._cpu_call( _get._normalize_data, payload, stream_type, _prov, _compiled, batch_dropped ) )
+                            _get._merge_streams( combined, data, batch_dropped, dropped )
+                        except Exception as e:
+                            debug_print_sync(f"Failed to process {stream_type} streams for {_prov['sp_name']}: {e}")
+                    _total = len( combined ) + len( dropped )
+
+                    # add this providers filter stats to the run, and its filter time
+                    self.sync._filter_stats.merge( _compiled )
+                    _get.split_filter_time( _compiled.stats )
+                    _probe.mark( 'fetch+parse' )
+
+                    # now convert them to our common format
+                    _token.check( )
+                    _converted_streams = await self._timed( _timer, 'convert', self._cpu_call( self.sync._convert_streams, combined, _prov ) )
+
+                debug_print_sync(f"Retrieved {_total} streams, filtered to {len(_converted_streams)} streams for {_prov['sp_name']}")
+                _counts['bytes_fetched'] = _get.bytes_fetched
+                _probe.mark( 'convert' )
+                _token.check( )
+
+                # with --delta nothing if nothing changed, written through the database thread
+                if _converted_streams:
+                    _staged, _fingerprints = await self._cpu_call( self.sync._delta_streams, _prov, _converted_streams, _timer, _probe )
+                    await self._db_call( self.sync._write_streams, _prov, _staged, _fingerprints, _timer, _counts, _token, _probe )
+
+                # remember how long it took, and how big it was
+                return self.sync._finish_provider( _prov, _total, len( _converted_streams ), _timer, _counts )
+
+            # out of time, or the run was cancelled: it stops where it was, with nothing staged
+            except KP_Cancelled as e:
+                debug_print_sync(f"Provider {_prov['sp_name']} stopped: {e.reason}")
+                return self.sync._cancelled_result( _prov, e.reason, e.timed_out, _timer.timings, _counts )
+
+            # whoops...
+            except Exception as e:
+                debug_print_sync(f"Provider {_prov['sp_name']} processing failed: {e}")
+                return ( 0, 0, _prov['sp_name'], str( e ), _timer.timings, _counts )
+
+            # and finally, add its memory peaks to the counts we returned, and keep its memory report
+            finally:
+                self.sync._end_provider( _counts, _mem_token, _probe )
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# our local record of each sync run, and the providers it staged
+class KP_Checkpoint_Store:
+
+    # where it lives, unless the config says otherwise
+    DEFAULT_PATH = os.path.join( '~', '.cache', 'kptv', 'checkpoints.sqlite3' )
+
+    # how many closed runs we keep around
+    KEEP_RUNS = 100
+
+    # open the store
+    def __init__( self, path: Optional[str] = None, timeout: float = 10.0 ):
+
+        # setup the internal variables
+        self.path = os.path.abspath( os.path.expanduser( path or self.DEFAULT_PATH ) )
+        self.timeout = timeout
+        self._local = threading.local( )
+
+        # make sure the directory and tables are there
+        os.makedirs( os.path.dirname( self.path ), exist_ok=True )
+        _cnx = self._connection( )
+        _cnx.execute( "CREATE TABLE IF NOT EXISTS sync_runs ( run_id TEXT PRIMARY KEY, status TEXT NOT NULL, started REAL NOT NULL, finished REAL NULL )" )
+        _cnx.execute( "CREATE TABLE IF NOT EXISTS sync_checkpoints ( run_id TEXT NOT NULL, p_id INTEGER NOT NULL, rows INTEGER NOT NULL, finished REAL NOT NULL, PRIMARY KEY ( run_id, p_id ) )" )
+
+    # get the store using the configured path
+    @classmethod
+    def from_config( cls ) -> 'KP_Checkpoint_Store':
+
+        # try to read the path, the default is fine if we can't
+        try:
+            from config.config import get_checkpoint_path
+            _path = get_checkpoint_path( )
+        except Exception:
+            _path = None
+        return cls( _path )
+
+    # get this threads connection
+    def _connection( self ) -> sqlite3.Connection:
+
+        # if we already have one, return it
+        _cnx = getattr( self._local, 'cnx', None )
+        if _cnx is not None:
+            return _cnx
+
+        # open it in WAL mode, fully synced: a checkpoint is only worth something if it outlives the crash
+        _cnx = sqlite3.connect( self.path, timeout=self.timeout )
+        _cnx.execute( "PRAGMA journal_mode=WAL" )
+        _cnx.execute( "PRAGMA synchronous=FULL" )
+        self._local.cnx = _cnx
+        return _cnx
+
+    # the latest run that never finished, None if there isn't one
+    def open_run( self ) -> Optional[str]:
+        _row = self._connection( ).execute( "SELECT run_id FROM sync_runs WHERE status = 'open' ORDER BY started DESC LIMIT 1" ).fetchone( )
+        return _row[0] if _row else None
+
+    # start a run
+    def start( self, run_id: str ) -> None:
+        with self._connection( ) as _cnx:
+            _cnx.execute( "INSERT INTO sync_runs ( run_id, status, started ) VALUES ( ?, 'open', ? )", ( run_id, time.time( ) ) )
+
+    # close runs, dropping their checkpoints: the given one, or every open one
+    def close( self, status: str, run_id: Optional[str] = None ) -> None:
+        with self._connection( ) as _cnx:
+            _ids = [run_id] if run_id else [row[0] for row in _cnx.execute( "SELECT run_id FROM sync_runs WHERE status = 'open'" )]
+            for _id in _ids:
+                _cnx.execute( "UPDATE sync_runs SET status = ?, finished = ? WHERE run_id = ?", ( status, time.time( ), _id ) )
+                _cnx.execute( "DELETE FROM sync_checkpoints WHERE run_id = ?", ( _id, ) )
+
+            # and only keep so many
+            _cnx.execute( "DELETE FROM sync_runs WHERE status != 'open' AND run_id NOT IN ( SELECT run_id FROM sync_runs ORDER BY started DESC LIMIT ? )", ( self.KEEP_RUNS, ) )
+
+    # a runs checkpoints: p_id -> rows staged
+    def load( self, run_id: str ) -> Dict[int, int]:
+        return { p_id: rows for p_id, rows in self._connection( ).execute( "SELECT p_id, rows FROM sync_checkpoints WHERE run_id = ?", ( run_id, ) ) }
+
+    # record a provider as staged
+    def save( self, run_id: str, p_id: int, rows: int ) -> None:
+        with self._connection( ) as _cnx:
+            _cnx.execute( "INSERT OR REPLACE INTO sync_checkpoints ( run_id, p_id, rows, finished ) VALUES ( ?, ?, ?, ? )", ( run_id, p_id, rows, time.time( ) ) )
+
+# our per run checkpoints: each provider is checkpointed once its rows are committed to the temp table,
+# and a resumed run skips those still staged there
+class KP_Checkpoints:
+
+    # fire us up
+    def __init__( self, store: Optional[KP_Checkpoint_Store] = None ):
+
+        # setup the internal variables
+        self.store = store
+        self.run_id = None
+        self.resumed = False
+        self.staged: Dict[int, int] = {}
+
+    # get the checkpoints using the configured store, without one nothing is recorded
+    @classmethod
+    def from_config( cls ) -> 'KP_Checkpoints':
+
+        # try to open the store
+        try:
+            return cls( KP_Checkpoint_Store.from_config( ) )
+        except Exception as e:
+            debug_print_sync(f"Sync checkpoints unavailable: {e}")
+            return cls( )
+
+    # the run a --resume would pick up, None if there isn't one
+    def pending( self ) -> Optional[str]:
+        try:
+            return self.store.open_run( ) if self.store is not None else None
+        except Exception as e:
+            debug_print_sync(f"Failed to read the sync checkpoints: {e}")
+            return None
+
+    # start this run: resuming the last unfinished one if asked, otherwise a fresh one that leaves the old ones behind
+    def start( self, resume: bool = False ) -> Optional[str]:
+
+        # nowhere to keep them
+        if self.store is None:
+            return None
+
+        # try to pick up where the last run stopped
+        try:
+            _open = self.store.open_run( ) if resume else None
+            if _open is not None:
+                self.run_id, self.resumed = _open, True
+                self.staged = self.store.load( _open )
+                debug_print_sync(f"Resuming sync run {_open}: {len(self.staged)} providers were already staged")
+
+            # or start over, the old runs' rows get staged again
+            else:
+                self.store.close( 'abandoned' )
+                self.run_id = f"{time.strftime( '%Y%m%d%H%M%S' )}-{os.getpid( )}"
+                self.store.start( self.run_id )
+                debug_print_sync(f"Started sync run {self.run_id}")
+
+        # without them we just don't checkpoint
+        except Exception as e:
+            debug_print_sync(f"Failed to start the sync checkpoints: {e}")
+            self.run_id = None
+
+        # return the run
+        return self.run_id
+
+    # split the providers into those to run and those a resumed run already staged.
+    # staged holds each providers rows still in the temp table, a checkpointed provider whose rows are gone is run again.
+    # only providers that fetched streams are checkpointed, so 0 rows means --delta found nothing to stage, not a failed fetch
+    def skip( self, providers: List[Dict[str, Any]], staged: Dict[int, int] ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+
+        # setup the lists
+        _run, _skipped = [], []
+        for prov in providers:
+            _rows = self.staged.get( prov['id'] )
+            if _rows is not None and ( _rows == 0 or staged.get( prov['id'], 0 ) > 0 ):
+                _skipped.append( prov )
+            else:
+                if _rows:
+                    debug_print_sync(f"Provider {prov['sp_name']} was checkpointed with {_rows} rows, but none are staged now, running it again")
+                _run.append( prov )
+
+        # return them
+        return _run, _skipped
+
+    # checkpoint a provider that fetched streams, once its rows are committed
+    def record( self, p_id: int, rows: int ) -> None:
+
+        # not while we're not checkpointing
+        if self.run_id is None:
+            return
+
+        # a failed checkpoint only means a resume redoes it
+        try:
+            self.store.save( self.run_id, p_id, rows )
+        except Exception as e:
+            debug_print_sync(f"Failed to checkpoint provider {p_id}: {e}")
+
+    # the final operations ran, so the staged rows are synced and the run is done
+    def finish( self ) -> None:
+
+        # not while we're not checkpointing
+        if self.run_id is None:
+            return
+
+        # close it
+        try:
+            self.store.close( 'finished', self.run_id )
+        except Exception as e:
+            debug_print_sync(f"Failed to close sync run {self.run_id}: {e}")
+
+        debug_print_sync(f"Sync run {self.run_id} finished")
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import time
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+# import the database class
+from db.db import KP_DB
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# how many times a provider is handed out before we give up on it, a provider that keeps taking nodes down stops here
+MAX_ATTEMPTS = 3
+
+# our multi node work claiming: every node joins the clusters open round, claims providers off it one at a time,
+# and whoever finds the round finished runs the final operations, once
+class KP_Cluster:
+
+    # fire us up
+    def __init__( self, name: str = "default", lease: float = 300.0, node: Optional[str] = None ):
+
+        # setup the internal variables
+        self.name = name
+        self.lease = max( 10, int( lease ) )
+        self.node = node or f"{socket.gethostname( )}:{os.getpid( )}"
+        self.poll = min( 5.0, self.lease / 4 )
+        self.round_id = None
+        self.created = False
+        self.claimed = 0
+        self.ran_final = False
+
+        # GET_LOCK names are server wide and at most 64 characters
+        self._lock_name = f"kptv_sync:{name}"[:64]
+
+        # our live claims: p_id -> token
+        self._claims: Dict[int, str] = {}
+        self._claims_lock = threading.Lock( )
+        self._stop = threading.Event( )
+        self._heartbeat = None
+
+        # the tables, with the configured prefix
+        self._db = KP_DB( )
+        _prefix = self._db.table_prefix or ""
+        self._rounds = f"{_prefix}sync_rounds"
+        self._claims_table = f"{_prefix}sync_claims"
+
+    # make sure our tables are there
+    def setup( self ) -> None:
+        self._db.execute_raw( f"CREATE TABLE IF NOT EXISTS {self._rounds} ( id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY, cluster VARCHAR(64) NOT NULL, status VARCHAR(16) NOT NULL, node VARCHAR(128) NOT NULL, started DATETIME NOT NULL, finished DATETIME NULL, final_node VARCHAR(128) NULL, KEY cluster_status ( cluster, status ) ) ENGINE=InnoDB" )
+        self._db.execute_raw( f"CREATE TABLE IF NOT EXISTS {self._claims_table} ( round_id BIGINT NOT NULL, p_id INT NOT NULL, predicted DOUBLE NOT NULL DEFAULT 0, status VARCHAR(16) NOT NULL, node VARCHAR(128) NULL, token CHAR(32) NULL, lease_until DATETIME NULL, attempts INT NOT NULL DEFAULT 0, finished DATETIME NULL, PRIMARY KEY ( round_id, p_id ), KEY round_status ( round_id, status ) ) ENGINE=InnoDB" )
+
+    # hold the clusters advisory lock on its own session: yields a cursor on that session
+    @contextmanager
+    def _locked( self, timeout: int = 60 ):
+
+        # GET_LOCK belongs to the session, so it gets its own connection for as long as we hold it
+        _cnx = self._db._get_connection( )
+        _cnx.autocommit( True )
+        _cursor = _cnx.cursor( )
+        try:
+
+            # take it, a negative timeout waits for as long as it takes
+            _cursor.execute( "SELECT GET_LOCK( %s, %s )", ( self._lock_name, timeout ) )
+            if ( _cursor.fetchone( ) or ( 0, ) )[0] != 1:
+                raise TimeoutError( f"Timed out waiting for the cluster lock {self._lock_name}" )
+
+            # hand it over, and let it go after
+            try:
+                yield _cursor
+            finally:
+                _cursor.execute( "SELECT RELEASE_LOCK( %s )", ( self._lock_name, ) )
+
+        # and finally, close the session, which drops the lock if we couldn't
+        finally:
+            _cursor.close( )
+            _cnx.close( )
+
+    # join the clusters open round, opening one with our providers if there isn't one: returns the round id
+    def join( self, providers: List[Dict[str, Any]], predicted: Optional[Dict[int, float]] = None ) -> int:
+
+        # under the lock, so only one node opens a round
+        with self._locked( ) as cursor:
+
+            # the open round, and whether it's gone quiet: nothing leased or finished for a whole lease
+            cursor.execute( f"SELECT r.id, ( r.started < NOW( ) - INTERVAL %s SECOND AND COALESCE( ( SELECT MAX( c.lease_until ) FROM {self._claims_table} c WHERE c.round_id = r.id ), r.started ) < NOW( ) - INTERVAL %s SECOND ) FROM {self._rounds} r WHERE r.cluster = %s AND r.status = 'open' ORDER BY r.id DESC LIMIT 1", ( self.lease, self.lease, self.name ) )
+            _open = cursor.fetchone( )
+
+            # a round every node walked away from is abandoned, we start over
+            if _open is not None and _open[1]:
+                debug_print_sync(f"Cluster {self.name}: round {_open[0]} went quiet, abandoning it")
+                cursor.execute( f"UPDATE {self._rounds} SET status = 'abandoned', finished = NOW( ) WHERE id = %s", ( _open[0], ) )
+                _open = None
+
+            # join it
+            if _open is not None:
+                self.round_id, self.created = _open[0], False
+
+            # or open one with our providers, longest first
+            else:
+                cursor.execute( f"INSERT INTO {self._rounds} ( cluster, status, node, started ) VALUES ( %s, 'open', %s, NOW( ) )", ( self.name, self.node ) )
+                self.round_id, self.created = cursor.lastrowid, True
+                if providers:
+                    cursor.executemany( f"INSERT INTO {self._claims_table} ( round_id, p_id, predicted, status ) VALUES ( %s, %s, %s, 'pending' )",
+                        [( self.round_id, prov['id'], ( predicted or {} ).get( prov['id'], 0.0 ) ) for prov in providers] )
+
+        debug_print_sync(f"Cluster {self.name}: node {self.node} {'opened' if self.created else 'joined'} round {self.round_id}")
+
+        # keep our leases alive while we work
+        self._stop.clear( )
+        self._heartbeat = threading.Thread( target=self._renew, name="kptv-cluster", daemon=True )
+        self._heartbeat.start( )
+
+        # return the round
+        return self.round_id
+
+    # run a database call, retrying the transient errors, like deadlocks between nodes: raises the last one if they all fail
+    def _retry( self, what: str, call: Callable[[], Any], tries: int = 3 ) -> Any:
+        for _try in range( tries ):
+            try:
+                return call( )
+            except RuntimeError as e:
+                if _try == tries - 1:
+                    raise
+                debug_print_sync(f"Cluster {self.name}: {what} failed, retrying: {e}")
+                time.sleep( 0.1 * ( _try + 1 ) )
+
+    # claim the next provider, longest first: returns its id, or None if there's nothing to claim right now
+    def claim( self ) -> Optional[int]:
+
+        # a fresh token, so we know which row is ours
+        _token = uuid.uuid4( ).hex
+
+        # a pending one, or one whose node stopped renewing its lease
+        _claimed = self._retry( "claim", lambda: self._db.execute_raw( f"UPDATE {self._claims_table} SET status = 'claimed', node = %s, token = %s, lease_until = NOW( ) + INTERVAL %s SECOND, attempts = attempts + 1 WHERE round_id = %s AND ( status = 'pending' OR ( status = 'claimed' AND lease_until < NOW( ) AND attempts < %s ) ) ORDER BY predicted DESC, p_id LIMIT 1",
+            ( self.node, _token, self.lease, self.round_id, MAX_ATTEMPTS ) ) )
+
+        # nothing left
+        if not _claimed:
+            return None
+
+        # which one did we get: if we can't tell, its lease runs out and it's claimed again
+        _row = self._retry( "claim lookup", lambda: self._db.execute_raw( f"SELECT p_id FROM {self._claims_table} WHERE round_id = %s AND token = %s", ( self.round_id, _token ), fetch=True ) )
+        if not _row:
+            return None
+
+        # hold on to it
+        _p_id = _row[0]['p_id']
+        with self._claims_lock:
+            self._claims[_p_id] = _token
+            self.claimed += 1
+
+        debug_print_sync(f"Cluster {self.name}: node {self.node} claimed provider {_p_id}")
+
+        # return it
+        return _p_id
+
+    # mark a claimed provider finished, ok None hands it back unfinished for the next claim
+    def finish( self, p_id: int, ok: Optional[bool] = True ) -> None:
+
+        # let go of it
+        with self._claims_lock:
+            _token = self._claims.pop( p_id, None )
+        if _token is None:
+            return
+
+        # mark it, only if it's still ours. if we can't, we've stopped renewing it, so its lease runs out and it's claimed again
+        try:
+            if ok is None:
+                _updated = self._retry( "hand back", lambda: self._db.execute_raw( f"UPDATE {self._claims_table} SET status = 'pending', node = NULL, token = NULL, lease_until = NULL WHERE round_id = %s AND p_id = %s AND token = %s", ( self.round_id, p_id, _token ) ) )
+            else:
+                _updated = self._retry( "finish", lambda: self._db.execute_raw( f"UPDATE {self._claims_table} SET status = %s, finished = NOW( ), lease_until = NOW( ) WHERE round_id = %s AND p_id = %s AND token = %s", ( 'done' if ok else 'failed', self.round_id, p_id, _token ) ) )
+        except RuntimeError as e:
+            debug_print_sync(f"Cluster {self.name}: failed to mark provider {p_id}, leaving it to its lease: {e}")
+            return
+        if not _updated:
+            debug_print_sync(f"Cluster {self.name}: lost the lease on provider {p_id} before it finished, another node took it over")
+
+    # how much of the round is left: ( claimable, in flight )
+    def remaining( self ) -> Tuple[int, int]:
+        _row = self._retry( "progress check", lambda: self._db.execute_raw( f"SELECT COALESCE( SUM( status = 'pending' OR ( status = 'claimed' AND lease_until < NOW( ) AND attempts < %s ) ), 0 ) AS claimable, COALESCE( SUM( status = 'claimed' AND lease_until >= NOW( ) ), 0 ) AS in_flight FROM {self._claims_table} WHERE round_id = %s", ( MAX_ATTEMPTS, self.round_id ), fetch=True ) )
+        return ( int( _row[0]['claimable'] ), int( _row[0]['in_flight'] ) ) if _row else ( 0, 0 )
+
+    # claim providers until the round has nothing left: calls work( p_id ) for each, which returns whether it went ok, or None to hand it back.
+    # with a cancel token, we stop claiming once it's cancelled and leave the rest to the other nodes. raises if the database
+    # stays unreachable for a whole lease, by then our claims have gone to the other nodes anyway
+    def work( self, work: Callable[[int], Optional[bool]], cancel=None ) -> None:
+
+        # keep going until there's nothing to claim and nothing in flight anywhere: a node that dies leaves its leases to expire, and we pick them up
+        _failing = None
+        while cancel is None or not cancel.cancelled:
+
+            # grab the next one, backing off while the database is away
+            try:
+                _p_id = self.claim( )
+                _left = self.remaining( ) if _p_id is None else None
+                _failing = None
+            except RuntimeError as e:
+                _failing = _failing or time.monotonic( )
+                if time.monotonic( ) - _failing >= self.lease:
+                    raise
+                debug_print_sync(f"Cluster {self.name}: can't reach the round, backing off: {e}")
+                time.sleep( self.poll )
+                continue
+
+            # nothing to claim right now
+            if _p_id is None:
+                _claimable, _in_flight = _left
+                if _claimable:
+                    continue
+                if not _in_flight:
+                    return
+                time.sleep( self.poll )
+                continue
+
+            # do it, and hand it back
+            _ok = False
+            try:
+                _ok = work( _p_id )
+            finally:
+                self.finish( _p_id, _ok )
+
+    # renew our leases until we're stopped
+    def _renew( self ) -> None:
+        while not self._stop.wait( self.lease / 3 ):
+
+            # our live claims
+            with self._claims_lock:
+                _tokens = list( self._claims.values( ) )
+            if not _tokens:
+                continue
+
+            # push them out another lease
+            try:
+                self._db.execute_raw( f"UPDATE {self._claims_table} SET lease_until = NOW( ) + INTERVAL %s SECOND WHERE round_id = %s AND status = 'claimed' AND token IN ( {','.join( ['%s'] * len( _tokens ) )} )", ( self.lease, self.round_id, *_tokens ) )
+            except Exception as e:
+                debug_print_sync(f"Cluster {self.name}: failed to renew our leases: {e}")
+
+    # close the round: the first node to get here once nothing is left runs final( ), the rest skip it. returns whether we ran it
+    def close( self, final: Callable[[], None] ) -> bool:
+
+        # stop renewing
+        self._stop.set( )
+        if self._heartbeat is not None:
+            self._heartbeat.join( )
+            self._heartbeat = None
+
+        # under the lock, for as long as another node's final operations take
+        with self._locked( -1 ) as cursor:
+
+            # someone already closed it
+            cursor.execute( f"SELECT status FROM {self._rounds} WHERE id = %s", ( self.round_id, ) )
+            _status = ( cursor.fetchone( ) or ( None, ) )[0]
+            if _status != 'open':
+                debug_print_sync(f"Cluster {self.name}: round {self.round_id} is already {_status}, skipping the final operations")
+                return False
+
+            # someone's still working, they'll close it
+            _claimable, _in_flight = self.remaining( )
+            if _claimable or _in_flight:
+                debug_print_sync(f"Cluster {self.name}: round {self.round_id} still has {_claimable + _in_flight} providers going, leaving it to them")
+                return False
+
+            # it's ours: a failure leaves the round open for the next node to retry
+            debug_print_sync(f"Cluster {self.name}: node {self.node} running the final operations for round {self.round_id}")
+            final( )
+            cursor.execute( f"UPDATE {self._rounds} SET status = 'closed', finished = NOW( ), final_node = %s WHERE id = %s", ( self.node, self.round_id ) )
+            self.ran_final = True
+
+        # return that we did
+        return True
+
+    # the rounds claims by status, for the summary
+    def counts( self ) -> Dict[str, int]:
+        _rows = self._db.execute_raw( f"SELECT status, COUNT( * ) AS total FROM {self._claims_table} WHERE round_id = %s GROUP BY status", ( self.round_id, ), fetch=True ) or []
+        return { row['status']: int( row['total'] ) for row in _rows }
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import signal
+import threading
+import time
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# our long running daemon: syncs providers as they come due, and tests streams on its own cadence
+class KP_Daemon:
+
+    # fire us up
+    def __init__( self, sync, interval: float = 60.0, test_interval: float = 86400.0 ):
+
+        # setup the internal variables
+        self.sync = sync
+        self.interval = max( 1.0, float( interval ) )
+        self.test_interval = float( test_interval )
+        self._stop = threading.Event( )
+        self._lock = threading.Lock( )
+
+        # what's running right now: the providers in the current batch, and the batch and test threads
+        self._running = set( )
+        self._sync_thread = None
+        self._test_thread = None
+        self._test_cancel = None
+        self._last_test = time.time( )
+
+        # setup the schedule
+        from sync.schedule import KP_Schedule
+        self.schedule = KP_Schedule.from_config( )
+
+    # how long we give a cancelled stream test to wrap up, the tests already running end on their own timeouts
+    TEST_GRACE = 30.0
+
+    # run until we're stopped
+    def run( self ) -> None:
+
+        # stop cleanly on a terminate
+        try:
+            signal.signal( signal.SIGTERM, lambda signum, frame: self.stop( ) )
+        except ValueError:
+            pass
+
+        # keep the http sessions open between syncs
+        from sync.get import KP_Get
+        KP_Get.keep_sessions = True
+
+        self.sync.common.kp_print( "info", f"Daemon started: checking providers every {self.interval:.0f}s" + ( f", testing streams every {self.test_interval / 3600:.1f}h" if self.test_interval > 0 else "" ) )
+
+        # tick until we're told to stop
+        try:
+            while not self._stop.is_set( ):
+                self._tick( )
+                self._stop.wait( self.interval )
+
+        # and finally, cancel the running batch and let it wrap up: the providers it already staged still get synced
+        finally:
+            self.stop( )
+            while self._sync_thread is not None and self._sync_thread.is_alive( ):
+                self._cancel_sync( )
+                self._sync_thread.join( 0.5 )
+            if self._test_thread is not None:
+                self._test_thread.join( self.TEST_GRACE )
+                if self._test_thread.is_alive( ):
+                    self.sync.common.kp_print( "warn", f"The stream test did not stop within {self.TEST_GRACE:g}s, abandoning it" )
+            self.sync.common.kp_print( "info", "Daemon stopped" )
+
+    # ask the daemon to stop, cancelling the running batch and stream test
+    def stop( self ) -> None:
+        self._stop.set( )
+        self._cancel_sync( )
+        if self._test_cancel is not None:
+            self._test_cancel.cancel( "daemon stopping" )
+
+    # cancel the running batch, a batch that's only starting swaps in its token after this, so we keep at it while we wait
+    def _cancel_sync( self ) -> None:
+        self.sync._cancel.cancel( "daemon stopping" )
+
+    # check what needs to run
+    def _tick( self ) -> None:
+
+        # start a sync batch for the providers that are due
+        try:
+            self._start_sync( )
+        except Exception as e:
+            self.sync.common.kp_print( "error", f"Daemon sync check failed: {str(e)}" )
+
+        # start a stream test if it's time
+        if self.test_interval > 0 and time.time( ) - self._last_test >= self.test_interval:
+            self._start_test( )
+
+    # start a sync batch for the due providers that aren't already running
+    def _start_sync( self ) -> None:
+
+        # one batch at a time, they share the staging table
+        if self._sync_thread is not None and self._sync_thread.is_alive( ):
+            debug_print_sync("Daemon: sync batch still running, checking again next tick")
+            return
+
+        # get fresh provider rows, so we see the latest sp_last_synced
+        from utils.cache import KP_Cache_Registry
+        self.sync._caches.invalidate( KP_Cache_Registry.PROVIDERS )
+        _providers = self.sync._data._get_providers( self.sync.common.args.provider ) or []
+
+        # the ones that are due, and not already running
+        with self._lock:
+            _due = [prov for prov in self.schedule.due( _providers ) if prov['id'] not in self._running]
+            if not _due:
+                debug_print_sync("Daemon: no providers due")
+                return
+            self._running.update( prov['id'] for prov in _due )
+
+        debug_print_sync(f"Daemon: starting sync batch for {len(_due)} providers")
+
+        # run it in the background, the sync runs its own fixup after the batch
+        self._sync_thread = threading.Thread( target=self._run_sync, args=( _due, ), name="kptv-daemon-sync" )
+        self._sync_thread.start( )
+
+    # run a sync batch
+    def _run_sync( self, providers ) -> None:
+
+        # try to sync them
+        try:
+            self.sync.sync_providers( providers )
+        except Exception as e:
+            self.sync.common.kp_print( "error", f"Daemon sync batch failed: {str(e)}" )
+
+        # and finally, they're free to run again
+        finally:
+            with self._lock:
+                self._running.difference_update( prov['id'] for prov in providers )
+
+    # start a stream test, unless one is still running
+    def _start_test( self ) -> None:
+
+        # one at a time
+        if self._test_thread is not None and self._test_thread.is_alive( ):
+            return
+
+        debug_print_sync("Daemon: starting stream test")
+
+        # run it in the background with its own token, so stopping the daemon stops it, and it can't keep the process alive
+        from utils.cancel import KP_Cancel_Token
+        self._last_test = time.time( )
+        self._test_cancel = KP_Cancel_Token( None, "stream test" )
+        self._test_thread = threading.Thread( target=self._run_test, args=( self._test_cancel, ), name="kptv-daemon-test", daemon=True )
+        self._test_thread.start( )
+
+    # run a stream test
+    def _run_test( self, cancel ) -> None:
+        try:
+            self.sync.test_streams( cancel )
+        except Exception as e:
+            self.sync.common.kp_print( "error", f"Daemon stream test failed: {str(e)}" )
@@ -2,13 +2,14 @@
 
 # import the database class
 from db.db import KP_DB, ComparisonOperator, WhereClause
+from utils.cache import KP_Cache_Registry, cached
 
 # Import debug utilities
 try:
     from utils.debug import debug_print_sync, debug_print_db
 except ImportError:
-    def debug_print_sync(msg): pass
-    def debug_print_db(msg): pass
+    def debug_print_sync(msg, *args): pass
+    def debug_print_db(msg, *args): pass
 
 class KP_Sync_Data:
 
@@ -16,13 +17,8 @@ class KP_Sync_Data:
 
         debug_print_sync("Initializing KP_Sync_Data")
 
-        # setup the cache we're going to use
-        from utils.cache import KP_Cache
-        self.cache = KP_Cache( )
-
-        # hold the cache keys
-        self.cache_key_prov = "sync_providers"
-        self.cache_key_filt = "sync_filters_%d"
+        # setup the shared caches we're going to use
+        self.caches = KP_Cache_Registry.instance( )
         
         debug_print_sync("KP_Sync_Data initialization completed")
 
@@ -35,6 +31,9 @@ class KP_Sync_Data:
         with KP_DB( ) as db:
 
             db.call_proc( "Provider_Update_Refreshed", args=[provider], fetch=False )
+
+        # the cached provider rows now have a stale sp_last_synced
+        self.caches.invalidate( KP_Cache_Registry.PROVIDERS )
             
         debug_print_db(f"Last synced time updated for provider: {provider}")
 
@@ -90,118 +89,149 @@ class KP_Sync_Data:
             
         debug_print_db(f"Successfully inserted {len(streams)} streams into temp table")
           
-    # get the providers list
-    def _get_providers( self, _provider: int = 0 ):
-
-        debug_print_sync(f"Getting providers list (specific provider: {_provider})")
-
-        # hold a return
-        _ret = []
+    # how many rows each provider has staged in the temp table: p_id -> rows
+    def _get_staged_counts( self, p_ids ):
 
-        # get the providers from the cache
-        _ret = self.cache.get( self.cache_key_prov + str( _provider ) ) or None
+        # if there's nothing, there's nothing to do
+        if not p_ids:
+            return {}
 
-        # if it's not in the cache yet
-        if _ret is None:
-
-            debug_print_sync("Providers not in cache, fetching from database")
+        # with our database class
+        with KP_DB( ) as db:
 
-            # with our database class
-            with KP_DB( ) as db:
+            # count them
+            _table = f"{db.table_prefix}stream_temp" if db.table_prefix else "stream_temp"
+            _rows = db.execute_raw( f"SELECT p_id, COUNT( * ) AS total FROM {_table} WHERE p_id IN ( {', '.join( ['%s'] * len( p_ids ) )} ) GROUP BY p_id", tuple( p_ids ), fetch=True ) or []
 
-                # hold the where clause
-                where = []
+        # return them
+        return { int( row['p_id'] ): int( row['total'] ) for row in _rows }
 
-                # if we have a specific provider
-                if _provider is not None and _provider != 0:
+    # get the providers list, concurrent callers share one query
+    @cached( KP_Cache_Registry.PROVIDERS, key=lambda self, _provider=0: KP_Cache_Registry.provider_key( _provider ) )
+    def _get_providers( self, _provider: int = 0 ):
 
-                    debug_print_sync(f"Filtering for specific provider ID: {_provider}")
-                    # setup the where clause
-                    where = [
-                        WhereClause(
-                            field="id", 
-                            value=_provider,
-                            operator=ComparisonOperator.EQ
-                        )
-                    ]
-                    
-                # get the provider records
-                _ret = db.get_all( table='stream_providers', columns=['id', 
-                        'u_id', 
-                        'sp_should_filter', 
-                        'sp_name', 
-                        'sp_type', 
-                        'sp_domain', 
-                        'sp_username', 
-                        'sp_password', 
-                        'sp_stream_type',
-                        'sp_refresh_period',
-                        'sp_last_synced'], 
-                        where=where )
+        debug_print_sync(f"Getting providers list from database (specific provider: {_provider})")
 
-            debug_print_sync(f"Retrieved {len(_ret)} providers from database")
+        # with our database class
+        with KP_DB( ) as db:
 
-            # set the item in the cache
-            self.cache.set( self.cache_key_prov, _ret )
-        else:
-            debug_print_sync(f"Retrieved {len(_ret)} providers from cache")
+            # hold the where clause
+            where = []
+
+            # if we have a specific provider
+            if _provider is not None and _provider != 0:
+
+                debug_print_sync(f"Filtering for specific provider ID: {_provider}")
+                # setup the where clause
+                where = [
+                    WhereClause(
+                        field="id", 
+                        value=_provider,
+                        operator=ComparisonOperator.EQ
+                    )
+                ]
+                
+            # get the provider records
+            _ret = db.get_all( table='stream_providers', columns=['id', 
+                    'u_id', 
+                    'sp_should_filter', 
+                    'sp_name', 
+                    'sp_type', 
+                    'sp_domain', 
+                    'sp_username', 
+                    'sp_password', 
+                    'sp_stream_type',
+                    'sp_refresh_period',
+                    'sp_last_synced'], 
+                    where=where )
+
+        debug_print_sync(f"Retrieved {len(_ret)} providers from database")
 
         # return the providers
         return _ret
 
-    # get the filters
+    # get the filters, concurrent callers for the same user share one query
+    @cached( KP_Cache_Registry.FILTERS, key=lambda self, uid: KP_Cache_Registry.filter_key( uid ) )
     def _get_filters( self, uid: int ):
 
-        debug_print_sync(f"Getting filters for user ID: {uid}")
+        debug_print_sync(f"Getting filters from database for user ID: {uid}")
+
+        # setup the where clause
+        where = [
+            WhereClause(
+                field="u_id", 
+                value=uid,
+                operator=ComparisonOperator.EQ
+            ),
+            WhereClause(
+                field="sf_active", 
+                value=1,
+                operator=ComparisonOperator.EQ
+            ),
+        ]
 
-        # hold a return
-        _ret = []
+        # with our database class
+        with KP_DB( ) as db:
 
-        # hold and format the cache key
-        _ckey = self.cache_key_filt % uid
-        
-        # get the providers from the cache
-        _ret = self.cache.get( _ckey) or None
+            # get the filter records
+            _ret = db.get_all( table='stream_filters',
+                        columns=['id', 'sf_filter', 'sf_type_id'],
+                        where=where )
 
-        # if we don't have the filters in the cache
-        if _ret is None:
+        debug_print_sync(f"Retrieved {len(_ret)} filters from database for user {uid}")
 
-            debug_print_sync("Filters not in cache, fetching from database")
+        # drop the stale compiled set built from the old filters
+        self.caches.invalidate( KP_Cache_Registry.COMPILED_FILTERS, KP_Cache_Registry.compiled_filter_key( uid ) )
 
-            # setup the where clause
-            where = [
-                WhereClause(
-                    field="u_id", 
-                    value=uid,
-                    operator=ComparisonOperator.EQ
-                ),
-                WhereClause(
-                    field="sf_active", 
-                    value=1,
-                    operator=ComparisonOperator.EQ
-                ),
-            ]
+        # return the filters
+        return _ret
 
-            # with our database class
-            with KP_DB( ) as db:
+    # preload the active filters for all the users in one query, priming the per user cache
+    def _preload_filters( self, uids ):
+
+        # unique users only
+        uids = sorted( set( uids ) )
+        if not uids:
+            return {}
+
+        debug_print_sync(f"Preloading filters from database for {len(uids)} users")
+
+        # setup the where clause
+        where = [
+            WhereClause(
+                field="u_id", 
+                value=uids,
+                operator=ComparisonOperator.IN
+            ),
+            WhereClause(
+                field="sf_active", 
+                value=1,
+                operator=ComparisonOperator.EQ
+            ),
+        ]
+
+        # with our database class
+        with KP_DB( ) as db:
 
-                # get the filter records
-                _ret = db.get_all( table='stream_filters',
-                            columns=['id', 'sf_filter', 'sf_type_id'],
-                            where=where )
+            # get the filter records
+            _rows = db.get_all( table='stream_filters',
+                        columns=['id', 'u_id', 'sf_filter', 'sf_type_id'],
+                        where=where )
 
-            debug_print_sync(f"Retrieved {len(_ret)} filters from database for user {uid}")
+        # group them by user, every user gets a list even if they have no filters
+        _grouped = { uid: [] for uid in uids }
+        for row in _rows:
+            _grouped.setdefault( row['u_id'], [] ).append( { 'id': row['id'], 'sf_filter': row['sf_filter'], 'sf_type_id': row['sf_type_id'] } )
 
-            # clean up
-            del where
+        # prime the cache _get_filters reads from, and drop any stale compiled sets
+        for uid, _filters in _grouped.items( ):
+            KP_Sync_Data._get_filters.prime( _filters, self, uid )
+            self.caches.invalidate( KP_Cache_Registry.COMPILED_FILTERS, KP_Cache_Registry.compiled_filter_key( uid ) )
 
-            # set the item in the cache
-            self.cache.set( _ckey, _ret )
-        else:
-            debug_print_sync(f"Retrieved {len(_ret)} filters from cache for user {uid}")
+        debug_print_sync(f"Preloaded {len(_rows)} filters for {len(uids)} users")
 
-        # return the filters
-        return _ret
+        # return them
+        return _grouped
     
     # get active streams for testing
     def _get_active_streams( self ):
@@ -259,7 +289,7 @@ class KP_Sync_Data:
             for i in range(0, len(stream_ids), chunk_size):
                 chunk = stream_ids[i:i + chunk_size]
                 
-                debug_print_db(f"Processing chunk {i//chunk_size + 1}: {len(chunk)} streams")
+                debug_print_db("Processing chunk %d: %d streams", i//chunk_size + 1, len(chunk))
                 
                 # Use a single transaction for the chunk
                 try:
@@ -268,7 +298,7 @@ class KP_Sync_Data:
                             db.call_proc( "Streams_Move_To_Other", args=[stream_id], fetch=False )
                             moved_count += 1
                             
-                    debug_print_db(f"Successfully moved chunk of {len(chunk)} streams")
+                    debug_print_db("Successfully moved chunk of %d streams", len(chunk))
                     
                 except Exception as e:
                     debug_print_db(f"Error moving chunk starting at {i}: {e}")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# the converted row fields that make up a streams fingerprint
+FINGERPRINT_FIELDS = ( 's_orig_name', 's_stream_uri', 's_tvg_id', 's_tvg_logo', 's_group', 's_type_id' )
+
+# fingerprint a converted row: ( identity, fingerprint ), 8 bytes each
+def fingerprint( row: Dict[str, Any] ) -> Tuple[bytes, bytes]:
+    _identity = hashlib.blake2b( str( row['s_stream_uri'] ).encode( 'utf-8' ), digest_size=8 ).digest( )
+    _fingerprint = hashlib.blake2b( "\x1f".join( str( row[field] ) for field in FINGERPRINT_FIELDS ).encode( 'utf-8' ), digest_size=8 ).digest( )
+    return _identity, _fingerprint
+
+# our local snapshot of each providers last synced fingerprints
+class KP_Delta_Store:
+
+    # where it lives, unless the config says otherwise
+    DEFAULT_PATH = os.path.join( '~', '.cache', 'kptv', 'delta.sqlite3' )
+
+    # open the store
+    def __init__( self, path: Optional[str] = None, timeout: float = 10.0 ):
+
+        # setup the internal variables
+        self.path = os.path.abspath( os.path.expanduser( path or self.DEFAULT_PATH ) )
+        self.timeout = timeout
+        self._local = threading.local( )
+
+        # make sure the directory and table are there
+        os.makedirs( os.path.dirname( self.path ), exist_ok=True )
+        self._connection( ).execute( "CREATE TABLE IF NOT EXISTS stream_fingerprints ( p_id INTEGER NOT NULL, identity BLOB NOT NULL, fingerprint BLOB NOT NULL, PRIMARY KEY ( p_id, identity ) ) WITHOUT ROWID" )
+
+    # get the store using the configured path
+    @classmethod
+    def from_config( cls ) -> 'KP_Delta_Store':
+
+        # try to read the path, the default is fine if we can't
+        try:
+            from config.config import get_delta_path
+            _path = get_delta_path( )
+        except Exception:
+            _path = None
+        return cls( _path )
+
+    # get this threads connection
+    def _connection( self ) -> sqlite3.Connection:
+
+        # if we already have one, return it
+        _cnx = getattr( self._local, 'cnx', None )
+        if _cnx is not None:
+            return _cnx
+
+        # open it in WAL mode, so other processes can read while we write
+        _cnx = sqlite3.connect( self.path, timeout=self.timeout )
+        _cnx.execute( "PRAGMA journal_mode=WAL" )
+        _cnx.execute( "PRAGMA synchronous=NORMAL" )
+        self._local.cnx = _cnx
+        return _cnx
+
+    # load a providers fingerprints: identity -> fingerprint
+    def load( self, p_id: int ) -> Dict[bytes, bytes]:
+        return dict( self._connection( ).execute( "SELECT identity, fingerprint FROM stream_fingerprints WHERE p_id = ?", ( p_id, ) ) )
+
+    # replace a providers fingerprints
+    def save( self, p_id: int, fingerprints: Dict[bytes, bytes] ) -> None:
+
+        # in one transaction
+        _cnx = self._connection( )
+        with _cnx:
+            _cnx.execute( "DELETE FROM stream_fingerprints WHERE p_id = ?", ( p_id, ) )
+            _cnx.executemany( "INSERT INTO stream_fingerprints ( p_id, identity, fingerprint ) VALUES ( ?, ?, ? )", ( ( p_id, _id, _fp ) for _id, _fp in fingerprints.items( ) ) )
+
+    # forget providers, their next delta sync stages everything
+    def forget( self, p_ids: List[int] ) -> None:
+        _cnx = self._connection( )
+        with _cnx:
+            _cnx.executemany( "DELETE FROM stream_fingerprints WHERE p_id = ?", ( ( p_id, ) for p_id in p_ids ) )
+
+    # forget every provider
+    def clear( self ) -> None:
+        _cnx = self._connection( )
+        with _cnx:
+            _cnx.execute( "DELETE FROM stream_fingerprints" )
+
+# our per run delta tracker
+class KP_Delta:
+
+    # fire us up
+    def __init__( self, store: KP_Delta_Store ):
+
+        # setup the internal variables
+        self.store = store
+        self._pending = {}
+        self._lock = threading.Lock( )
+
+        # the totals for the run
+        self.totals = { 'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0, 'full': 0, 'skipped': 0 }
+
+    # work out what to stage for a provider: returns ( rows to stage, fingerprints, counts ).
+    # the final procedures reconcile a staged provider against everything it staged, so a provider is all or nothing:
+    # with no snapshot yet, or any stream added, changed or removed, its whole catalog is staged. with nothing changed,
+    # nothing is staged and the main tables keep its streams, the same as a provider that isn't due yet
+    def diff( self, p_id: int, rows: List[Dict[str, Any]] ) -> Tuple[List[Dict[str, Any]], Dict[bytes, bytes], Dict[str, int]]:
+
+        # setup the previous and current fingerprints
+        _previous = self.store.load( p_id )
+        _current = {}
+        _counts = { 'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0, 'full': 0, 'skipped': 0 }
+
+        # loop the rows
+        for row in rows:
+
+            # fingerprint it
+            _id, _fp = fingerprint( row )
+            _current[_id] = _fp
+
+            # compare it to the last sync
+            _last = _previous.get( _id )
+            if _last is None:
+                _counts['added'] += 1
+            elif _last != _fp:
+                _counts['changed'] += 1
+            else:
+                _counts['unchanged'] += 1
+
+        # anything that's gone
+        _counts['removed'] = len( _previous.keys( ) - _current.keys( ) )
+
+        # all of it, or nothing at all
+        if _previous and not ( _counts['added'] or _counts['changed'] or _counts['removed'] ):
+            _counts['skipped'] = 1
+            _stage = []
+        else:
+            _counts['full'] = 1
+            _stage = rows
+
+        debug_print_sync(f"Delta for provider {p_id}: {_counts['added']} added, {_counts['changed']} changed, {_counts['removed']} removed, {_counts['unchanged']} unchanged, staging {len(_stage)}")
+
+        # add it to the run totals
+        with self._lock:
+            for name, count in _counts.items( ):
+                self.totals[name] += count
+
+        # return them
+        return _stage, _current, _counts
+
+    # remember a providers fingerprints once its rows are staged
+    def record( self, p_id: int, fingerprints: Dict[bytes, bytes] ) -> None:
+        with self._lock:
+            self._pending[p_id] = fingerprints
+
+    # save the recorded fingerprints, once the staged rows are synced
+    def commit( self ) -> None:
+
+        # grab what's pending
+        with self._lock:
+            _pending, self._pending = self._pending, {}
+
+        # save them
+        for p_id, fingerprints in _pending.items( ):
+            self.store.save( p_id, fingerprints )
+
+        debug_print_sync(f"Delta snapshots saved for {len(_pending)} providers")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import csv
+import json
+import threading
+from typing import Optional, Dict, Any, List
+
+# import the sync data we stand in for
+from sync.data import KP_Sync_Data
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# a sink that throws the rows away, only counting them
+class KP_Null_Sink:
+
+    # the file extension, none for us
+    extension = None
+
+    # fire us up
+    def __init__( self, path: Optional[str] = None ):
+
+        # setup the internal variables
+        self.path = path
+        self.rows = 0
+        self._lock = threading.Lock( )
+
+    # take the rows
+    def write( self, rows: List[Dict[str, Any]] ) -> None:
+        with self._lock:
+            self.rows += len( rows )
+            self._write( rows )
+
+    # write them out, nothing for us
+    def _write( self, rows: List[Dict[str, Any]] ) -> None:
+        pass
+
+    # close it
+    def close( self ) -> None:
+        pass
+
+    # what it is, for the summary
+    def describe( self ) -> str:
+        return "null sink"
+
+# a sink that appends the rows to a file, opened on the first write
+class KP_File_Sink( KP_Null_Sink ):
+
+    # fire us up
+    def __init__( self, path: str ):
+        super( ).__init__( path )
+        self._file = None
+
+    # open the file, appending to what's there
+    def _open( self ):
+        if self._file is None:
+            self._file = open( self.path, 'a', encoding='utf-8', newline='' )
+        return self._file
+
+    # close it
+    def close( self ) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close( )
+                self._file = None
+
+    # what it is, for the summary
+    def describe( self ) -> str:
+        return self.path
+
+# a sink writing a json object per line
+class KP_JSONL_Sink( KP_File_Sink ):
+
+    # the file extension
+    extension = "jsonl"
+
+    # write them out
+    def _write( self, rows: List[Dict[str, Any]] ) -> None:
+        _file = self._open( )
+        for row in rows:
+            _file.write( json.dumps( row, default=str ) + "\n" )
+
+# a sink writing csv, with a header if the file is new
+class KP_CSV_Sink( KP_File_Sink ):
+
+    # the file extension
+    extension = "csv"
+
+    # write them out
+    def _write( self, rows: List[Dict[str, Any]] ) -> None:
+
+        # if there's nothing, there's nothing to do
+        if not rows:
+            return
+
+        # setup the writer
+        _file = self._open( )
+        _writer = csv.DictWriter( _file, fieldnames=list( rows[0].keys( ) ), extrasaction='ignore' )
+        if _file.tell( ) == 0:
+            _writer.writeheader( )
+        _writer.writerows( rows )
+
+# the sinks by name
+SINKS = { 'null': KP_Null_Sink, 'jsonl': KP_JSONL_Sink, 'csv': KP_CSV_Sink }
+
+# open a sink by name
+def open_sink( kind: str, path: Optional[str] = None, stamp: str = "" ) -> KP_Null_Sink:
+
+    # setup the sink class
+    _sink = SINKS.get( kind, KP_Null_Sink )
+
+    # the null sink needs no file
+    if _sink.extension is None:
+        return _sink( )
+
+    # otherwise the given file, or a timestamped one
+    return _sink( path or f"dry_run_{stamp}.{_sink.extension}" )
+
+# our sync data for --dry-run: reads from the database or a fixtures directory, writes to a sink
+class KP_Dry_Run_Data( KP_Sync_Data ):
+
+    # fire us up
+    def __init__( self, sink: KP_Null_Sink, fixtures: Optional[str] = None ):
+
+        super( ).__init__( )
+
+        # setup the internal variables
+        self.sink = sink
+        self.fixtures = fixtures
+        self._filters = None
+
+        debug_print_sync(f"Dry run: rows go to {sink.describe( )}" + ( f", providers come from {fixtures}" if fixtures else "" ))
+
+    # load a json fixture
+    def _load_fixture( self, name: str, default: Any ) -> Any:
+
+        # setup the path
+        _path = os.path.join( self.fixtures, name )
+        if not os.path.isfile( _path ):
+            debug_print_sync(f"Dry run: no {_path}, using an empty set")
+            return default
+
+        # load it
+        with open( _path, 'r', encoding='utf-8' ) as f:
+            return json.load( f )
+
+    # get the fixture filters, grouped by user
+    def _fixture_filters( self ) -> Dict[int, List[Dict[str, Any]]]:
+
+        # load them once
+        if self._filters is None:
+
+            # either a list of rows with their u_id, or a dict of user id to rows
+            _rows = self._load_fixture( 'filters.json', [] )
+            if isinstance( _rows, dict ):
+                self._filters = { int( uid ): rows for uid, rows in _rows.items( ) }
+            else:
+                self._filters = {}
+                for row in _rows:
+                    self._filters.setdefault( int( row['u_id'] ), [] ).append( { 'id': row.get( 'id' ), 'sf_filter': row['sf_filter'], 'sf_type_id': row['sf_type_id'] } )
+
+        # return them
+        return self._filters
+
+    # get the providers list
+    def _get_providers( self, _provider: int = 0 ):
+
+        # from the database
+        if not self.fixtures:
+            return super( )._get_providers( _provider )
+
+        # otherwise from the fixtures
+        _providers = self._load_fixture( 'providers.json', [] )
+        return [prov for prov in _providers if not _provider or prov.get( 'id' ) == _provider]
+
+    # get a users filters
+    def _get_filters( self, uid: int ):
+
+        # from the database
+        if not self.fixtures:
+            return super( )._get_filters( uid )
+
+        # otherwise from the fixtures
+        return self._fixture_filters( ).get( int( uid ), [] )
+
+    # preload the users filters
+    def _preload_filters( self, uids ):
+
+        # from the database
+        if not self.fixtures:
+            return super( )._preload_filters( uids )
+
+        # otherwise from the fixtures
+        _filters = self._fixture_filters( )
+        return { uid: _filters.get( int( uid ), [] ) for uid in set( uids ) }
+
+    # send the rows to the sink instead of the temp table
+    def _insert_the_streams( self, streams ):
+        self.sink.write( streams )
+
+    # leave the providers last synced alone
+    def _update_last_synced( self, provider: int ):
+        debug_print_sync(f"Dry run: not updating last synced for provider {provider}")
+
+    # no stored procedures, just finish the sinks file
+    def _sync_the_streams( self ):
+        self.sink.close( )
+
+    def _cleanup( self ):
+        debug_print_sync("Dry run: skipping Streams_CleanUp")
+
+    def _fixup( self ):
+        debug_print_sync("Dry run: skipping Streams_FixUp")
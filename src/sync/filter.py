@@ -1,119 +1,350 @@
 #!/usr/bin/env python3
 
 import regex
-from typing import Dict, List, Any
+import json
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List, Any, Optional
 
 # Import debug utilities
 try:
     from utils.debug import debug_print_sync
 except ImportError:
-    def debug_print_sync(msg): pass
+    def debug_print_sync(msg, *args): pass
+
+# our per filter profiling stats
+class KP_Filter_Stats:
+
+    # how many timing samples we keep per filter for the percentiles
+    max_samples = 10000
+
+    # fire us up
+    def __init__( self ):
+
+        # hold the stats keyed by filter id: [type, filter, evaluations, matches, total ns, samples]
+        self._stats = {}
+        self._lock = threading.Lock( )
+
+    # create an empty stats record
+    @staticmethod
+    def _new_record( filter_type: int, filter_value: str ) -> list:
+        return [filter_type, filter_value, 0, 0, 0, array( 'q' )]
+
+    # record a single evaluation
+    @staticmethod
+    def record( record: list, matched: bool, elapsed_ns: int ) -> None:
+
+        # count it
+        record[2] += 1
+        record[4] += elapsed_ns
+        if matched:
+            record[3] += 1
+
+        # keep a bounded reservoir of timings
+        samples = record[5]
+        if len( samples ) < KP_Filter_Stats.max_samples:
+            samples.append( elapsed_ns )
+        else:
+            _idx = random.randrange( record[2] )
+            if _idx < KP_Filter_Stats.max_samples:
+                samples[_idx] = elapsed_ns
+
+    # how long a raw stats dict spent evaluating filters, in seconds
+    @staticmethod
+    def elapsed( stats: Optional[dict] ) -> float:
+        return sum( record[4] for record in ( stats or {} ).values( ) ) / 1e9
+
+    # merge a compiled filter sets stats into ours
+    def merge( self, compiled: 'KP_Compiled_Filters' ) -> None:
+        self.merge_stats( compiled.stats )
+
+    # merge a raw stats dict into ours, as returned from a worker process
+    def merge_stats( self, stats: Optional[dict] ) -> None:
+
+        # if it wasn't profiled, there's nothing to do
+        if not stats:
+            return
+
+        # with the thread lock
+        with self._lock:
+
+            # loop the compiled stats
+            for filter_id, record in stats.items( ):
+
+                # if we don't have it yet, set it up
+                ours = self._stats.get( filter_id )
+                if ours is None:
+                    ours = self._stats[filter_id] = self._new_record( record[0], record[1] )
+
+                # add up the counters
+                ours[2] += record[2]
+                ours[3] += record[3]
+                ours[4] += record[4]
+
+                # combine the samples, trimming back to the reservoir size
+                ours[5].extend( record[5] )
+                if len( ours[5] ) > self.max_samples:
+                    ours[5] = array( 'q', random.sample( list( ours[5] ), self.max_samples ) )
+
+    # build the report rows, most expensive first
+    def report( self ) -> List[Dict[str, Any]]:
+
+        # hold the rows
+        rows = []
+
+        # with the thread lock
+        with self._lock:
+
+            # loop the stats
+            for filter_id, ( filter_type, filter_value, evaluations, matches, total_ns, samples ) in self._stats.items( ):
+
+                # setup the p99
+                _sorted = sorted( samples )
+                p99_ns = _sorted[min( len( _sorted ) - 1, int( len( _sorted ) * 0.99 ) )] if _sorted else 0
+
+                # add the row
+                rows.append( {
+                    'id': filter_id,
+                    'type': filter_type,
+                    'filter': filter_value,
+                    'evaluations': evaluations,
+                    'matches': matches,
+                    'total_ms': round( total_ns / 1e6, 3 ),
+                    'mean_us': round( total_ns / evaluations / 1e3, 3 ) if evaluations else 0.0,
+                    'p99_us': round( p99_ns / 1e3, 3 ),
+                } )
+
+        # return them sorted by total time
+        return sorted( rows, key=lambda r: r['total_ms'], reverse=True )
+
+    # format the report as a text table
+    def format_table( self ) -> List[str]:
+
+        # hold the lines
+        lines = [f"{'ID':>8} {'TYPE':>4} {'EVALS':>10} {'MATCHES':>10} {'TOTAL ms':>10} {'MEAN us':>9} {'P99 us':>9}  FILTER"]
+
+        # loop the rows
+        for row in self.report( ):
+            _filter = row['filter'] if len( row['filter'] ) <= 40 else row['filter'][:37] + '...'
+            lines.append( f"{row['id']!s:>8} {row['type']:>4} {row['evaluations']:>10} {row['matches']:>10} {row['total_ms']:>10.1f} {row['mean_us']:>9.2f} {row['p99_us']:>9.2f}  {_filter}" )
+
+        # return the lines
+        return lines
+
+    # write the report to a json file
+    def write_json( self, filename: str ) -> None:
+
+        # dump it out
+        with open( filename, 'w', encoding='utf-8' ) as f:
+            json.dump( { 'generated': time.strftime( '%Y-%m-%d %H:%M:%S' ), 'filters': self.report( ) }, f, indent=2 )
+
+        debug_print_sync(f"Filter stats written to: {filename}")
+
+    # how many filters do we have stats for
+    def __len__( self ) -> int:
+        return len( self._stats )
+
+# our compiled filter set
+class KP_Compiled_Filters:
+
+    # compile the users filters once
+    def __init__( self, db_filters: List[Dict[str, Any]], profile: bool = False ):
+
+        # hold the compiled filters, in the order they came from the database: (id, type, matcher)
+        self.includes = []
+        self.name_excludes = []
+        self.url_excludes = []
+
+        # hold the per filter profiling stats, only if we're profiling
+        self.stats = {} if profile else None
+
+        # loop the filters
+        for filter_rule in db_filters or []:
+
+            # setup the id, type and value of the filters
+            filter_id = filter_rule.get( "id" )
+            filter_type = filter_rule["sf_type_id"]
+            filter_value = filter_rule["sf_filter"]
+
+            # includes and regex excludes get compiled up front
+            if filter_type in ( 0, 2, 3 ):
+
+                # compile it, invalid patterns never match
+                _matcher = KP_Filter._compile_pattern( filter_value )
+                if _matcher is None:
+                    continue
+
+            # contains filters just need the lowercase text
+            elif filter_type == 1:
+                _matcher = filter_value.lower( )
+
+            # unknown types are ignored
+            else:
+                continue
+
+            # add it to the proper list
+            _entry = ( filter_id, filter_type, _matcher )
+            if filter_type == 0:
+                self.includes.append( _entry )
+            elif filter_type == 3:
+                self.url_excludes.append( _entry )
+            else:
+                self.name_excludes.append( _entry )
+
+            # setup its stats record
+            if profile:
+                self.stats[filter_id] = KP_Filter_Stats._new_record( filter_type, filter_value )
+
+        # hold how many filters we started with
+        self.count = len( db_filters or [] )
+
+        debug_print_sync(f"Compiled filters: {len(self.includes)} include, {len(self.name_excludes)} name exclude, {len(self.url_excludes)} url exclude")
+
+    # how many filters did we compile from
+    def __len__( self ) -> int:
+        return self.count
+
+    # run a single filter against the text, timing it
+    def _profiled( self, entry: tuple, text: str ) -> bool:
+
+        # setup the entry
+        filter_id, filter_type, _matcher = entry
+
+        # run and time it
+        _start = time.perf_counter_ns( )
+        if filter_type == 1:
+            matched = _matcher in text.lower( )
+        else:
+            matched = _matcher.search( text ) is not None
+        KP_Filter_Stats.record( self.stats[filter_id], matched, time.perf_counter_ns( ) - _start )
+
+        # return if it matched
+        return matched
+
+    # check the stream name: True = keep, False = exclude, None = depends on the url
+    def check_name( self, stream_name: str ) -> Optional[bool]:
+
+        # if we're profiling, take the slower path
+        if self.stats is not None:
+            return self._check_name_profiled( stream_name )
+
+        # includes always win
+        for _, _, _pattern in self.includes:
+            if _pattern.search( stream_name ):
+                return True
+
+        # hold the lowercase name only if we need it
+        _name_lower = None
+
+        # loop the name based excludes
+        for _, filter_type, _matcher in self.name_excludes:
+
+            # contains filter
+            if filter_type == 1:
+                if _name_lower is None:
+                    _name_lower = stream_name.lower( )
+                if _matcher in _name_lower:
+                    return False
+
+            # regex name filter
+            elif _matcher.search( stream_name ):
+                return False
+
+        # if there aren't any url filters, we can keep it now
+        if not self.url_excludes:
+            return True
+
+        # otherwise we need the url
+        return None
+
+    # check the stream name while recording per filter stats
+    def _check_name_profiled( self, stream_name: str ) -> Optional[bool]:
+
+        # includes always win
+        for _entry in self.includes:
+            if self._profiled( _entry, stream_name ):
+                return True
+
+        # loop the name based excludes
+        for _entry in self.name_excludes:
+            if self._profiled( _entry, stream_name ):
+                return False
+
+        # keep it, unless we need the url
+        return True if not self.url_excludes else None
+
+    # check the stream url: True = keep, False = exclude
+    def check_url( self, stream_url: str ) -> bool:
+
+        # if we're profiling, time each filter
+        if self.stats is not None:
+            return not any( self._profiled( _entry, stream_url ) for _entry in self.url_excludes )
+
+        # loop the url excludes
+        for _, _, _pattern in self.url_excludes:
+            if _pattern.search( stream_url ):
+                return False
+
+        # keep it
+        return True
+
+    # check the stream completely
+    def check( self, stream_name: str, stream_url: str ) -> bool:
+
+        # check the name first
+        _keep = self.check_name( stream_name )
+        if _keep is not None:
+            return _keep
+
+        # then the url
+        return self.check_url( stream_url )
 
 # our filter class
 class KP_Filter:
 
-    # setup the match pattern
+    # compile a pattern
     @staticmethod
-    def _match_pattern( pattern: str, text: str ) -> bool:
+    def _compile_pattern( pattern: str ):
 
-        # try to match the pattern and string
+        # try to compile it
         try:
-
-            # Use regex.IGNORECASE flag directly in compile
-            _pattern = regex.compile( pattern, regex.IGNORECASE )
-            
-            # Return True if ANY matches found (> 0 instead of > 1)
-            result = bool( _pattern.findall( text ) )
-            debug_print_sync(f"Pattern '{pattern}' {'matched' if result else 'did not match'} text '{text[:50]}{'...' if len(text) > 50 else ''}'")
-            return result
+            return regex.compile( pattern, regex.IGNORECASE )
         except Exception as e:
-            debug_print_sync(f"Pattern matching error for '{pattern}': {e}")
-            return False
-        
+            debug_print_sync(f"Pattern compile error for '{pattern}': {e}")
+            return None
+
+    # compile the database filters into a reusable filter set
+    @staticmethod
+    def compile_filters( db_filters: List[Dict[str, Any]], profile: bool = False ) -> KP_Compiled_Filters:
+        return KP_Compiled_Filters( db_filters, profile )
+
     # filter the normalized streams
     @staticmethod
     def filter_streams( normalized_data: Dict[str, Dict[str, Any]], db_filters: List[Dict[str, Any]] ) -> Dict[str, Dict[str, Any]]:
-        
+
         debug_print_sync(f"Starting stream filtering: {len(normalized_data)} streams, {len(db_filters)} filters")
-        
+
         # if there aren't any filters
         if not db_filters:
             debug_print_sync("No filters found, returning all streams")
             return normalized_data
-        
+
+        # accept an already compiled filter set
+        _compiled = db_filters if isinstance( db_filters, KP_Compiled_Filters ) else KP_Filter.compile_filters( db_filters )
+
         # hold the returnable streams
         filtered_streams = {}
-        
-        # Count filter types for debugging
-        include_filters = [f for f in db_filters if f["sf_type_id"] == 0]
-        exclude_filters = [f for f in db_filters if f["sf_type_id"] != 0]
-        
-        debug_print_sync(f"Filter breakdown: {len(include_filters)} include filters, {len(exclude_filters)} exclude filters")
-        
-        included_count = 0
-        excluded_count = 0
-        processed_count = 0
-        
+
         # loop the originating data
         for stream_id, stream in normalized_data.items( ):
-            processed_count += 1
-
-            # hold the name, url and group
-            stream_name = stream["stream_name"]
-            stream_url = stream["stream_url"]
-            
-            # Check includes first
-            is_included = any(
-                filter_rule["sf_type_id"] == 0 and 
-                KP_Filter._match_pattern( filter_rule["sf_filter"], stream_name )
-                for filter_rule in db_filters
-            )
-            
-            # if it's supposed to be included, add the stream and skip the excludes
-            if is_included:
-                filtered_streams[stream_id] = stream
-                included_count += 1
-                debug_print_sync(f"Stream '{stream_name}' INCLUDED by include filter")
-                continue
 
-            # Default exclusion flag
-            should_exclude = False
-
-            # loop the filters again
-            for filter_rule in db_filters:
-
-                # setup the type and value of the filters
-                filter_type = filter_rule["sf_type_id"]
-                filter_value = filter_rule["sf_filter"]
-                
-                # if we just need to check if the name contains a string
-                if filter_type == 1:
-
-                    # check if the lowercase filter is contained in the stream name
-                    if filter_value.lower( ) in stream_name.lower( ):
-                        should_exclude = True
-                        debug_print_sync(f"Stream '{stream_name}' EXCLUDED by contains filter: '{filter_value}'")
-                        break
-
-                # check the regex name or stream
-                elif filter_type in (2, 3): 
-
-                    # setup the target
-                    target = stream_name if filter_type == 2 else stream_url
-
-                    # search the name for the regular expression
-                    if KP_Filter._match_pattern( filter_value, target ):
-                        should_exclude = True
-                        debug_print_sync(f"Stream '{stream_name}' EXCLUDED by regex filter: '{filter_value}'")
-                        break
-            
-            # if the stream should NOT be included, add it to the return
-            if not should_exclude:
+            # if it passes the filters, keep it
+            if _compiled.check( stream["stream_name"], stream["stream_url"] ):
                 filtered_streams[stream_id] = stream
-            else:
-                excluded_count += 1
-        
-        debug_print_sync(f"Filtering completed: {processed_count} processed, {included_count} included, {excluded_count} excluded, {len(filtered_streams)} final")
-        
+
+        debug_print_sync(f"Filtering completed: {len(normalized_data)} processed, {len(normalized_data) - len(filtered_streams)} excluded, {len(filtered_streams)} final")
+
         # return the filtered streams
-        return filtered_streams
\ No newline at end of file
+        return filtered_streams
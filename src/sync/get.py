@@ -3,25 +3,39 @@
 # our necessary imports
 from common.common import KP_Common
 from utils.request import KP_Request
-import time, sys, re, urllib.parse
+from utils.timing import KP_Stage_Timer
+import time, sys, re, os, json, urllib.parse, threading
 from typing import Optional, Dict, Any, List, Union
 
 # Import debug utilities
 try:
-    from utils.debug import debug_print_sync, debug_print_request
+    from utils.debug import debug_print_sync, debug_trace_sync, debug_print_request
 except ImportError:
-    def debug_print_sync(msg): pass
-    def debug_print_request(msg): pass
+    def debug_print_sync(msg, *args): pass
+    def debug_trace_sync(msg, *args): pass
+    def debug_print_request(msg, *args): pass
 
 # our retriever class
 class KP_Get:
 
+    # keep http sessions open between fetches for long running processes: idle sessions by kind
+    keep_sessions = False
+    _sessions = { 'json': [], 'm3u': [] }
+    _sessions_lock = threading.Lock( )
+
+    # with --fixtures, read the payloads from this directory instead of the providers
+    fixtures = None
+
     # initialize the class   
     def __init__( self ):
 
         self.common = KP_Common( )
         self.last_request_time = 0
         self.min_request_interval = 1  # Conservative default delay (seconds)
+        self.total_streams = 0  # streams seen before filtering, on the last get_streams
+        self.timings = KP_Stage_Timer( )  # seconds spent per stage
+        self.bytes_fetched = 0  # response bytes downloaded
+        self.cancel = None  # the providers cancel token, checked before each request and between payloads
         
         debug_print_sync("KP_Get initialized")
 
@@ -32,7 +46,7 @@ class KP_Get:
         elapsed = time.time( ) - self.last_request_time
         if elapsed < self.min_request_interval:
             sleep_time = self.min_request_interval - elapsed
-            debug_print_request(f"Enforcing request delay: sleeping {sleep_time:.2f} seconds")
+            debug_print_request("Enforcing request delay: sleeping %.2f seconds", sleep_time)
             time.sleep( sleep_time )
 
         # set the last request time
@@ -55,25 +69,55 @@ class KP_Get:
             "Connection": "keep-alive"
         }
 
-        # Using context manager for automatic cleanup and error handling
-        with KP_Request( default_headers=headers ) as retriever:
+        # borrow an idle open session if we're keeping them, and hand it back after
+        if self.keep_sessions:
+            _kind = 'm3u' if is_m3u else 'json'
+            with KP_Get._sessions_lock:
+                retriever = KP_Get._sessions[_kind].pop( ) if KP_Get._sessions[_kind] else None
+            if retriever is None:
+                retriever = KP_Request( default_headers=headers )
             try:
-                if is_m3u:
-                    _data = retriever.get_text(endpoint)
-                    debug_print_request(f"Retrieved M3U content: {len(_data)} characters")
-                else:
-                    _data = retriever.get_json(endpoint)
-                    debug_print_request(f"Retrieved JSON data: {len(_data) if isinstance(_data, list) else 'dict'} items")
-
-            except Exception as e:
-                debug_print_request(f"Request failed for {endpoint}: {e}")
-                # Don't print error to console unless debug mode
-                pass
+                return self._fetch_with( retriever, endpoint, is_m3u, _data )
+            finally:
+                with KP_Get._sessions_lock:
+                    KP_Get._sessions[_kind].append( retriever )
 
+        # Using context manager for automatic cleanup and error handling
+        with KP_Request( default_headers=headers ) as retriever:
+            return self._fetch_with( retriever, endpoint, is_m3u, _data )
+
+    # fetch with a retriever, returning the default data on failure
+    def _fetch_with( self, retriever: KP_Request, endpoint: str, is_m3u: bool, _data: Union[Dict[str, Any], str] ) -> Union[Dict[str, Any], str]:
+
+        # the retriever may be a shared session, so count what this fetch reads
+        _bytes_before = retriever.bytes_read
+
+        # don't start a request once we're cancelled, and never wait on one past our deadline
+        _timeout = None
+        if self.cancel is not None:
+            self.cancel.check( )
+            _remaining = self.cancel.remaining( )
+            if _remaining is not None:
+                _timeout = max( 1.0, min( retriever.timeout, _remaining ) )
+
+        try:
+            if is_m3u:
+                _data = retriever.get_text(endpoint, timeout=_timeout)
+                debug_print_request(f"Retrieved M3U content: {len(_data)} characters")
+            else:
+                _data = retriever.get_json(endpoint, timeout=_timeout)
+                debug_print_request(f"Retrieved JSON data: {len(_data) if isinstance(_data, list) else 'dict'} items")
+
+        except Exception as e:
+            debug_print_request(f"Request failed for {endpoint}: {e}")
+            # Don't print error to console unless debug mode
+            pass
+
+        self.bytes_fetched += retriever.bytes_read - _bytes_before
         return _data
 
     # parse the m3u
-    def _parse_m3u(self, m3u_content: str, provider: Dict[str, Any]) -> Optional[Dict[str, Dict[str, Any]]]:
+    def _parse_m3u(self, m3u_content: str, provider: Dict[str, Any], filters=None, dropped: Optional[set] = None) -> Optional[Dict[str, Dict[str, Any]]]:
         if not m3u_content:
             debug_print_sync("M3U content is empty")
             return None
@@ -92,6 +136,7 @@ class KP_Get:
 
         current_stream = None
         processed_streams = 0
+        excluded_streams = 0
         
         for line in lines:
             line = line.strip()
@@ -107,6 +152,12 @@ class KP_Get:
                 if match:
                     duration, attrs, name = match.groups()
                     current_stream['name'] = name.strip()
+
+                    # check the name against the filters before parsing anything else
+                    if filters:
+                        current_stream['keep'] = filters.check_name(current_stream['name'])
+                        if current_stream['keep'] is False:
+                            continue
                     
                     # Handle case where attrs is None
                     attrs = attrs or ""
@@ -133,6 +184,18 @@ class KP_Get:
                         current_stream['stream_type'] = 3
                         
             elif current_stream is not None and line.startswith('http'):
+                # Generate stream_id
+                stream_id = re.sub(r'[^a-zA-Z0-9]', '', current_stream['name']).lower()
+
+                # if the filters excluded it, by name or by url, drop it and any earlier entry with the same id
+                if filters and (current_stream['keep'] is False or (current_stream['keep'] is None and not filters.check_url(line))):
+                    normalized.pop(stream_id, None)
+                    if dropped is not None:
+                        dropped.add(stream_id)
+                    excluded_streams += 1
+                    current_stream = None
+                    continue
+
                 # This is the stream URL for the current entry
                 current_stream['stream_url'] = line
 
@@ -140,9 +203,6 @@ class KP_Get:
                     current_stream['stream_type'] = 5
                 elif any(x in line for x in ['/movie/', '/movies/', '/vod/']):
                     current_stream['stream_type'] = 3
-
-                # Generate stream_id
-                stream_id = re.sub(r'[^a-zA-Z0-9]', '', current_stream['name']).lower()
                 
                 # Add to normalized data
                 normalized[stream_id] = {
@@ -162,23 +222,27 @@ class KP_Get:
                     normalized[stream_id]['stream_group'] = 'series'
                 elif normalized[stream_id]['stream_type'] == 3:
                     normalized[stream_id]['stream_group'] = 'vod'
+
+                # a later entry with the same id replaces an earlier excluded one
+                if dropped is not None:
+                    dropped.discard(stream_id)
                 
                 processed_streams += 1
                 # Reset for next entry
                 current_stream = None
         
-        debug_print_sync(f"M3U parsing completed: {processed_streams} streams processed")
+        debug_print_sync(f"M3U parsing completed: {processed_streams} streams processed, {excluded_streams} excluded by filters")
         return normalized or None
     
 
     # normalize the data
-    def _normalize_data( self, data: Union[List[Dict[str, Any]], str], data_type: str, provider: Dict[str, Any], ) -> Optional[Dict[str, Dict[str, Any]]]:
+    def _normalize_data( self, data: Union[List[Dict[str, Any]], str], data_type: str, provider: Dict[str, Any], filters=None, dropped: Optional[set] = None ) -> Optional[Dict[str, Dict[str, Any]]]:
         
         debug_print_sync(f"Normalizing {data_type} data")
         
         # Handle M3U data passed as string
         if isinstance(data, str):
-            return self._parse_m3u(data, provider)
+            return self._parse_m3u(data, provider, filters, dropped)
             
         # if there is no data, just return nothing
         if not data:
@@ -206,6 +270,7 @@ class KP_Get:
 
         processed_count = 0
         skipped_count = 0
+        excluded_count = 0
 
         # loop over each item
         for item in data:
@@ -221,6 +286,54 @@ class KP_Get:
                     skipped_count += 1
                     continue  # Skip invalid entries
 
+                # pull the required fields first, so invalid items are skipped before the filters see them
+                match data_type:
+
+                    # live streams
+                    case "live":
+                        cat_id = item["category_id"]
+                        epg_id = item["epg_channel_id"]
+
+                    # series and vod streams
+                    case "series" | "vod":
+                        cat_id = item["category_id"]
+                        epg_id = item.get( "tmdb", item["name"] )  # Default for missing TMDB
+                        is_adult = bool( item["is_adult"] ) if data_type == "vod" else False
+
+                    # invalid/unknown
+                    case _:
+                        skipped_count += 1
+                        continue  # Unknown type
+
+                # hold the stream name
+                stream_name = item["name"]
+
+                # check the name against the filters before building anything
+                _keep = filters.check_name( stream_name ) if filters else True
+
+                # setup the stream url
+                stream_url = None
+                if _keep is not False:
+                    stream_url = url_template % (
+                        provider["sp_domain"],
+                        provider["sp_username"],
+                        provider["sp_password"],
+                        stream_id,
+                        ext
+                    ) if provider.get('sp_stream_type', 0) != 1 else item.get('stream_url', '')
+
+                    # now that we know the url, check it
+                    if _keep is None:
+                        _keep = filters.check_url( stream_url )
+
+                # if it was excluded, drop it and any earlier item with the same id
+                if not _keep:
+                    normalized.pop( stream_id, None )
+                    if dropped is not None:
+                        dropped.add( stream_id )
+                    excluded_count += 1
+                    continue
+
                 # Use match-case for type-specific logic (Python 3.10+)
                 match data_type:
 
@@ -228,7 +341,6 @@ class KP_Get:
                     case "live":
 
                         # setup the stream name to check
-                        stream_name = item.get( "name", "").lower( )
                         stream_type = provider.get('sp_stream_type', 0)  # Use provider's stream type
                                                 
                         # Check for series pattern match
@@ -241,8 +353,8 @@ class KP_Get:
 
                         # setup the stream data
                         stream_data = {
-                            "cat_id": item["category_id"],
-                            "epg_id": item["epg_channel_id"],
+                            "cat_id": cat_id,
+                            "epg_id": epg_id,
                             "is_adult": bool( item.get( "is_adult", 0 ) ),
                             "stream_type": stream_type,
                             "stream_group": "live",
@@ -252,9 +364,9 @@ class KP_Get:
                     # series streams
                     case "series":
                         stream_data = {
-                            "cat_id": item["category_id"],
-                            "epg_id": item.get( "tmdb", item["name"] ),  # Default for missing TMDB
-                            "is_adult": False,
+                            "cat_id": cat_id,
+                            "epg_id": epg_id,
+                            "is_adult": is_adult,
                             "stream_type": 5,
                             "stream_group": "series",
                             "stream_icon": item.get( "cover", "https://cdn.kevp.us/tv/kptv-icon.svg" ),
@@ -263,117 +375,201 @@ class KP_Get:
                     # vod streams
                     case "vod":
                         stream_data = {
-                            "cat_id": item["category_id"],
-                            "epg_id": item.get( "tmdb", item["name"] ),
-                            "is_adult": bool( item["is_adult"] ),
+                            "cat_id": cat_id,
+                            "epg_id": epg_id,
+                            "is_adult": is_adult,
                             "stream_type": 3,
                             "stream_group": "vod",
                             "stream_icon": item.get( "stream_icon", "https://cdn.kevp.us/tv/kptv-icon.svg" ),
                         }
 
-                    # invalid/unknown
-                    case _:
-                        skipped_count += 1
-                        continue  # Unknown type
-
                 # Add universal fields
-                stream_data.update( {
-                    "stream_id": stream_id,
-                    "stream_name": item["name"],
-                    "stream_url": url_template % (
-                        provider["sp_domain"],
-                        provider["sp_username"],
-                        provider["sp_password"],
-                        stream_id,
-                        ext
-                    ) if provider.get('sp_stream_type', 0) != 1 else item.get('stream_url', ''),
-                } )
+                stream_data["stream_id"] = stream_id
+                stream_data["stream_name"] = stream_name
+                stream_data["stream_url"] = stream_url
                 
                 # setup the item
                 normalized[stream_id] = stream_data
                 processed_count += 1
 
+                # a later item with the same id replaces an earlier excluded one
+                if dropped is not None:
+                    dropped.discard( stream_id )
+
             # trap an error
             except (KeyError, TypeError) as e:
                 # Optional: Log the error for debugging
-                debug_print_sync(f"Error processing item: {e}")
+                debug_trace_sync("Error processing item: %s", e)
                 skipped_count += 1
                 continue
         
-        debug_print_sync(f"Normalization completed: {processed_count} processed, {skipped_count} skipped")
+        debug_print_sync(f"Normalization completed: {processed_count} processed, {skipped_count} skipped, {excluded_count} excluded by filters")
         # return the normalized data or nothing
         return normalized or None
 
-    # get the streams
-    def get_streams(self, provider):
+    # move the profiled filter time out of the parse time
+    def split_filter_time(self, stats):
 
-        debug_print_sync(f"Getting streams for provider: {provider['sp_name']}")
+        # only profiled sets know it
+        if not stats:
+            return
+
+        # move it
+        from sync.filter import KP_Filter_Stats
+        _elapsed = KP_Filter_Stats.elapsed(stats)
+        self.timings.add('filter', _elapsed)
+        self.timings.add('parse', -_elapsed)
+
+    # merge a batch of normalized streams into the combined set
+    def _merge_streams( self, combined: Dict[str, Dict[str, Any]], data: Optional[Dict[str, Dict[str, Any]]], batch_dropped: set, dropped: set ) -> None:
+
+        # anything the filters dropped replaces what came before it
+        for stream_id in batch_dropped:
+            combined.pop( stream_id, None )
+            dropped.add( stream_id )
+
+        # if we have data, add it
+        if data:
+            dropped.difference_update( data.keys( ) )
+            combined.update( data )
+
+    # fetch the raw payloads for a provider: yields (stream type, payload), one request at a time
+    def iter_payloads(self, provider):
 
-        # setup the combined data
-        combined = {}
-        
         # Check if provider uses M3U (sp_type == 1)
         if provider.get('sp_type') == 1:
             debug_print_sync("Provider uses M3U format")
+
+            # from the fixtures, if we have them
+            if self.fixtures:
+                yield 'm3u', self._fixture_fetch(provider, 'playlist.m3u', is_m3u=True)
+                return
+
+            # not once we're cancelled
+            if self.cancel is not None:
+                self.cancel.check()
+
             self._enforce_request_delay()
             try:
                 # Fetch the M3U content directly from sp_domain
                 m3u_url = provider['sp_domain']
-                m3u_content = self._safe_fetch(m3u_url, is_m3u=True)
-                m3u_data = self._parse_m3u(m3u_content, provider)
-                if m3u_data:
-                    combined.update(m3u_data)
-                    debug_print_sync(f"M3U data processed: {len(m3u_data)} streams")
+                yield 'm3u', self._safe_fetch(m3u_url, is_m3u=True)
             except Exception as e:
                 debug_print_sync(f"Failed to fetch M3U: {e}")
-        else:
-            debug_print_sync("Provider uses API format")
+            return
 
-            # Handle regular API endpoints
-            for stream_type in ['live', 'series']:
-                #for stream_type in ['live', 'series', 'vod']:
+        debug_print_sync("Provider uses API format")
 
-                # if we are only fetching live streams
-                if self.common.args.live and stream_type != 'live':
-                    debug_print_sync(f"Skipping {stream_type} streams (--live flag set)")
-                    continue
+        # Handle regular API endpoints
+        for stream_type in ['live', 'series']:
+            #for stream_type in ['live', 'series', 'vod']:
 
-                # if we are only fetching series streams
-                if self.common.args.series and stream_type != 'series':
-                    debug_print_sync(f"Skipping {stream_type} streams (--series flag set)")
-                    continue
+            # if we are only fetching live streams
+            if self.common.args.live and stream_type != 'live':
+                debug_print_sync(f"Skipping {stream_type} streams (--live flag set)")
+                continue
 
-                # if we are only fetching vod streams
-                if self.common.args.vod and stream_type != 'vod':
-                    debug_print_sync(f"Skipping {stream_type} streams (--vod flag set)")
-                    continue
-                
-                debug_print_sync(f"Fetching {stream_type} streams")
-                
-                # Enforce request delay
-                self._enforce_request_delay( )
-                
-                # Construct the API endpoint URL properly
-                endpoint = getattr(self.common, f"api_{stream_type}") % (
-                    provider['sp_domain'],
-                    provider['sp_username'],
-                    provider['sp_password']
-                )
-
-                # try to Fetch and normalize the data            
-                try:
-                    data = self._normalize_data(
-                        self._safe_fetch(endpoint), 
-                        stream_type, 
-                        provider
-                    )
-                    if data:
-                        combined.update(data)
-                        debug_print_sync(f"{stream_type.title()} streams processed: {len(data)} items")
-                
-                # Handle any exceptions during fetching
-                except Exception as e:
-                    debug_print_sync(f"Failed to fetch {stream_type} streams ({endpoint}): {e}")
+            # if we are only fetching series streams
+            if self.common.args.series and stream_type != 'series':
+                debug_print_sync(f"Skipping {stream_type} streams (--series flag set)")
+                continue
+
+            # if we are only fetching vod streams
+            if self.common.args.vod and stream_type != 'vod':
+                debug_print_sync(f"Skipping {stream_type} streams (--vod flag set)")
+                continue
+            
+            debug_print_sync(f"Fetching {stream_type} streams")
+
+            # from the fixtures, if we have them
+            if self.fixtures:
+                yield stream_type, self._fixture_fetch(provider, f"{stream_type}.json")
+                continue
+            
+            # not once we're cancelled
+            if self.cancel is not None:
+                self.cancel.check()
+
+            # Enforce request delay
+            self._enforce_request_delay( )
+            
+            # Construct the API endpoint URL properly
+            endpoint = getattr(self.common, f"api_{stream_type}") % (
+                provider['sp_domain'],
+                provider['sp_username'],
+                provider['sp_password']
+            )
+
+            # try to Fetch the data
+            try:
+                payload = self._safe_fetch(endpoint)
+            
+            # Handle any exceptions during fetching
+            except Exception as e:
+                debug_print_sync(f"Failed to fetch {stream_type} streams ({endpoint}): {e}")
+                continue
+
+            # hand it over
+            yield stream_type, payload
+
+    # read a payload from the fixtures: <fixtures>/<provider id>/<name>, empty if it isn't there
+    def _fixture_fetch(self, provider, name, is_m3u=False):
+
+        # setup the path
+        path = os.path.join(self.fixtures, str(provider['id']), name)
+        if not os.path.isfile(path):
+            debug_print_sync(f"No fixture at {path}, using an empty payload")
+            return "" if is_m3u else {}
+
+        debug_print_request(f"Reading {'M3U' if is_m3u else 'JSON'} fixture: {path}")
+
+        # read it, counting it like a download
+        with open(path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        self.bytes_fetched += len(data)
+        return data if is_m3u else json.loads(data)
+
+    # get the streams
+    def get_streams(self, provider, filters=None):
+
+        debug_print_sync(f"Getting streams for provider: {provider['sp_name']}")
+
+        # setup the combined data
+        combined = {}
+
+        # hold the stream ids the filters excluded, so we can still report the total
+        dropped = set()
+
+        # make sure we have a compiled filter set if we were handed raw filters
+        if filters and not hasattr(filters, 'check_name'):
+            from sync.filter import KP_Filter
+            filters = KP_Filter.compile_filters(filters)
+
+        # fetch each payload, then normalize and filter it
+        for stream_type, payload in self.timings.timed_iter('fetch', self.iter_payloads(provider)):
+
+            # stop between payloads once we're cancelled
+            if self.cancel is not None:
+                self.cancel.check()
+
+            # try to normalize the data
+            try:
+                batch_dropped = set()
+                with self.timings.stage('parse'):
+                    data = self._normalize_data(payload, stream_type, provider, filters, batch_dropped)
+                    self._merge_streams(combined, data, batch_dropped, dropped)
+                if data:
+                    debug_print_sync(f"{stream_type.title()} streams processed: {len(data)} items")
+
+            # Handle any exceptions during processing
+            except Exception as e:
+                debug_print_sync(f"Failed to process {stream_type} streams for {provider['sp_name']}: {e}")
+
+        # hold the total number of streams before filtering
+        self.total_streams = len(combined) + len(dropped)
+
+        # the filters run inside the parse, profiled sets can tell us how long they took
+        self.split_filter_time(filters.stats if filters else None)
         
-        debug_print_sync(f"Total streams retrieved: {len(combined)}")
+        debug_print_sync(f"Total streams retrieved: {len(combined)} ({len(dropped)} excluded by filters)")
         return combined
\ No newline at end of file
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import time
+import heapq
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, List, Iterable
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# how much the latest run counts towards a providers history, the rest is what it was
+SMOOTHING = 0.5
+
+# a providers default deadline: this many times what it usually takes, and never less than the floor in seconds
+DEADLINE_FACTOR = 5.0
+DEADLINE_FLOOR = 300.0
+
+# our local history of each providers runtime and stream count
+class KP_History_Store:
+
+    # where it lives, unless the config says otherwise
+    DEFAULT_PATH = os.path.join( '~', '.cache', 'kptv', 'history.sqlite3' )
+
+    # open the store
+    def __init__( self, path: Optional[str] = None, timeout: float = 10.0 ):
+
+        # setup the internal variables
+        self.path = os.path.abspath( os.path.expanduser( path or self.DEFAULT_PATH ) )
+        self.timeout = timeout
+        self._local = threading.local( )
+
+        # make sure the directory and table are there
+        os.makedirs( os.path.dirname( self.path ), exist_ok=True )
+        self._connection( ).execute( "CREATE TABLE IF NOT EXISTS provider_history ( p_id INTEGER PRIMARY KEY, runs INTEGER NOT NULL, seconds REAL NOT NULL, streams REAL NOT NULL, updated REAL NOT NULL )" )
+
+    # get the store using the configured path
+    @classmethod
+    def from_config( cls ) -> 'KP_History_Store':
+
+        # try to read the path, the default is fine if we can't
+        try:
+            from config.config import get_history_path
+            _path = get_history_path( )
+        except Exception:
+            _path = None
+        return cls( _path )
+
+    # get this threads connection
+    def _connection( self ) -> sqlite3.Connection:
+
+        # if we already have one, return it
+        _cnx = getattr( self._local, 'cnx', None )
+        if _cnx is not None:
+            return _cnx
+
+        # open it in WAL mode, so other processes can read while we write
+        _cnx = sqlite3.connect( self.path, timeout=self.timeout )
+        _cnx.execute( "PRAGMA journal_mode=WAL" )
+        _cnx.execute( "PRAGMA synchronous=NORMAL" )
+        self._local.cnx = _cnx
+        return _cnx
+
+    # load the providers history: p_id -> { runs, seconds, streams }
+    def load( self, p_ids: Iterable[int] ) -> Dict[int, Dict[str, float]]:
+
+        # setup the ids, sqlite only takes so many parameters at once
+        _ids = list( p_ids )
+        _history = {}
+        for i in range( 0, len( _ids ), 500 ):
+            _chunk = _ids[i:i + 500]
+            for p_id, runs, seconds, streams in self._connection( ).execute( f"SELECT p_id, runs, seconds, streams FROM provider_history WHERE p_id IN ( {','.join( '?' * len( _chunk ) )} )", _chunk ):
+                _history[p_id] = { 'runs': runs, 'seconds': seconds, 'streams': streams }
+
+        # return it
+        return _history
+
+    # fold runs into the history: p_id -> ( seconds, streams )
+    def save( self, runs: Dict[int, tuple] ) -> None:
+
+        # in one transaction, smoothing each into what we had
+        _cnx = self._connection( )
+        _now = time.time( )
+        with _cnx:
+            _cnx.executemany( "INSERT INTO provider_history ( p_id, runs, seconds, streams, updated ) VALUES ( ?, 1, ?, ?, ? ) "
+                "ON CONFLICT ( p_id ) DO UPDATE SET runs = runs + 1, seconds = seconds * ( 1 - ? ) + excluded.seconds * ?, streams = streams * ( 1 - ? ) + excluded.streams * ?, updated = excluded.updated",
+                ( ( p_id, seconds, streams, _now, SMOOTHING, SMOOTHING, SMOOTHING, SMOOTHING ) for p_id, ( seconds, streams ) in runs.items( ) ) )
+
+# our per run largest first scheduler: orders the providers by their predicted runtime, and records the actual ones
+class KP_Provider_History:
+
+    # fire us up
+    def __init__( self, store: Optional[KP_History_Store] = None ):
+
+        # setup the internal variables
+        self.store = store
+        self.predicted: Dict[int, float] = {}
+        self.history: Dict[int, Dict[str, float]] = {}
+        self.known = 0
+        self._pending = {}
+        self._lock = threading.Lock( )
+
+    # get the history using the configured store, without one we keep the order we're given
+    @classmethod
+    def from_config( cls ) -> 'KP_Provider_History':
+
+        # try to open the store
+        try:
+            return cls( KP_History_Store.from_config( ) )
+        except Exception as e:
+            debug_print_sync(f"Provider history unavailable: {e}")
+            return cls( )
+
+    # order the providers longest first: those we've never seen get the average, so they neither lead nor trail
+    def order( self, providers: List[Dict[str, Any]] ) -> List[Dict[str, Any]]:
+
+        # load what we know
+        try:
+            _history = self.store.load( prov['id'] for prov in providers ) if self.store is not None else {}
+        except Exception as e:
+            debug_print_sync(f"Failed to load the provider history: {e}")
+            _history = {}
+
+        # predict each one
+        self.history = _history
+        self.known = len( _history )
+        _average = sum( record['seconds'] for record in _history.values( ) ) / len( _history ) if _history else 0.0
+        self.predicted = { prov['id']: _history[prov['id']]['seconds'] if prov['id'] in _history else _average for prov in providers }
+
+        # nothing to go on, keep the order we were given
+        if not _history:
+            return list( providers )
+
+        # the longest first, ties keep their order
+        _ordered = sorted( providers, key=lambda prov: self.predicted[prov['id']], reverse=True )
+
+        debug_print_sync(f"Schedule: {self.known} of {len(providers)} providers have history, longest first: " + ", ".join( f"{prov['sp_name']} ({self.predicted[prov['id']]:.1f}s)" for prov in _ordered[:5] ))
+
+        # return them
+        return _ordered
+
+    # the predicted runtime for a provider, None if we had nothing to go on
+    def predicted_for( self, p_id: int ) -> Optional[float]:
+        return self.predicted.get( p_id ) if self.known else None
+
+    # a providers default deadline from its history, None if we've never seen it finish
+    def deadline_for( self, p_id: int, factor: float = DEADLINE_FACTOR, floor: float = DEADLINE_FLOOR ) -> Optional[float]:
+        _record = self.history.get( p_id )
+        return max( floor, _record['seconds'] * factor ) if _record else None
+
+    # how long the ordered providers should take on so many workers, each taking the next as it frees up
+    def makespan( self, providers: List[Dict[str, Any]], workers: int ) -> float:
+
+        # each workers finish time
+        _workers = [0.0] * max( 1, min( workers, len( providers ) ) )
+        for prov in providers:
+            heapq.heapreplace( _workers, _workers[0] + self.predicted.get( prov['id'], 0.0 ) )
+
+        # the last one to finish
+        return max( _workers )
+
+    # remember a providers runtime and stream count
+    def record( self, p_id: int, seconds: float, streams: int ) -> None:
+        with self._lock:
+            self._pending[p_id] = ( seconds, streams )
+
+    # save the recorded runs
+    def commit( self ) -> None:
+
+        # grab what's pending
+        with self._lock:
+            _pending, self._pending = self._pending, {}
+
+        # save them
+        if self.store is not None and _pending:
+            self.store.save( _pending )
+
+        debug_print_sync(f"Provider history saved for {len(_pending)} providers")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import json
+import time
+from typing import Optional, Dict, Any, List
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# the cache counters we export as metrics
+CACHE_METRICS = ( 'entries', 'hits', 'misses', 'expirations', 'evictions', 'hit_ratio', 'loads', 'load_errors', 'load_time' )
+
+# the provider memory counts we export as metrics, when they were measured
+PROVIDER_MEMORY_METRICS = (
+    ( 'rss_peak', 'Peak process RSS while the provider ran.' ),
+    ( 'rss_growth', 'How far the process RSS grew while the provider ran.' ),
+    ( 'traced_peak', 'Peak tracemalloc traced memory while the provider ran.' ),
+)
+
+# escape a prometheus label value
+def _label( value: Any ) -> str:
+    return str( value ).replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '\n', '\\n' )
+
+# our machine readable run report
+class KP_Run_Report:
+
+    # fire us up
+    def __init__( self, action: str, started: Optional[float] = None ):
+
+        # setup the internal variables
+        self.action = action
+        self.started = started or time.time( )
+        self.providers: List[Dict[str, Any]] = []
+        self.summary: Dict[str, Any] = {}
+        self.final_timings: Dict[str, float] = {}
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self.filters: Optional[List[Dict[str, Any]]] = None
+        self.extra: Dict[str, Any] = {}
+
+    # add a providers sync result
+    def add_provider( self, total: int, filtered: int, name: str, error: Optional[str], timings: Optional[Dict[str, float]] = None, counts: Optional[Dict[str, int]] = None ) -> None:
+
+        # the counts we always have
+        _provider = {
+            'name': name,
+            'streams_total': total,
+            'streams_kept': filtered,
+            'error': error,
+            'timings': { stage: round( seconds, 6 ) for stage, seconds in ( timings or {} ).items( ) },
+            'bytes_fetched': 0,
+            'rows_written': 0,
+        }
+
+        # plus whatever else was counted
+        _provider.update( counts or {} )
+        self.providers.append( _provider )
+
+    # finish the report
+    def finish( self, elapsed: float, has_errors: bool, **summary ) -> None:
+        self.summary = { 'elapsed': round( elapsed, 6 ), 'success': not has_errors }
+        self.summary.update( summary )
+
+    # the report as a dict
+    def to_dict( self ) -> Dict[str, Any]:
+
+        # setup the report
+        _report = {
+            'action': self.action,
+            'started': time.strftime( '%Y-%m-%dT%H:%M:%S', time.localtime( self.started ) ),
+            'timestamp': round( self.started, 3 ),
+            'summary': self.summary,
+        }
+
+        # only what this run has
+        if self.providers:
+            _report['providers'] = self.providers
+        if self.final_timings:
+            _report['final_timings'] = { stage: round( seconds, 6 ) for stage, seconds in self.final_timings.items( ) }
+        if self.caches:
+            _report['caches'] = self.caches
+        if self.filters is not None:
+            _report['filters'] = self.filters
+        _report.update( self.extra )
+
+        # return it
+        return _report
+
+    # write the report to a json file
+    def write_json( self, filename: str ) -> None:
+
+        # dump it out
+        with open( filename, 'w', encoding='utf-8' ) as f:
+            json.dump( self.to_dict( ), f, indent=2, default=str )
+
+        debug_print_sync(f"Run report written to: {filename}")
+
+    # the report as prometheus text format lines
+    def metrics( self ) -> List[str]:
+
+        # hold the metrics in the order we first see them: name -> ( help, samples ), the format wants each ones samples together
+        _metrics = {}
+
+        # add a sample
+        def _sample( name: str, value: Any, help_text: str, **labels ) -> None:
+            _labels = ",".join( f'{key}="{_label( val )}"' for key, val in labels.items( ) )
+            _metrics.setdefault( name, ( help_text, [] ) )[1].append( f"{name}{{{_labels}}} {float( value )!r}" )
+
+        # the run
+        _action = self.action
+        _sample( 'kptv_run_timestamp_seconds', self.started, 'When the run started.', action=_action )
+        _sample( 'kptv_run_duration_seconds', self.summary.get( 'elapsed', 0 ), 'How long the run took.', action=_action )
+        _sample( 'kptv_run_success', 1 if self.summary.get( 'success' ) else 0, 'Whether the run finished without errors.', action=_action )
+
+        # any other numeric summary values
+        for key, value in sorted( self.summary.items( ) ):
+            if key not in ( 'elapsed', 'success' ) and isinstance( value, ( int, float ) ) and not isinstance( value, bool ):
+                _sample( f'kptv_run_{key}', value, f'Run {key.replace( "_", " " )}.', action=_action )
+
+        # each provider, by id as well as name: names needn't be unique
+        for prov in self.providers:
+            _prov_labels = { 'action': _action, 'provider': prov['name'], 'p_id': prov.get( 'p_id', '' ) }
+            _sample( 'kptv_provider_streams_total', prov['streams_total'], 'Streams the provider returned, before filtering.', **_prov_labels )
+            _sample( 'kptv_provider_streams_kept', prov['streams_kept'], 'Streams left after filtering.', **_prov_labels )
+            _sample( 'kptv_provider_rows_written', prov['rows_written'], 'Rows written to the staging table.', **_prov_labels )
+            _sample( 'kptv_provider_bytes_fetched', prov['bytes_fetched'], 'Bytes downloaded from the provider.', **_prov_labels )
+            _sample( 'kptv_provider_error', 1 if prov['error'] else 0, 'Whether the provider failed.', **_prov_labels )
+            _sample( 'kptv_provider_timed_out', prov.get( 'timed_out', 0 ), 'Whether the provider ran past its deadline.', **_prov_labels )
+            if 'predicted_seconds' in prov:
+                _sample( 'kptv_provider_predicted_seconds', prov['predicted_seconds'], 'Seconds the provider was predicted to take, from its history.', **_prov_labels )
+            for metric, help_text in PROVIDER_MEMORY_METRICS:
+                if metric in prov:
+                    _sample( f'kptv_provider_{metric}_bytes', prov[metric], help_text, **_prov_labels )
+            for stage, seconds in prov['timings'].items( ):
+                _sample( 'kptv_provider_stage_seconds', seconds, 'Seconds the provider spent per stage.', **_prov_labels, stage=stage )
+
+        # the final database operations
+        for stage, seconds in self.final_timings.items( ):
+            _sample( 'kptv_final_stage_seconds', seconds, 'Seconds spent in the final database operations.', action=_action, stage=stage )
+
+        # the caches
+        for namespace, stats in sorted( self.caches.items( ) ):
+            for metric in CACHE_METRICS:
+                if metric in stats:
+                    _sample( f'kptv_cache_{metric}', stats[metric], f'Cache {metric.replace( "_", " " )}.', action=_action, namespace=namespace )
+
+        # describe each metric, then its samples
+        lines = []
+        for name, ( help_text, samples ) in _metrics.items( ):
+            lines.append( f"# HELP {name} {help_text}" )
+            lines.append( f"# TYPE {name} gauge" )
+            lines.extend( samples )
+
+        # return them
+        return lines
+
+    # write the metrics for the node_exporter textfile collector
+    def write_prometheus( self, filename: str ) -> None:
+
+        # write it next to the target, then move it in place so the collector never reads half a file
+        _tmp = f"{filename}.{os.getpid( )}.tmp"
+        with open( _tmp, 'w', encoding='utf-8' ) as f:
+            f.write( "\n".join( self.metrics( ) ) + "\n" )
+        os.replace( _tmp, filename )
+
+        debug_print_sync(f"Run metrics written to: {filename}")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# our refresh period aware provider schedule
+class KP_Schedule:
+
+    # what a unit of sp_refresh_period is, in seconds
+    UNITS = { 'minutes': 60, 'hours': 3600, 'days': 86400 }
+    DEFAULT_UNIT = 'hours'
+
+    # fire us up
+    def __init__( self, unit: Optional[str] = None ):
+
+        # setup the period unit
+        self.unit = unit if unit in self.UNITS else self.DEFAULT_UNIT
+        self.unit_seconds = self.UNITS[self.unit]
+
+    # get the schedule using the configured unit
+    @classmethod
+    def from_config( cls ) -> 'KP_Schedule':
+
+        # try to read it, the default is fine if we can't
+        try:
+            from config.config import get_config
+            return cls( get_config( ).get( 'refresh_period_unit' ) )
+        except Exception:
+            return cls( )
+
+    # get a providers refresh period, None if it doesn't have one
+    def period( self, provider: Dict[str, Any] ) -> Optional[timedelta]:
+
+        # no period, or a bad one, means every run
+        try:
+            _period = float( provider.get( 'sp_refresh_period' ) or 0 )
+        except ( TypeError, ValueError ):
+            return None
+        return timedelta( seconds=_period * self.unit_seconds ) if _period > 0 else None
+
+    # get a providers last sync, None if it never synced
+    @staticmethod
+    def last_synced( provider: Dict[str, Any] ) -> Optional[datetime]:
+
+        # setup the value
+        _last = provider.get( 'sp_last_synced' )
+
+        # it's normally already a datetime
+        if isinstance( _last, datetime ) or _last is None:
+            return _last
+
+        # otherwise try to parse it
+        try:
+            return datetime.fromisoformat( str( _last ) )
+        except ValueError:
+            return None
+
+    # when is the provider next due, None if it's due now
+    def next_due( self, provider: Dict[str, Any] ) -> Optional[datetime]:
+
+        # never synced, or no period: it's due
+        _last = self.last_synced( provider )
+        _period = self.period( provider )
+        if _last is None or _period is None:
+            return None
+
+        # otherwise its last sync plus the period
+        return _last + _period
+
+    # is the provider due
+    def is_due( self, provider: Dict[str, Any], now: Optional[datetime] = None ) -> bool:
+        _next = self.next_due( provider )
+        return _next is None or _next <= ( now or datetime.now( ) )
+
+    # how long the provider has been waiting since it was due, in seconds
+    def staleness( self, provider: Dict[str, Any], now: Optional[datetime] = None ) -> float:
+
+        # never synced is the stalest there is
+        _last = self.last_synced( provider )
+        if _last is None:
+            return float( 'inf' )
+
+        # otherwise how far past due it is
+        _now = now or datetime.now( )
+        _next = self.next_due( provider ) or _last
+        return ( _now - _next ).total_seconds( )
+
+    # get the providers that are due, stalest first
+    def due( self, providers: List[Dict[str, Any]], now: Optional[datetime] = None, force: bool = False ) -> List[Dict[str, Any]]:
+
+        # setup the time
+        _now = now or datetime.now( )
+
+        # everyone when forced, otherwise only those due
+        _due = list( providers ) if force else [prov for prov in providers if self.is_due( prov, _now )]
+
+        debug_print_sync(f"Schedule: {len(_due)} of {len(providers)} providers due (period unit: {self.unit}, forced: {force})")
+
+        # return them, stalest first
+        return sorted( _due, key=lambda prov: self.staleness( prov, _now ), reverse=True )
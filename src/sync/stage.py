@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Optional, Dict, Any, List, Tuple
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print_sync
+except ImportError:
+    def debug_print_sync(msg, *args): pass
+
+# the converted row fields a worker hands back, after the stream id
+ROW_FIELDS = ( 's_orig_name', 's_stream_uri', 's_type_id', 's_tvg_id', 's_tvg_logo', 's_group' )
+
+# the per process state: our retriever, and the compiled filter sets keyed by their rows
+_getter = None
+_compiled = {}
+
+# get this processes retriever, only its parsers are used
+def _get_getter( ):
+
+    # create it once per process
+    global _getter
+    if _getter is None:
+        from sync.get import KP_Get
+        _getter = KP_Get( )
+
+    # return it
+    return _getter
+
+# get a compiled filter set for the rows, compiled once per process
+def _get_filters( db_filters: List[Dict[str, Any]], profile: bool ):
+
+    from sync.filter import KP_Filter
+
+    # profiled sets carry this chunks stats, so they are never shared
+    if profile:
+        return KP_Filter.compile_filters( db_filters, True )
+
+    # key it on the rows themselves, so changed filters get recompiled
+    _key = tuple( ( f.get( 'id' ), f['sf_type_id'], f['sf_filter'] ) for f in db_filters )
+    _filters = _compiled.get( _key )
+    if _filters is None:
+
+        # keep it bounded
+        if len( _compiled ) >= 256:
+            _compiled.clear( )
+        _filters = _compiled[_key] = KP_Filter.compile_filters( db_filters )
+
+    # return them
+    return _filters
+
+# parse, filter and convert a chunk of payload: runs in a worker process
+def stage_chunk( chunk: Any, stream_type: str, provider: Dict[str, Any], db_filters: Optional[List[Dict[str, Any]]], profile: bool = False ) -> Tuple[List[tuple], List[str], Optional[dict], float]:
+
+    # setup the timer and the filters
+    _start = time.perf_counter( )
+    filters = _get_filters( db_filters, profile ) if db_filters else None
+
+    # parse and filter it, a payload we can't parse is skipped like the threads skip it
+    dropped = set( )
+    try:
+        data = _get_getter( )._normalize_data( chunk, stream_type, provider, filters, dropped )
+    except Exception as e:
+        debug_print_sync(f"Failed to process {stream_type} streams for {provider['sp_name']}: {e}")
+        return [], [], None, time.perf_counter( ) - _start
+
+    # hand back compact rows: ( stream id, *ROW_FIELDS )
+    rows = [( stream_id, stream['stream_name'], stream['stream_url'], stream['stream_type'], stream['epg_id'], stream['stream_icon'], stream['stream_group'] )
+            for stream_id, stream in ( data or {} ).items( )]
+
+    # return the rows, what the filters dropped, the stats if we profiled, and how long it took
+    return rows, list( dropped ), ( filters.stats if profile and filters else None ), time.perf_counter( ) - _start
+
+# split a payload into chunks the workers can parse on their own
+def split_payload( payload: Any, chunk_size: int ) -> List[Any]:
+
+    # nothing to split
+    if not payload:
+        return []
+
+    # api payloads are lists of items
+    if isinstance( payload, list ):
+        return [payload[i:i + chunk_size] for i in range( 0, len( payload ), chunk_size )]
+
+    # m3u payloads split on #EXTINF lines, so each entry stays with its url
+    if isinstance( payload, str ):
+
+        # hold the chunks
+        chunks = []
+        lines = payload.splitlines( )
+        start = 0
+        entries = 0
+
+        # loop the lines
+        for idx, line in enumerate( lines ):
+            if line.lstrip( ).startswith( '#EXTINF:' ):
+                if entries >= chunk_size:
+                    chunks.append( "\n".join( lines[start:idx] ) )
+                    start = idx
+                    entries = 0
+                entries += 1
+
+        # the rest
+        chunks.append( "\n".join( lines[start:] ) )
+        return chunks
+
+    # anything else goes as it is, and the worker skips it if it can't parse it
+    return [payload]
+
+# our process pool for the cpu bound stages
+class KP_Stage_Pool:
+
+    # fire up the pool
+    def __init__( self, workers: Optional[int] = None, chunk_size: int = 5000 ):
+
+        # setup the internal variables
+        self.workers = max( 1, int( workers or os.cpu_count( ) or 1 ) )
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor( max_workers=self.workers, mp_context=self.context( ) )
+
+        debug_print_sync(f"Stage pool started with {self.workers} processes, {chunk_size} items per chunk")
+
+    # how the workers are started: never a plain fork, the workers start from provider threads once the debug writer,
+    # sqlite connections and http sessions already exist, and a forked child can inherit a lock some other thread held
+    @staticmethod
+    def context( ):
+        return multiprocessing.get_context( "forkserver" if "forkserver" in multiprocessing.get_all_start_methods( ) else "spawn" )
+
+    # queue a payloads chunks: returns their futures, in order
+    def submit( self, stream_type: str, payload: Any, provider: Dict[str, Any], db_filters: Optional[List[Dict[str, Any]]], profile: bool = False ) -> list:
+        return [self._executor.submit( stage_chunk, chunk, stream_type, provider, db_filters, profile ) for chunk in split_payload( payload, self.chunk_size )]
+
+    # merge chunk results in order: returns ( rows by stream id, total streams, filter stats, worker seconds )
+    @staticmethod
+    def merge( results ) -> Tuple[Dict[str, tuple], int, List[dict], float]:
+
+        # hold the combined rows and what the filters dropped
+        combined = {}
+        dropped = set( )
+        stats = []
+        elapsed = 0.0
+
+        # a later chunk decides for a stream id, like one long payload would
+        for rows, chunk_dropped, chunk_stats, chunk_elapsed in results:
+            elapsed += chunk_elapsed
+            for stream_id in chunk_dropped:
+                combined.pop( stream_id, None )
+                dropped.add( stream_id )
+            for row in rows:
+                combined[row[0]] = row
+                dropped.discard( row[0] )
+            if chunk_stats:
+                stats.append( chunk_stats )
+
+        # return them, with the total before filtering
+        return combined, len( combined ) + len( dropped ), stats, elapsed
+
+    # wait on a chunk, checking the cancel token while we do
+    @staticmethod
+    def _result( future, cancel=None, interval: float = 0.5 ):
+
+        # nothing to check, just wait
+        if cancel is None:
+            return future.result( )
+
+        # otherwise in slices
+        while True:
+            cancel.check( )
+            try:
+                return future.result( timeout=interval )
+            except FuturesTimeout:
+                continue
+
+    # process a providers payloads: returns ( rows by stream id, total streams, filter stats, worker seconds )
+    # with a cancel token, it's checked between payloads and chunks, and the chunks still queued are dropped once it's cancelled
+    def process( self, provider: Dict[str, Any], payloads, db_filters: Optional[List[Dict[str, Any]]], profile: bool = False, cancel=None ) -> Tuple[Dict[str, tuple], int, List[dict], float]:
+
+        # queue every chunk as its payload arrives, so parsing overlaps the next fetch
+        futures = []
+        try:
+            for stream_type, payload in payloads:
+                if cancel is not None:
+                    cancel.check( )
+                futures.extend( self.submit( stream_type, payload, provider, db_filters, profile ) )
+
+            # merge them in order
+            combined, total, stats, elapsed = self.merge( self._result( future, cancel ) for future in futures )
+
+        # cancelled, or failed: don't leave the rest of our chunks for the workers
+        except BaseException:
+            for future in futures:
+                future.cancel( )
+            raise
+
+        debug_print_sync(f"Staged {len(futures)} chunks for {provider['sp_name']}: {len(combined)} streams, {total - len(combined)} excluded by filters")
+
+        # return them
+        return combined, total, stats, elapsed
+
+    # shut the pool down
+    def shutdown( self ) -> None:
+        self._executor.shutdown( wait=True )
+
+    # context manager
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        self.shutdown( )
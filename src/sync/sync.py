@@ -3,7 +3,7 @@
 import sys
 import os
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 import threading
 import time
 from datetime import datetime
@@ -11,9 +11,13 @@ from collections import defaultdict
 
 # Import debug utilities
 try:
-    from utils.debug import debug_print_sync
+    from utils.debug import debug_print_sync, debug_trace_sync
 except ImportError:
-    def debug_print_sync(msg): pass
+    def debug_print_sync(msg, *args): pass
+    def debug_trace_sync(msg, *args): pass
+
+# our cooperative cancellation
+from utils.cancel import KP_Cancel_Token, KP_Cancelled
 
 # our sync class
 class KP_Sync:
@@ -34,23 +38,68 @@ class KP_Sync:
         
         debug_print_sync(f"Using {self.max_threads} threads for sync operations")
         
-        # Initialize components
-        from utils.cache import KP_Cache
-        _cache = KP_Cache( )
-
-        # clear our cache
-        debug_print_sync("Clearing cache")
-        _cache.clear( )
-        del _cache
+        # setup the shared caches, they live for the whole process
+        from utils.cache import KP_Cache_Registry
+        self._caches = KP_Cache_Registry.instance( )
 
-        # setup the internal sync data
-        from sync.data import KP_Sync_Data
-        self._data = KP_Sync_Data( )
+        # back them with the on disk tier, so cron runs don't start cold
+        if not getattr( self.common.args, 'no_disk_cache', False ) and self._caches.disk is None:
+            try:
+                from config.config import get_cache_path
+                _cache_path = get_cache_path( )
+            except Exception:
+                _cache_path = None
+            self._caches.enable_disk( _cache_path )
+
+        # setup the internal sync data, --dry-run swaps in one that sends the rows to a sink and never writes to the database
+        self._dry_run = getattr( self.common.args, 'dry_run', None )
+        if self._dry_run:
+            from sync.dryrun import KP_Dry_Run_Data, open_sink
+            from sync.get import KP_Get
+            _fixtures = getattr( self.common.args, 'fixtures', None )
+            KP_Get.fixtures = _fixtures
+            self._data = KP_Dry_Run_Data( open_sink( self._dry_run, getattr( self.common.args, 'output', None ), datetime.now( ).strftime( '%Y%m%d_%H%M%S' ) ), _fixtures )
+        else:
+            if getattr( self.common.args, 'fixtures', None ):
+                self.common.kp_print( "warn", "--fixtures only applies with --dry-run, ignoring it" )
+            from sync.data import KP_Sync_Data
+            self._data = KP_Sync_Data( )
 
         # setup the thread locks
         self._thread_lock = threading.Lock( )
         self._db_lock = threading.Lock( )
 
+        # setup the per filter profiling, on for --debug or --filter-stats
+        from sync.filter import KP_Filter_Stats
+        self._profile_filters = bool( getattr( self.common.args, 'debug', False ) or getattr( self.common.args, 'filter_stats', False ) )
+        self._filter_stats = KP_Filter_Stats( )
+
+        # the worker process pool for --processes, only while syncing
+        self._stage_pool = None
+
+        # the delta tracker for --delta, only while syncing
+        self._delta = None
+
+        # the provider runtime history, loaded when syncing to order the providers longest first
+        from sync.history import KP_Provider_History
+        self._history = KP_Provider_History( )
+        self._schedule = None
+
+        # the cluster round for --cluster, only while syncing
+        self._cluster = None
+
+        # the runs checkpoints, each provider is recorded once it's staged so --resume can skip it
+        self._checkpoints = None
+        self._skipped = []
+
+        # the runs cancel token: each provider gets a child with its own deadline, an interrupt or the run deadline cancels them all
+        self._cancel = KP_Cancel_Token( )
+
+        # the memory monitor, holding new providers back while over the --memory-budget in MiB
+        from utils.memory import KP_Memory_Monitor
+        _budget = getattr( self.common.args, 'memory_budget', None )
+        self._memory = KP_Memory_Monitor( int( _budget * 1048576 ) if _budget else None )
+
         debug_print_sync("KP_Sync initialization completed")
 
     # our main public sync function
@@ -66,77 +115,185 @@ class KP_Sync:
 
         debug_print_sync(f"Found {len(_providers)} providers to process")
 
+        # only sync the providers whose refresh period has passed, stalest first
+        # --force, asking for a specific provider, or a dry run, syncs regardless
+        from sync.schedule import KP_Schedule
+        _force = bool( getattr( self.common.args, 'force', False ) or self.common.args.provider or self._dry_run )
+        _all_count = len( _providers )
+        _providers = KP_Schedule.from_config( ).due( _providers, force=_force )
+        if not _providers:
+
+            # an unfinished run being resumed still has its final operations to run
+            from sync.checkpoint import KP_Checkpoints
+            if not ( getattr( self.common.args, 'resume', False ) and not self._dry_run and KP_Checkpoints.from_config( ).pending( ) ):
+                self.common.kp_print( "info", f"No providers are due for a sync ({_all_count} checked, use --force to sync anyway)" )
+                return
+
         # Show initial sync message
         self.common.kp_print_line( )
-        self.common.kp_print( "info", "STARTING PROVIDER SYNC" )
+        self.common.kp_print( "info", "STARTING PROVIDER SYNC" + ( f" (DRY RUN: rows go to the {self._dry_run} sink)" if self._dry_run else "" ) )
         self.common.kp_print( "info", "Providers to process:" )
         for prov in _providers:
             self.common.kp_print( "info", f"- {prov['sp_name']}" )
+        if len( _providers ) < _all_count:
+            self.common.kp_print( "info", f"Skipping {_all_count - len( _providers )} providers that are not due yet" )
         self.common.kp_print_line( )
 
-        # hold our start time
+        # sync them
+        self.sync_providers( _providers )
+
+    # sync a list of providers, then run the final database operations and show the summary
+    def sync_providers( self, _providers ):
+
+        # hold our start time, the run deadline starts now
         start_time = time.time( )
+        self._cancel = KP_Cancel_Token( getattr( self.common.args, 'run_timeout', 3600 ), "run" )
+
+        # each run gets its own filter stats
+        from sync.filter import KP_Filter_Stats
+        self._filter_stats = KP_Filter_Stats( )
+
+        # load and compile everyones filters up front, so the workers never query for them
+        self._preload_filters( _providers )
+
+        # run the longest providers first, so the big ones don't start last and hold up the tail
+        from sync.history import KP_Provider_History
+        self._history = KP_Provider_History.from_config( )
+        _providers = self._history.order( _providers )
+
+        # a dry run never joins a cluster: it would claim the real rounds providers, mark them done and could close it
+        _cluster = getattr( self.common.args, 'cluster', None )
+        if _cluster and self._dry_run:
+            self.common.kp_print( "warn", "--cluster does not apply to --dry-run, ignoring it" )
+            self.common.args.cluster = _cluster = None
+
+        # checkpoint the providers as they're staged, resuming the last unfinished run skips those it already staged
+        _providers = self._start_checkpoints( _providers )
+
+        # with --cluster, this node claims providers off the clusters shared round instead of running its own list
+        if _cluster:
+            self._cluster = self._join_cluster( _cluster, _providers )
+            if self._cluster is None:
+                return
+
+        # setup the delta tracking, the skipped providers were staged by the run we resumed
+        self._setup_delta( _providers + self._skipped )
+        if self._delta is not None and self._skipped:
+            self._delta.store.forget( [prov['id'] for prov in self._skipped] )
+
+        # setup the engine, a cluster round is claimed from threads
+        _async = getattr( self.common.args, 'engine', 'thread' ) == 'async'
+        if _async and self._cluster is not None:
+            self.common.kp_print( "warn", "--cluster claims providers on the thread engine, ignoring --engine async" )
+            _async = False
+        _workers = ( getattr( self.common.args, 'concurrency', None ) or 64 ) if _async else self.max_threads
+        self._schedule = { 'workers': min( _workers, len( _providers ) ), 'known': self._history.known, 'predicted': self._history.makespan( _providers, _workers ) if self._history.known and self._cluster is None else None, 'actual': 0.0 }
+
+        # sample the memory while the providers run
+        self._memory.held = 0
+        self._memory.peak_rss = self._memory.sample( )
+        self._memory.start( )
 
         # setup the results and error internals
         results = []
         has_errors = False
+
+        # the cpu bound stages can run in worker processes, the downloads stay on our threads
+        _processes = getattr( self.common.args, 'processes', None )
+        if _processes is not None:
+            from sync.stage import KP_Stage_Pool
+            self._stage_pool = KP_Stage_Pool( _processes or None )
         
-        debug_print_sync("Starting thread pool execution")
-        
-        # with our thread executor
-        with ThreadPoolExecutor( max_workers=self.max_threads ) as executor:
+        # time the providers as a whole, to hold against the schedules prediction
+        _started = time.time( )
 
-            # setup the executions we're taking
-            futures = {executor.submit( self._process_provider, prov ): prov['sp_name'] 
-                      for prov in _providers}
-            
-            debug_print_sync(f"Submitted {len(futures)} provider processing tasks")
-            
-            # for each completed action: 1 hour timeout
-            for future in as_completed( futures, timeout=3600 ):
+        # in a cluster, each thread claims providers until the round has nothing left anywhere
+        if self._cluster is not None:
 
-                res = future.result( )
+            debug_print_sync("Starting cluster execution")
 
-                if res is not None:
+            # the round may hold providers we didn't find due, so look them up from all of them
+            _lookup = { prov['id']: prov for prov in self._data._get_providers( 0 ) or [] }
+            executor = ThreadPoolExecutor( max_workers=self.max_threads )
+            try:
+                _futures = { executor.submit( self._work_claims, _lookup, results ): None for _ in range( self.max_threads ) }
+                self._collect( _futures, lambda res: self._handle_result( res, results ) )
+            finally:
+                executor.shutdown( wait=False, cancel_futures=True )
+            has_errors = any( res[3] for res in results )
 
-                    # setup the results
-                    total, filtered, name, error = res
+            debug_print_sync("Cluster execution completed")
 
-                    debug_print_sync(f"Provider {name} completed: {filtered}/{total} streams, error: {error}")
+        # the asyncio engine keeps hundreds of providers in flight on a handful of threads
+        elif _async:
 
-                    # oofff... if we have an error
-                    if error:
+            debug_print_sync("Starting async engine execution")
 
-                        # set the flag, and show the error
-                        has_errors = True
-                        self.common.kp_print( "error", f"Error processing {name}: {error}" )
-                    
-                    # append our results
-                    results.append( ( total, filtered, name, error ) )
+            # run it, handling each result as it completes
+            from sync.aio import KP_Async_Engine
+            _engine = KP_Async_Engine( self, concurrency=_workers )
+            _engine.run( _providers, lambda res: self._handle_result( res, results ) )
+            has_errors = any( res[3] for res in results )
 
-        debug_print_sync("Thread pool execution completed")
+            debug_print_sync("Async engine execution completed")
 
-        # Final operations
-        try:
+        # otherwise a thread per provider
+        else:
 
-            debug_print_sync("Starting final database operations")
+            debug_print_sync("Starting thread pool execution")
+            
+            # with our thread executor, not waiting on providers a deadline left behind when we shut it down
+            executor = ThreadPoolExecutor( max_workers=self.max_threads )
+            try:
 
-            # utilize the database thread locker
-            with self._db_lock:
+                # setup the executions we're taking
+                futures = {executor.submit( self._process_provider, prov ): prov 
+                          for prov in _providers}
+                
+                debug_print_sync(f"Submitted {len(futures)} provider processing tasks")
+                
+                # handle each as it completes, until the run deadline
+                has_errors = self._collect( futures, lambda res: self._handle_result( res, results ) )
+
+            finally:
+                executor.shutdown( wait=False, cancel_futures=True )
+
+            debug_print_sync("Thread pool execution completed")
+
+        # we're done with the worker processes, and the memory sampling
+        if self._stage_pool is not None:
+            self._stage_pool.shutdown( )
+            self._stage_pool = None
+        self._memory.stop( )
+
+        # remember how long each provider took for the next runs order, a dry run isn't a real measure
+        self._schedule['actual'] = time.time( ) - _started
+        if not self._dry_run:
+            try:
+                self._history.commit( )
+            except Exception as e:
+                debug_print_sync(f"Failed to save the provider history: {e}")
 
-                # sync the streams
-                debug_print_sync("Syncing streams to database")
-                self._data._sync_the_streams( )
+        # time the final operations too
+        from utils.timing import KP_Stage_Timer
+        _final_timer = KP_Stage_Timer( )
 
-                # clean up the streams
-                debug_print_sync("Cleaning up streams")
-                self._data._cleanup( )
+        # Final operations
+        try:
 
-                # attempt to fix up some data in the streams
-                debug_print_sync("Running fixup operations")
-                self.fixup( )
+            # in a cluster, only the node that finds the round finished runs them
+            if self._cluster is not None:
+                self._cluster.close( lambda: self._final_operations( _final_timer ) )
+            else:
+                self._final_operations( _final_timer )
 
-            debug_print_sync("Final database operations completed")
+            # the staged rows are synced, this run is done
+            if self._checkpoints is not None:
+                self._checkpoints.finish( )
+
+            # the staged rows are synced, so their fingerprints are the new snapshot, a dry run synced nothing
+            if self._delta is not None and not self._dry_run:
+                self._delta.commit( )
 
         # yikes, there was an error
         except Exception as e:
@@ -145,12 +302,213 @@ class KP_Sync:
             debug_print_sync(f"Final operations error: {e}")
 
         # Show final summary
-        self._print_final_summary( results, time.time( ) - start_time, has_errors )
+        self._print_final_summary( results, time.time( ) - start_time, has_errors, _final_timer.timings )
+
+        # report the per filter stats
+        if self._profile_filters:
+            self._report_filter_stats( )
+
+        # write the run report and metrics, if asked for
+        from sync.report import KP_Run_Report
+        _report = KP_Run_Report( 'sync', start_time )
+        for res in results:
+            _report.add_provider( *res )
+        _report.final_timings = _final_timer.timings
+        _report.caches = self._caches.stats( )
+        _report.filters = self._filter_stats.report( ) if self._profile_filters else None
+        _summary = { 'providers': len( results ), 'providers_failed': sum( 1 for res in results if res[3] ), 'streams_total': sum( res[0] for res in results ), 'streams_kept': sum( res[1] for res in results ), 'rows_written': sum( res[5]['rows_written'] for res in results ), 'bytes_fetched': sum( res[5]['bytes_fetched'] for res in results ), 'rss_peak': self._memory.peak_rss, 'memory_held': self._memory.held }
+        if self._delta is not None:
+            _summary.update( { f"delta_{name}": count for name, count in self._delta.totals.items( ) } )
+        if self._cluster is not None:
+            _summary.update( { 'cluster_round': self._cluster.round_id, 'cluster_claimed': self._cluster.claimed, 'cluster_ran_final': int( self._cluster.ran_final ) } )
+            _report.extra['cluster'] = { 'name': self._cluster.name, 'node': self._cluster.node, 'round': self._cluster.round_id, 'opened': self._cluster.created, 'claimed': self._cluster.claimed, 'ran_final': self._cluster.ran_final }
+        if self._schedule['predicted'] is not None:
+            _summary.update( { 'schedule_predicted_seconds': round( self._schedule['predicted'], 3 ), 'schedule_actual_seconds': round( self._schedule['actual'], 3 ) } )
+        if self._checkpoints is not None and self._checkpoints.run_id is not None:
+            _summary['providers_resumed'] = len( self._skipped )
+            _report.extra['run'] = { 'id': self._checkpoints.run_id, 'resumed': self._checkpoints.resumed, 'skipped': [prov['sp_name'] for prov in self._skipped] }
+        _summary.update( { 'providers_timed_out': sum( res[5].get( 'timed_out', 0 ) for res in results ), 'providers_cancelled': sum( res[5].get( 'cancelled', 0 ) for res in results ) } )
+        if self._cancel.cancelled:
+            _reason, _timed_out = self._cancel.state( )
+            _report.extra['cancelled'] = { 'reason': _reason, 'timed_out': _timed_out }
+        if self._dry_run:
+            _report.extra['dry_run'] = { 'sink': self._dry_run, 'output': self._data.sink.path, 'rows': self._data.sink.rows, 'fixtures': self._data.fixtures }
+        _report.finish( time.time( ) - start_time, has_errors, **_summary )
+        self._write_run_report( _report )
+
+        # we're done with the delta tracking, the checkpoints and the cluster round
+        self._delta = None
+        self._checkpoints = None
+        self._skipped = []
+        self._cluster = None
+
+    # start the runs checkpoints, resuming the last unfinished run with --resume: returns the providers left to run
+    def _start_checkpoints( self, _providers ):
+
+        # a dry run stages nothing, and a cluster round already picks up where its nodes left off
+        self._checkpoints = None
+        self._skipped = []
+        _resume = getattr( self.common.args, 'resume', False )
+        if self._dry_run or getattr( self.common.args, 'cluster', None ):
+            if _resume:
+                self.common.kp_print( "warn", "--resume does not apply to --dry-run or --cluster, ignoring it" )
+            return _providers
+
+        # start, or resume, the run
+        from sync.checkpoint import KP_Checkpoints
+        self._checkpoints = KP_Checkpoints.from_config( )
+        self._checkpoints.start( _resume )
+        if not self._checkpoints.resumed:
+            if _resume:
+                self.common.kp_print( "info", "No unfinished sync run to resume, starting a new one" )
+            return _providers
+
+        # skip what it staged, as long as the rows are still in the temp table: if we can't tell, they're staged again
+        try:
+            _staged = self._data._get_staged_counts( list( self._checkpoints.staged ) )
+        except Exception as e:
+            debug_print_sync(f"Failed to count the staged rows, staging every provider again: {e}")
+            _staged = {}
+        _providers, self._skipped = self._checkpoints.skip( _providers, _staged )
+
+        self.common.kp_print( "info", f"Resuming run {self._checkpoints.run_id}: {len( self._skipped )} providers are still staged, {len( _providers )} left to run" )
+
+        # return what's left
+        return _providers
+
+    # join the --cluster round: returns the cluster, or None if we couldn't
+    def _join_cluster( self, name, _providers ):
+
+        # setup the cluster and its tables, then join, or open, its round
+        try:
+            from sync.cluster import KP_Cluster
+            _cluster = KP_Cluster( name, getattr( self.common.args, 'lease', None ) or 300 )
+            _cluster.setup( )
+            _cluster.join( _providers, self._history.predicted )
+        except Exception as e:
+            self.common.kp_print( "error", f"Failed to join the sync cluster {name}: {str(e)}" )
+            debug_print_sync(f"Cluster join error: {e}")
+            return None
 
-    # test streams for validity
-    def test_streams( self ):
+        self.common.kp_print( "info", f"Node {_cluster.node} {'opened' if _cluster.created else 'joined'} round {_cluster.round_id} of the {name} cluster" )
+
+        # return it
+        return _cluster
+
+    # claim providers off the cluster round on this thread. if we lose the round, the whole run stops: the other threads
+    # hand their claims back, and we still get to the rounds close and the rest of the wrap up
+    def _work_claims( self, _lookup, results ):
+        try:
+            self._cluster.work( lambda p_id: self._process_claimed( _lookup.get( p_id ), results ), self._cancel )
+        except Exception as e:
+            self.common.kp_print( "error", f"Lost the {self._cluster.name} cluster round: {str(e)}" )
+            self._cancel.cancel( f"lost the cluster round: {e}" )
+
+    # process a provider claimed off the cluster round: returns whether it went ok
+    def _process_claimed( self, _prov, results ):
+
+        # it's gone since the round opened
+        if _prov is None:
+            return False
+
+        # process it, and keep its result
+        res = self._process_provider( _prov )
+        with self._thread_lock:
+            self._handle_result( res, results )
+
+        # stopped with the run, so hand it back for another node: None leaves it unfinished
+        if res[3] and self._cancel.cancelled:
+            return None
+        return not res[3]
+
+    # collect the futures as they complete, until the run deadline or an interrupt: returns whether any result had an error
+    # futures maps each to its provider, None for those with no result of their own
+    def _collect( self, futures, handle, grace=30.0 ):
+
+        # setup what's left
+        has_errors = False
+        _pending = set( futures )
+
+        # handle each as it completes
+        try:
+            for future in as_completed( futures, timeout=self._cancel.remaining( ) ):
+                _pending.discard( future )
+                has_errors = handle( future.result( ) ) or has_errors
+            return has_errors
+
+        # the run deadline passed
+        except FuturesTimeout:
+            self._cancel.cancel( f"run deadline of {self._cancel.timeout:g}s passed", True )
+            self.common.kp_print( "warn", f"The run deadline of {self._cancel.timeout:g}s passed, stopping the providers still running" )
+
+        # or we were interrupted
+        except KeyboardInterrupt:
+            self._cancel.cancel( "interrupted" )
+            self.common.kp_print( "warn", "Interrupted, stopping the providers still running (Ctrl-C again to quit now)" )
+
+        # the running providers stop at their next check, give them a little while to get there
+        try:
+            for future in as_completed( _pending, timeout=grace ):
+                _pending.discard( future )
+                has_errors = handle( future.result( ) ) or has_errors
+        except FuturesTimeout:
+            debug_print_sync(f"{len(_pending)} providers did not stop within {grace:g}s, leaving them behind")
+
+        # whatever's left is stuck somewhere we can't check, it's reported as stopped
+        _reason, _timed_out = self._cancel.state( )
+        for future in _pending:
+            future.cancel( )
+            if futures[future] is not None:
+                has_errors = handle( self._cancelled_result( futures[future], _reason, _timed_out ) ) or has_errors
+
+        # return whether we had errors
+        return has_errors
+
+    # the result for a provider that was stopped, it ran out of time or the run was cancelled
+    def _cancelled_result( self, _prov, reason, timed_out, timings=None, counts=None ):
+        _counts = counts if counts is not None else { 'p_id': _prov['id'], 'bytes_fetched': 0, 'rows_written': 0 }
+        _counts['timed_out' if timed_out else 'cancelled'] = 1
+        return ( 0, 0, _prov['sp_name'], f"{'timed out' if timed_out else 'cancelled'}: {reason}", timings or {}, _counts )
+
+    # a providers deadline in seconds: --provider-timeout, otherwise a multiple of what its history says it takes, None for none
+    def _provider_timeout( self, _prov ):
+        _timeout = getattr( self.common.args, 'provider_timeout', None )
+        if _timeout is not None:
+            return _timeout or None
+        return self._history.deadline_for( _prov['id'] )
+
+    # run the final database operations, timing each
+    def _final_operations( self, timer ):
+
+        debug_print_sync("Starting final database operations")
+
+        # utilize the database thread locker
+        with self._db_lock:
+
+            # sync the streams
+            debug_print_sync("Syncing streams to database")
+            with timer.stage( 'streams_sync' ):
+                self._data._sync_the_streams( )
+
+            # clean up the streams
+            debug_print_sync("Cleaning up streams")
+            with timer.stage( 'streams_cleanup' ):
+                self._data._cleanup( )
+
+            # attempt to fix up some data in the streams
+            debug_print_sync("Running fixup operations")
+            with timer.stage( 'streams_fixup' ):
+                self.fixup( )
+
+        debug_print_sync("Final database operations completed")
+
+    # test streams for validity, stopping early if the cancel token is cancelled
+    def test_streams( self, cancel=None ):
         
         debug_print_sync("Starting stream testing operation")
+
+        # the daemon hands us its own token, so it can stop us
+        _cancel = cancel if cancel is not None else KP_Cancel_Token( None, "stream test" )
         
         # get active streams with provider info
         streams = self._data._get_active_streams()
@@ -194,6 +552,7 @@ class KP_Sync:
         valid_count = 0
         invalid_count = 0
         invalid_streams = []  # For logging
+        provider_counts = defaultdict( lambda: { 'tested': 0, 'valid': 0, 'invalid': 0 } )  # For the run report
         
         # Create log file with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -201,10 +560,11 @@ class KP_Sync:
         
         debug_print_sync("Starting thread pool execution for stream testing")
         
-        # Use simpler threading approach
-        with ThreadPoolExecutor( max_workers=4 ) as executor:
+        # Use simpler threading approach, not waiting on the queued tests when we're stopped early
+        executor = ThreadPoolExecutor( max_workers=4 )
+        try:
 
-            futures = {executor.submit( self._test_single_stream_simple, stream ): stream['id'] 
+            futures = {executor.submit( self._test_single_stream_simple, stream, _cancel ): stream['id'] 
                       for stream in streams}
             
             debug_print_sync(f"Submitted {len(futures)} stream testing tasks")
@@ -212,18 +572,25 @@ class KP_Sync:
             # for each completed test
             for future in as_completed( futures, timeout=7200 ):
 
+                # stop here if we were cancelled, the tests still running end on their own timeouts
+                if _cancel.cancelled:
+                    break
+
                 try:
                     stream_data, is_valid, error = future.result( )
                     tested_count += 1
+                    _counts = provider_counts[stream_data.get( 'sp_name', 'Unknown' )]
+                    _counts['tested'] += 1
+                    _counts['valid' if is_valid else 'invalid'] += 1
 
                     if is_valid:
                         valid_count += 1
-                        debug_print_sync(f"Stream {stream_data['id']} is valid")
+                        debug_trace_sync("Stream %s is valid", stream_data['id'])
                     else:
                         invalid_count += 1
                         invalid_streams.append((stream_data, error))
                        
-                        debug_print_sync(f"Stream {stream_data['id']} is invalid: {error}")
+                        debug_trace_sync("Stream %s is invalid: %s", stream_data['id'], error)
 
                     # Progress update every 100 streams
                     if tested_count % 100 == 0:
@@ -231,11 +598,19 @@ class KP_Sync:
                         self.common.kp_print( "info", progress_msg )
 
                 except Exception as e:
-                    debug_print_sync(f"Error testing stream: {e}")
+                    debug_trace_sync("Error testing stream: %s", e)
                     invalid_count += 1
 
+        finally:
+            executor.shutdown( wait=False, cancel_futures=True )
+
         debug_print_sync("Thread pool execution completed for stream testing")
 
+        # let them know if we stopped early
+        _stopped = _cancel.state( )
+        if _stopped is not None:
+            self.common.kp_print( "warn", f"Stream test stopped early ({_stopped[0]}), {tested_count} of {len(streams)} streams tested" )
+
         # Write invalid streams to log file
         if invalid_streams:
             try:
@@ -255,6 +630,14 @@ class KP_Sync:
             except Exception as e:
                 self.common.kp_print( "error", f"Failed to write log file: {str(e)}" )
 
+        # write the run report and metrics, if asked for
+        from sync.report import KP_Run_Report
+        _report = KP_Run_Report( 'teststreams', start_time )
+        _report.caches = self._caches.stats( )
+        _report.extra['providers'] = [dict( counts, name=name ) for name, counts in provider_counts.items( )]
+        _report.finish( time.time( ) - start_time, False, streams=len( streams ), tested=tested_count, valid=valid_count, invalid=invalid_count, stopped=_stopped[0] if _stopped else None )
+        self._write_run_report( _report )
+
     # fix invalid streams from log file
     def fix_from_log( self ):
         
@@ -341,9 +724,9 @@ class KP_Sync:
                     try:
                         stream_id = int(line[4:])  # Extract ID after "ID: "
                         stream_ids.append(stream_id)
-                        debug_print_sync(f"Extracted stream ID: {stream_id}")
+                        debug_trace_sync("Extracted stream ID: %s", stream_id)
                     except ValueError:
-                        debug_print_sync(f"Could not parse stream ID from line: {line}")
+                        debug_trace_sync("Could not parse stream ID from line: %s", line)
                         continue
 
             debug_print_sync("Running cleanup operations")
@@ -385,9 +768,14 @@ class KP_Sync:
     # test a single stream
     def _test_single_stream( self, stream_data, provider_semaphores ):
         
-        debug_print_sync(f"Testing stream: {stream_data['id']}")
+        debug_trace_sync("Testing stream: %s", stream_data['id'])
         
         try:
+            # a recent result for the same url is reused
+            _cached = self._get_stream_test( stream_data )
+            if _cached is not None:
+                return stream_data, _cached[0], _cached[1]
+
             from sync.test import KP_StreamTester
             tester = KP_StreamTester()
             
@@ -395,99 +783,346 @@ class KP_Sync:
             tester.set_provider_semaphores(provider_semaphores)
             
             is_valid, error = tester.test_stream(stream_data)
+            self._set_stream_test( stream_data, is_valid, error )
             
             return stream_data, is_valid, error
             
         except Exception as e:
-            debug_print_sync(f"Error testing stream {stream_data['id']}: {e}")
+            debug_trace_sync("Error testing stream %s: %s", stream_data['id'], e)
             return stream_data, False, f"Testing error: {str(e)}"
 
     # Simple test method without semaphores (fallback)
-    def _test_single_stream_simple( self, stream_data ):
+    def _test_single_stream_simple( self, stream_data, cancel=None ):
         
-        debug_print_sync(f"Testing stream (simple): {stream_data['id']}")
+        debug_trace_sync("Testing stream (simple): %s", stream_data['id'])
         
         try:
+            # a test the worker picked up after we were cancelled doesn't run
+            if cancel is not None and cancel.cancelled:
+                return stream_data, False, "cancelled"
+
+            # a recent result for the same url is reused
+            _cached = self._get_stream_test( stream_data )
+            if _cached is not None:
+                return stream_data, _cached[0], _cached[1]
+
             from sync.test import KP_StreamTester
             tester = KP_StreamTester()
             
             is_valid, error = tester.test_stream(stream_data)
+            self._set_stream_test( stream_data, is_valid, error )
             
             return stream_data, is_valid, error
             
         except Exception as e:
-            debug_print_sync(f"Error testing stream {stream_data['id']}: {e}")
+            debug_trace_sync("Error testing stream %s: %s", stream_data['id'], e)
             return stream_data, False, f"Testing error: {str(e)}"
 
+    # get a cached stream test result: ( is_valid, error ) or None
+    def _get_stream_test( self, stream_data ):
+
+        from utils.cache import KP_Cache_Registry
+
+        # nothing to look up without a url, and a test action retests everything unless --reuse-tests asks for the recent results
+        _url = stream_data.get( 's_stream_uri' )
+        if not _url or not getattr( self.common.args, 'reuse_tests', False ):
+            return None
+
+        # look it up
+        _result = self._caches.namespace( KP_Cache_Registry.STREAM_TESTS ).get( KP_Cache_Registry.stream_test_key( _url ) )
+        if _result is not None:
+            debug_trace_sync("Using cached test result for stream: %s", stream_data['id'])
+        return _result
+
+    # cache a stream test result
+    def _set_stream_test( self, stream_data, is_valid, error ):
+
+        from utils.cache import KP_Cache_Registry
+
+        # cache it by url
+        _url = stream_data.get( 's_stream_uri' )
+        if _url:
+            self._caches.namespace( KP_Cache_Registry.STREAM_TESTS ).set( KP_Cache_Registry.stream_test_key( _url ), ( is_valid, error ) )
+
+    # get the users compiled filter set, shared between their providers
+    def _get_compiled_filters( self, u_id, filters ):
+
+        from sync.filter import KP_Filter
+        from utils.cache import KP_Cache_Registry
+
+        # profiled sets carry per provider stats, so they are never shared
+        if self._profile_filters:
+            return KP_Filter.compile_filters( filters, True )
+
+        # check the cache first
+        _cache = self._caches.namespace( KP_Cache_Registry.COMPILED_FILTERS )
+        _ckey = self._caches.compiled_filter_key( u_id )
+        _compiled = _cache.get( _ckey )
+
+        # if it's not there, compile and cache it
+        if _compiled is None:
+            _compiled = KP_Filter.compile_filters( filters )
+            _cache.set( _ckey, _compiled )
+
+        # return the compiled set
+        return _compiled
+
+    # preload every providers users filters in one query, and compile them once per user
+    def _preload_filters( self, providers ):
+
+        # try to load them all at once
+        try:
+            _grouped = self._data._preload_filters( [prov["u_id"] for prov in providers] )
+
+        # if we can't, the workers just load their own
+        except Exception as e:
+            debug_print_sync(f"Filter preload failed, falling back to per user queries: {e}")
+            return
+
+        # compile each users set, profiled sets are built per provider instead
+        if not self._profile_filters:
+            for u_id, _filters in _grouped.items( ):
+                self._get_compiled_filters( u_id, _filters )
+
+        debug_print_sync(f"Preloaded and compiled filters for {len(_grouped)} users")
+
     # process a provider
     def _process_provider( self, _prov ):
 
         debug_print_sync(f"Processing provider: {_prov['sp_name']}")
 
+        # hold off while we're over the memory budget, then start it
+        self._memory.wait_for_budget( _prov['sp_name'], self._cancel )
+        _timer, _counts, _mem_token, _probe, _token = self._start_provider( _prov )
+
         # try to process
         try:
 
-            # with our database thread lockers
-            with self._db_lock:
+            # the run may have been cancelled while we waited
+            _token.check( )
 
-                debug_print_sync(f"Getting filters for provider {_prov['sp_name']}")
-                # try to grab the users filters
-                _filters = self._data._get_filters( _prov["u_id"] )
-                if _filters is None:
-                    debug_print_sync(f"No filters found for provider {_prov['sp_name']}")
-                    return ( 0, 0, _prov['sp_name'], "No filters found" )
+            # grab the users filters, normally already preloaded, otherwise concurrent callers for a user share one query
+            debug_print_sync(f"Getting filters for provider {_prov['sp_name']}")
+            _filters = self._data._get_filters( _prov["u_id"] )
+            if _filters is None:
+                debug_print_sync(f"No filters found for provider {_prov['sp_name']}")
+                return ( 0, 0, _prov['sp_name'], "No filters found", _timer.timings, _counts )
 
-                debug_print_sync(f"Found {len(_filters)} filters for provider {_prov['sp_name']}")
+            debug_print_sync(f"Found {len(_filters)} filters for provider {_prov['sp_name']}")
 
             # Get and process streams
             from sync.get import KP_Get
             _get = KP_Get( )
+            _get.timings = _timer
+            _get.cancel = _token
 
-            debug_print_sync(f"Fetching streams for provider {_prov['sp_name']}")
-            # get the streams from the provider
-            _streams = _get.get_streams( _prov )
-            
-            debug_print_sync(f"Retrieved {len(_streams)} streams for {_prov['sp_name']}")
-            
-            # setup the filtering
-            from sync.filter import KP_Filter
+            # in process mode, we only download here: the workers parse, filter and convert
+            if self._stage_pool is not None:
 
-            debug_print_sync(f"Applying filters to streams for {_prov['sp_name']}")
-            # filter the streams
-            _filtered_streams = KP_Filter.filter_streams( _streams, _filters )
+                debug_print_sync(f"Fetching streams for provider {_prov['sp_name']}, staging them in worker processes")
+                _rows, _get.total_streams, _stats, _elapsed = self._stage_pool.process( _prov, _timer.timed_iter( 'fetch', _get.iter_payloads( _prov ) ), _filters, self._profile_filters, _token )
 
-            debug_print_sync(f"Filtered to {len(_filtered_streams)} streams for {_prov['sp_name']}")
+                # the workers time their own parsing, add it and this providers filter stats to the run
+                _timer.add( 'parse', _elapsed )
+                for _chunk_stats in _stats:
+                    self._filter_stats.merge_stats( _chunk_stats )
+                    _get.split_filter_time( _chunk_stats )
+                _probe.mark( 'fetch+parse' )
 
-            # now convert them to our common format
-            _converted_streams = self._convert_streams( _filtered_streams, _prov )
+                # now expand the rows to our common format
+                with _timer.stage( 'convert' ):
+                    _converted_streams = self._convert_rows( _rows, _prov )
+
+            # otherwise everything runs on this thread
+            else:
+
+                # compile the filters once, so the parsers can drop excluded streams before building them
+                _compiled = self._get_compiled_filters( _prov["u_id"], _filters )
+
+                debug_print_sync(f"Fetching and filtering streams for provider {_prov['sp_name']}")
+                # get the streams from the provider, already filtered
+                _filtered_streams = _get.get_streams( _prov, _compiled )
+
+                # add this providers filter stats to the run
+                self._filter_stats.merge( _compiled )
+                
+                debug_print_sync(f"Retrieved {_get.total_streams} streams, filtered to {len(_filtered_streams)} streams for {_prov['sp_name']}")
+                _probe.mark( 'fetch+parse' )
+                _token.check( )
+
+                # now convert them to our common format
+                with _timer.stage( 'convert' ):
+                    _converted_streams = self._convert_streams( _filtered_streams, _prov )
             
             debug_print_sync(f"Converted {len(_converted_streams)} streams for {_prov['sp_name']}")
+            _counts['bytes_fetched'] = _get.bytes_fetched
+            _probe.mark( 'convert' )
+            _token.check( )
             
-            # make sure we actually have converted streams
+            # make sure we actually have converted streams, with --delta an unchanged provider stages nothing
             if _converted_streams:
+                _staged, _fingerprints = self._delta_streams( _prov, _converted_streams, _timer, _probe )
+                self._write_streams( _prov, _staged, _fingerprints, _timer, _counts, _token, _probe )
 
-                # with out database lock
-                with self._db_lock:
-
-                    debug_print_sync(f"Inserting streams to database for {_prov['sp_name']}")
-                    # insert the streams
-                    self._data._insert_the_streams( _converted_streams )
+            # remember how long it took, and how big it was
+            return self._finish_provider( _prov, _get.total_streams, len( _converted_streams ), _timer, _counts )
 
-                    debug_print_sync(f"Updating last synced time for {_prov['sp_name']}")
-                    # update the last synced
-                    self._data._update_last_synced( _prov["u_id"] )
-            
-            debug_print_sync(f"Provider {_prov['sp_name']} processing completed successfully")
-            # return the streams
-            return ( len( _streams ), len( _converted_streams ), _prov['sp_name'], None )
+        # out of time, or the run was cancelled: it stops where it was, with nothing staged
+        except KP_Cancelled as e:
+            debug_print_sync(f"Provider {_prov['sp_name']} stopped: {e.reason}")
+            return self._cancelled_result( _prov, e.reason, e.timed_out, _timer.timings, _counts )
             
         # whoops... 
         except Exception as e:
             debug_print_sync(f"Provider {_prov['sp_name']} processing failed: {e}")
-            return ( 0, 0, _prov['sp_name'], str( e ) )
+            return ( 0, 0, _prov['sp_name'], str( e ), _timer.timings, _counts )
+
+        # and finally, add its memory peaks to the counts we returned, and keep its memory report
+        finally:
+            self._end_provider( _counts, _mem_token, _probe )
+
+    # start a provider once the memory budget lets it: returns its ( timer, counts, memory token, memory probe, cancel token )
+    def _start_provider( self, _prov ):
+
+        # time each stage, and count what we download and write, under its id since names needn't be unique
+        from utils.timing import KP_Stage_Timer
+        _timer = KP_Stage_Timer( )
+        _counts = { 'p_id': _prov['id'], 'bytes_fetched': 0, 'rows_written': 0 }
+
+        # what the history said it would take
+        _predicted = self._history.predicted_for( _prov['id'] )
+        if _predicted is not None:
+            _counts['predicted_seconds'] = round( _predicted, 3 )
+
+        # track this providers memory peak, and with --profile-memory snapshot the allocations at each stage boundary
+        _mem_token = self._memory.begin( )
+        from utils.profiling import KP_Memory_Probe
+        _probe = KP_Memory_Probe( _prov['sp_name'] )
+
+        # its deadline starts now, and it's cancelled along with the run
+        _token = self._cancel.child( self._provider_timeout( _prov ), _prov['sp_name'] )
+        if _token.timeout is not None:
+            _counts['deadline_seconds'] = round( _token.timeout, 3 )
+
+        # return them
+        return _timer, _counts, _mem_token, _probe, _token
+
+    # stage a providers rows and mark it synced, then remember its fingerprints and checkpoint it
+    def _write_streams( self, _prov, _staged, _fingerprints, _timer, _counts, _token, _probe ):
+
+        # with out database lock
+        with self._db_lock:
+
+            # the last place we stop: once the insert starts, it finishes
+            _token.check( )
+
+            # insert the streams
+            if _staged:
+                debug_print_sync(f"Inserting {len(_staged)} streams to database for {_prov['sp_name']}")
+                with _timer.stage( 'insert' ):
+                    self._data._insert_the_streams( _staged )
+                _counts['rows_written'] = len( _staged )
+
+            debug_print_sync(f"Updating last synced time for {_prov['sp_name']}")
+            # update the last synced
+            with _timer.stage( 'last_synced' ):
+                self._data._update_last_synced( _prov["id"] )
+        _probe.mark( 'insert' )
+
+        # remember what we staged
+        if _fingerprints is not None:
+            self._delta.record( _prov["id"], _fingerprints )
+
+        # its rows are committed, so a resumed run can skip it. only once we had streams: a fetch that
+        # came back empty, or failed, is run again
+        if self._checkpoints is not None:
+            self._checkpoints.record( _prov['id'], _counts['rows_written'] )
+
+    # a provider finished: remember how long it took and how big it was, returns its result
+    def _finish_provider( self, _prov, total, filtered, _timer, _counts ):
+        self._history.record( _prov['id'], _timer.total( ), total )
+        debug_print_sync(f"Provider {_prov['sp_name']} processing completed successfully")
+        return ( total, filtered, _prov['sp_name'], None, _timer.timings, _counts )
+
+    # a provider is done, finished or not: add its memory peaks to its counts, and keep its memory report
+    def _end_provider( self, _counts, _mem_token, _probe ):
+        _counts.update( self._memory.end( _mem_token ) )
+        _probe.finish( )
+
+    # setup the delta tracking for a run
+    def _setup_delta( self, _providers ):
+
+        # the snapshots are local, so in a cluster another nodes sync would leave ours stale
+        self._delta = None
+        _delta = getattr( self.common.args, 'delta', False )
+        if _delta and self._cluster is not None:
+            self.common.kp_print( "warn", "--delta snapshots are per node, staging everything in the cluster" )
+            _delta = False
+
+        # a dry run without --delta leaves the snapshots alone
+        if self._dry_run and not _delta:
+            return
+
+        # try to open the snapshot store
+        try:
+            from sync.delta import KP_Delta, KP_Delta_Store
+            _store = KP_Delta_Store.from_config( )
+        except Exception as e:
+            if _delta:
+                self.common.kp_print( "warn", f"Delta sync unavailable, staging everything: {str(e)}" )
+            debug_print_sync(f"Delta store unavailable: {e}")
+            return
+
+        # with --delta, track what changes
+        if _delta:
+            self._delta = KP_Delta( _store )
+            return
+
+        # otherwise this run stages everything, so the snapshots are stale: the next delta run starts full
+        # in a cluster any provider may have been synced by another node, so that's all of them
+        try:
+            if self._cluster is not None:
+                _store.clear( )
+            else:
+                _store.forget( [prov['id'] for prov in _providers] )
+        except Exception as e:
+            debug_print_sync(f"Failed to clear the delta snapshots: {e}")
+
+    # get what to stage for a provider: returns ( rows, fingerprints ), fingerprints are None without --delta
+    def _delta_streams( self, _prov, _converted_streams, _timer, _probe ):
+
+        # no tracking, stage everything
+        if self._delta is None:
+            return _converted_streams, None
+
+        # otherwise all of them, or none if nothing changed
+        with _timer.stage( 'delta' ):
+            _staged, _fingerprints, _ = self._delta.diff( _prov["id"], _converted_streams )
+        _probe.mark( 'delta' )
+        return _staged, _fingerprints
+
+    # handle a providers result: returns True if it had an error
+    def _handle_result( self, res, results ):
+
+        # if there's nothing, there's nothing to do
+        if res is None:
+            return False
+
+        # setup the results
+        total, filtered, name, error, timings, counts = res
+
+        debug_print_sync(f"Provider {name} completed: {filtered}/{total} streams, error: {error}")
+
+        # oofff... if we have an error, show it
+        if error:
+            self.common.kp_print( "error", f"Error processing {name}: {error}" )
+        
+        # append our results
+        results.append( ( total, filtered, name, error, timings, counts ) )
+        return bool( error )
 
     # setup and format the final "report"
-    def _print_final_summary( self, results, total_time, has_errors ):
+    def _print_final_summary( self, results, total_time, has_errors, final_timings=None ):
 
         # THIS IS THE ONLY OUTPUT THAT SHOULD SHOW WITHOUT --debug
         # Keep this visible for users
@@ -507,7 +1142,7 @@ class KP_Sync:
             self.common.kp_print( "info", "SUCCESSFUL PROVIDERS:" )
 
             # loop the successes
-            for total, filtered, name, _ in successful:
+            for total, filtered, name, _, _, _ in successful:
 
                 # print out what the were with the stats
                 self.common.kp_print( "info", f"- {name}: {total}/{filtered} streams" )
@@ -517,7 +1152,7 @@ class KP_Sync:
             self.common.kp_print( "info", "FAILED PROVIDERS:" )
 
             # loop the failures
-            for _, _, name, error in failed:
+            for _, _, name, error, _, _ in failed:
 
                 # print em out
                 self.common.kp_print( "info", f"- {name} ({error})" )
@@ -526,7 +1161,48 @@ class KP_Sync:
         self.common.kp_print( "info", f"Total providers: {len(results)}" )
         self.common.kp_print( "info", f"Successful: {len(successful)}" )
         self.common.kp_print( "info", f"Failed: {len(failed)}" )
+        _timed_out = sum( r[5].get( 'timed_out', 0 ) for r in results )
+        _cancelled = sum( r[5].get( 'cancelled', 0 ) for r in results )
+        if _timed_out or _cancelled:
+            self.common.kp_print( "info", f"Timed out: {_timed_out}, cancelled: {_cancelled}" )
         self.common.kp_print( "info", f"Total time: {total_time:.1f} seconds" )
+
+        # show what the delta tracking found
+        if self._delta is not None:
+            _totals = self._delta.totals
+            self.common.kp_print( "info", f"Delta: {_totals['added']} added, {_totals['changed']} changed, {_totals['removed']} removed, {_totals['unchanged']} unchanged ({_totals['full']} providers staged, {_totals['skipped']} unchanged and skipped)" )
+
+        # show what a resumed run skipped
+        if self._checkpoints is not None and self._checkpoints.resumed:
+            self.common.kp_print( "info", f"Resumed run {self._checkpoints.run_id}: skipped {len(self._skipped)} providers already staged" )
+
+        # show how the longest first order did against its prediction
+        if self._schedule is not None and self._schedule['predicted'] is not None:
+            _predicted = [( res[5]['predicted_seconds'], sum( res[4].values( ) ) ) for res in results if not res[3] and 'predicted_seconds' in res[5]]
+            _off = sum( abs( actual - predicted ) for predicted, actual in _predicted ) / ( sum( actual for _, actual in _predicted ) or 1.0 ) * 100
+            self.common.kp_print( "info", f"Schedule: longest first on {self._schedule['workers']} workers, predicted {self._schedule['predicted']:.1f}s, took {self._schedule['actual']:.1f}s ({self._schedule['known']} of {len(results)} providers had history, runtimes off by {_off:.0f}%)" )
+
+        # show this nodes share of the cluster round
+        if self._cluster is not None:
+            self.common.kp_print( "info", f"Cluster: node {self._cluster.node} claimed {self._cluster.claimed} providers in round {self._cluster.round_id}, final operations {'ran here' if self._cluster.ran_final else 'left to another node'}" )
+
+        # show where a dry run put the rows
+        if self._dry_run:
+            self.common.kp_print( "info", f"Dry run: {self._data.sink.rows} rows to {self._data.sink.describe( )}, no stored procedures ran" )
+
+        # show why the run stopped early
+        if self._cancel.cancelled:
+            self.common.kp_print( "warn", f"Run stopped early ({self._cancel.state( )[0]}), {len(successful)} providers finished before it did" )
+
+        # show where the time and memory went
+        self._print_stage_timings( results, final_timings )
+        self._print_memory_summary( results )
+
+        # show how the caches did, only in debug
+        if getattr( self.common.args, 'debug', False ):
+            self.common.kp_print( "info", "\nCACHE STATISTICS:" )
+            for line in self._caches.format_stats( ):
+                self.common.kp_print( "info", line )
         
         # if we had errors
         if has_errors:
@@ -538,6 +1214,102 @@ class KP_Sync:
             
         self.common.kp_print_line( )
 
+    # write a run report as json, and its metrics for the node_exporter textfile collector
+    def _write_run_report( self, report ):
+
+        # the json report: --report, with or without a filename
+        _filename = getattr( self.common.args, 'report', None )
+        if _filename is not None:
+            _filename = _filename or f"{report.action}_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            try:
+                report.write_json( _filename )
+                self.common.kp_print( "info", f"Run report written to: {_filename}" )
+            except Exception as e:
+                self.common.kp_print( "error", f"Failed to write the run report: {str(e)}" )
+
+        # the prometheus metrics
+        _metrics = getattr( self.common.args, 'metrics_file', None )
+        if _metrics:
+            try:
+                report.write_prometheus( _metrics )
+            except Exception as e:
+                self.common.kp_print( "error", f"Failed to write the run metrics: {str(e)}" )
+
+    # show the per stage timings and the slowest providers
+    def _print_stage_timings( self, results, final_timings=None, slowest=5 ):
+
+        from utils.timing import sum_timings, format_stage_table, FINAL_STAGES
+
+        # add up the provider stages, they overlap so this is work done, not wall time
+        _totals = sum_timings( res[4] for res in results )
+        if _totals:
+
+            # a dry run is for measuring, so show the rows per second each stage got through too
+            _rows = self._stage_rows( results ) if self._dry_run else None
+
+            self.common.kp_print( "info", "\nSTAGE TIMINGS (summed across providers):" )
+            for line in format_stage_table( _totals, rows=_rows ):
+                self.common.kp_print( "info", line )
+
+        # the final database operations run once, after every provider
+        if final_timings:
+            self.common.kp_print( "info", "\nFINAL OPERATIONS:" )
+            for line in format_stage_table( final_timings, FINAL_STAGES ):
+                self.common.kp_print( "info", line )
+
+        # the slowest providers, with the stage that cost them the most
+        _timed = sorted( ( res for res in results if res[4] ), key=lambda res: sum( res[4].values( ) ), reverse=True )[:slowest]
+        if _timed:
+            self.common.kp_print( "info", "\nSLOWEST PROVIDERS:" )
+            for _, _, name, _, timings, counts in _timed:
+                _stage = max( timings, key=timings.get )
+                _predicted = f"predicted {counts['predicted_seconds']:.2f}s, " if 'predicted_seconds' in counts else ""
+                self.common.kp_print( "info", f"- {name}: {sum( timings.values( ) ):.2f}s ({_predicted}mostly {_stage}: {timings[_stage]:.2f}s)" )
+
+    # the rows each provider stage handled: everything up to the filters, what was kept after, and what was written
+    def _stage_rows( self, results ):
+        _total = sum( res[0] for res in results )
+        _kept = sum( res[1] for res in results )
+        _written = sum( res[5]['rows_written'] for res in results )
+        return { 'fetch': _total, 'parse': _total, 'filter': _total, 'convert': _kept, 'delta': _kept, 'insert': _written }
+
+    # show the memory peaks and the top memory consumers
+    def _print_memory_summary( self, results, top=5 ):
+
+        # the process as a whole
+        _budget = f", budget {self._memory.budget / 1048576:.0f} MiB" if self._memory.budget else ""
+        _held = f", {self._memory.held} provider starts held back" if self._memory.held else ""
+        self.common.kp_print( "info", f"\nMEMORY: peak RSS {self._memory.peak_rss / 1048576:.1f} MiB{_budget}{_held}" )
+
+        # the providers that grew it the most while they ran
+        _measured = sorted( ( res for res in results if res[5].get( 'rss_peak' ) ), key=lambda res: ( res[5]['rss_growth'], res[5]['rss_peak'] ), reverse=True )[:top]
+        if _measured:
+            self.common.kp_print( "info", "TOP MEMORY CONSUMERS:" )
+            for _, _, name, _, _, counts in _measured:
+                _traced = f", traced peak {counts['traced_peak'] / 1048576:.1f} MiB" if 'traced_peak' in counts else ""
+                self.common.kp_print( "info", f"- {name}: +{counts['rss_growth'] / 1048576:.1f} MiB while it ran, peak RSS {counts['rss_peak'] / 1048576:.1f} MiB{_traced}" )
+
+    # report the per filter profiling stats
+    def _report_filter_stats( self ):
+
+        # if nothing was profiled, there's nothing to report
+        if not self._filter_stats:
+            debug_print_sync("No filter stats to report")
+            return
+
+        # show the table in debug
+        debug_print_sync("FILTER STATS (most expensive first):")
+        for line in self._filter_stats.format_table( ):
+            debug_print_sync(line)
+
+        # write the json report for this run
+        filename = f"filter_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        try:
+            self._filter_stats.write_json( filename )
+            self.common.kp_print( "info", f"Filter stats written to: {filename}" )
+        except Exception as e:
+            self.common.kp_print( "error", f"Failed to write filter stats: {str(e)}" )
+
     # setup and format the test summary
     def _print_test_summary( self, tested_count, valid_count, invalid_count, moved_count, total_time, log_filename, fix_mode ):
         
@@ -591,4 +1363,20 @@ class KP_Sync:
         } for _, stream in streams.items( )]
         
         debug_print_sync(f"Converted {len(converted)} streams successfully")
-        return converted
\ No newline at end of file
+        return converted
+
+    # expand the compact rows from the worker processes to our common format
+    def _convert_rows( self, rows, provider ):
+
+        # return the formatted streams
+        return [{
+            'u_id': provider['u_id'],
+            'p_id': provider['id'],
+            's_orig_name': row[1],
+            's_stream_uri': row[2],
+            's_type_id': row[3],
+            's_tvg_id': row[4],
+            's_tvg_logo': row[5],
+            's_extras': '',
+            's_group': row[6],
+        } for row in rows.values( )]
\ No newline at end of file
@@ -9,9 +9,10 @@ import os
 from typing import Dict, Any, Optional, Tuple
 
 try:
-    from utils.debug import debug_print_sync
+    from utils.debug import debug_print_sync, debug_trace_sync
 except ImportError:
-    def debug_print_sync(msg): pass
+    def debug_print_sync(msg, *args): pass
+    def debug_trace_sync(msg, *args): pass
 
 class KP_StreamTester:
     
@@ -31,7 +32,7 @@ class KP_StreamTester:
     
     def _test_with_http_then_ffprobe(self, stream_url: str) -> Tuple[bool, str]:
         """Test with HTTP first, then if valid, test with ffprobe using same connection"""
-        debug_print_sync(f"Testing stream with HTTP+ffprobe: {stream_url[:50]}...")
+        debug_trace_sync("Testing stream with HTTP+ffprobe: %.50s...", stream_url)
         
         try:
             headers = {
@@ -95,17 +96,17 @@ class KP_StreamTester:
                 
                 # Log what we detected
                 detected_types = [k for k, v in stream_indicators.items() if v]
-                debug_print_sync(f"Stream type detection: {detected_types}, Content-Type: {content_type}")
+                debug_trace_sync("Stream type detection: %s, Content-Type: %s", detected_types, content_type)
                 
                 # If we have ffprobe available, validate with it (ffprobe can handle most formats)
                 if self.ffprobe_available:
-                    debug_print_sync("HTTP test passed, validating with ffprobe...")
+                    debug_trace_sync("HTTP test passed, validating with ffprobe...")
                     return self._validate_with_ffprobe(stream_url)
                 
                 # Without ffprobe, accept if we got valid HTTP response with data
                 # This is more permissive - if server responds with data, consider it potentially valid
                 if len(first_chunk) > 0:
-                    debug_print_sync("HTTP test passed, no ffprobe available - accepting based on data received")
+                    debug_trace_sync("HTTP test passed, no ffprobe available - accepting based on data received")
                     return True, ""
                 else:
                     return False, "No data received from stream"
@@ -152,7 +153,7 @@ class KP_StreamTester:
                 # Check if we have a valid video codec
                 codec_name = video_streams[0].get('codec_name')
                 if codec_name and codec_name != 'unknown':
-                    debug_print_sync(f"Valid video stream confirmed: {codec_name}")
+                    debug_trace_sync("Valid video stream confirmed: %s", codec_name)
                     return True, ""
                 else:
                     # Unknown codec, but HTTP was valid
@@ -208,5 +209,5 @@ class KP_StreamTester:
             return is_valid, error
         except Exception as e:
             # If the combined approach fails, fall back to simple HTTP test
-            debug_print_sync(f"Combined test failed, trying HTTP only: {e}")
+            debug_trace_sync("Combined test failed, trying HTTP only: %s", e)
             return self._test_http_only(stream_url)
\ No newline at end of file
@@ -1,40 +1,120 @@
 #!/usr/bin/env python3
 
 # necessary imports
+import os
+import sys
 import time
+import heapq
+import pickle
+import sqlite3
+import functools
+import hashlib
 import threading
 from collections import OrderedDict
+from concurrent.futures import Future
 from typing import Any, Callable, Optional
 
+# Import debug utilities
+try:
+    from utils.debug import debug_print
+except ImportError:
+    def debug_print(*args): pass
+
+# estimate the memory an object holds, following containers
+def deep_sizeof( obj: Any ) -> int:
+
+    # hold the total and what we've already counted
+    total = 0
+    seen = set( )
+    stack = [obj]
+
+    # walk everything reachable through the common containers
+    while stack:
+        item = stack.pop( )
+        if id( item ) in seen:
+            continue
+        seen.add( id( item ) )
+        total += sys.getsizeof( item )
+
+        # follow what it holds
+        if isinstance( item, dict ):
+            stack.extend( item.keys( ) )
+            stack.extend( item.values( ) )
+        elif isinstance( item, ( list, tuple, set, frozenset ) ):
+            stack.extend( item )
+        elif hasattr( item, '__dict__' ):
+            stack.append( item.__dict__ )
+
+    # return the total
+    return total
+
 # our caching class
 class KP_Cache:
 
     # initialize the cache    
-    def __init__( self, max_size: int = 1000, default_ttl: float = 3600.0 ):
+    def __init__( self, max_size: int = 1000, default_ttl: float = 3600.0, max_bytes: Optional[int] = None, sizer: Optional[Callable[[Any], int]] = None ):
 
-        # setup the internal variables
+        # setup the internal variables: key -> [value, expiration, sequence, size]
         self._cache = OrderedDict( )
         self.max_size = max_size
         self.default_ttl = default_ttl
         self._lock = threading.RLock( )
         self._expiration_callbacks = {}
 
+        # optional memory budget, entries are sized by the sizer (deep getsizeof by default)
+        self.max_bytes = max_bytes
+        self.sizer = sizer or ( deep_sizeof if max_bytes is not None else None )
+        self.current_bytes = 0
+
+        # the expiration index: a heap of (expiration, sequence, key)
+        # entries for overwritten or deleted keys are left in place and skipped when they surface
+        self._expirations = []
+        self._sequence = 0
+
+        # setup the counters
+        self._counters = self._new_counters( )
+
+    # create an empty set of counters
+    @staticmethod
+    def _new_counters( ) -> dict:
+        return { 'hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0, 'callbacks': 0, 'callback_time': 0.0 }
+
     # set an item in the cache        
     def set( self, key: Any, value: Any, ttl_seconds: Optional[float] = None, on_expire: Optional[Callable[[Any, Any], None]] = None ) -> None:
 
+        # size the value outside the lock, only if we're tracking memory
+        size = self.sizer( value ) if self.sizer is not None else 0
+
         # with the thread lock
         with self._lock:
 
+            # drop the old entry first, so its bytes aren't counted twice
+            old = self._cache.pop( key, None )
+            if old is not None:
+                self.current_bytes -= old[3]
+
+            # a value bigger than the whole budget is never cached
+            if self.max_bytes is not None and size > self.max_bytes:
+                self._expiration_callbacks.pop( key, None )
+                return
+
             # Evict expired and least recently used items if we're at capacity
             if len( self._cache ) >= self.max_size:
                 self._evict( )
+
+            # Evict until the new value fits the memory budget
+            if self.max_bytes is not None and self.current_bytes + size > self.max_bytes:
+                self._evict_bytes( size )
                 
             # Use custom TTL if provided, otherwise use default
             expiration = time.time( ) + ( ttl_seconds if ttl_seconds is not None else self.default_ttl )
-            self._cache[key] = {
-                'value': value,
-                'expiration': expiration
-            }
+            self._sequence += 1
+            self._cache[key] = [value, expiration, self._sequence, size]
+            self.current_bytes += size
+
+            # index the expiration
+            heapq.heappush( self._expirations, ( expiration, self._sequence, key ) )
+            self._compact( )
             
             # Set expiration callback if provided
             if on_expire is not None:
@@ -54,33 +134,25 @@ class KP_Cache:
         with self._lock:
 
             # If key doesn't exist, return None
-            if key not in self._cache:
+            item = self._cache.get( key )
+            if item is None:
+                self._counters['misses'] += 1
                 return None
-
-            # Get the item
-            item = self._cache[key]
             
             # Check if item has expired
-            if item['expiration'] < time.time( ):
+            if item[1] < time.time( ):
 
-                # Execute callback if it exists
-                self._execute_callback( key, item['value'] )
-
-                # Remove expired item
-                del self._cache[key]
-
-                # Remove callback if it exists
-                if key in self._expiration_callbacks:
-                    del self._expiration_callbacks[key]
-
-                # return nothing
+                # expire it and return nothing
+                self._counters['misses'] += 1
+                self._expire( key, item )
                 return None
                 
             # Move to end to show it was recently used
             self._cache.move_to_end( key )
 
             # return the cached item
-            return item['value']
+            self._counters['hits'] += 1
+            return item[0]
         
     # delete an item from the cache
     def delete( self, key: Any ) -> None:
@@ -88,11 +160,10 @@ class KP_Cache:
         # with the thread lock
         with self._lock:
 
-            # if the key exists
-            if key in self._cache:
-
-                # delete it
-                del self._cache[key]
+            # if the key exists, delete it, its heap entry goes stale
+            item = self._cache.pop( key, None )
+            if item is not None:
+                self.current_bytes -= item[3]
 
             # Remove callback if it exists
             if key in self._expiration_callbacks:
@@ -109,11 +180,13 @@ class KP_Cache:
 
                 # Execute callback if it exists
                 if key in self._expiration_callbacks:
-                    self._execute_callback( key, item['value'] )
+                    self._execute_callback( key, item[0] )
             
-            # Clear the cache and expiration callbacks
+            # Clear the cache, expiration index and expiration callbacks
             self._cache.clear( )
+            self._expirations.clear( )
             self._expiration_callbacks.clear( )
+            self.current_bytes = 0
                 
     # get the keys in the cache
     def keys( self ) -> list:
@@ -121,43 +194,9 @@ class KP_Cache:
         # with the thread lock
         with self._lock:
 
-            # setup the current time
-            now = time.time( )
-
-            # hold the valid and expired keys
-            valid_keys = []
-            expired_keys = []
-            
-            # for each item in the cache
-            for key, item in self._cache.items( ):
-
-                # if the item has expired
-                if item['expiration'] < now:
-
-                    # add it to the expired keys
-                    expired_keys.append( key )
-
-                # otherwise
-                else:
-
-                    # add it to the valid keys
-                    valid_keys.append( key )
-                    
-            # loop through the expired keys
-            for key in expired_keys:
-
-                # Execute callback if it exists
-                self._execute_callback( key, self._cache[key]['value'] )
-
-                # Remove expired item
-                del self._cache[key]
-
-                # Remove callback if it exists
-                if key in self._expiration_callbacks:
-                    del self._expiration_callbacks[key]
-                    
-            # return the valid keys
-            return valid_keys
+            # drop anything that has expired, then the rest are valid
+            self._purge_expired( )
+            return list( self._cache.keys( ) )
 
     # set a callback for an item in the cache
     def set_callback( self, key: Any, callback: Optional[Callable[[Any, Any], None]] ) -> None:
@@ -183,47 +222,94 @@ class KP_Cache:
         with self._lock:
             self.default_ttl = ttl_seconds
 
+    # expire a single item
+    def _expire( self, key: Any, item: list ) -> None:
+
+        # Execute callback if it exists
+        self._execute_callback( key, item[0] )
+
+        # Remove expired item
+        del self._cache[key]
+        self.current_bytes -= item[3]
+        self._counters['expirations'] += 1
+
+        # Remove callback if it exists
+        if key in self._expiration_callbacks:
+            del self._expiration_callbacks[key]
+
+    # pop expired items off the expiration index: O(log n) each
+    def _purge_expired( self ) -> None:
+
+        # setup the current time
+        now = time.time( )
+
+        # while the soonest expiration has passed
+        while self._expirations and self._expirations[0][0] < now:
+
+            # pop it
+            _, sequence, key = heapq.heappop( self._expirations )
+
+            # skip it if the key was deleted or set again since
+            item = self._cache.get( key )
+            if item is None or item[2] != sequence:
+                continue
+
+            # expire it
+            self._expire( key, item )
+
+    # rebuild the expiration index once stale entries outnumber the live ones
+    def _compact( self ) -> None:
+
+        # only when it's worth it
+        if len( self._expirations ) <= 2 * len( self._cache ) + 64:
+            return
+
+        # rebuild it from the live items
+        self._expirations = [( item[1], item[2], key ) for key, item in self._cache.items( )]
+        heapq.heapify( self._expirations )
+
     # setup item eviction
     def _evict( self ) -> None:
 
         # with the thread lock
         with self._lock:
 
-            # setup the current time
-            now = time.time( )
+            # drop anything that has expired
+            self._purge_expired( )
+            
+            # If we're over capacity
+            while len( self._cache ) >= self.max_size:
 
-            # setup the expired keys
-            expired_keys = [
-                key for key, item in self._cache.items( )
-                if item['expiration'] < now
-            ]
+                # Pop the least recently used item
+                self._evict_lru( )
 
-            # loop over the expired keys
-            for key in expired_keys:
+    # evict until an item of the given size fits the memory budget
+    def _evict_bytes( self, size: int ) -> None:
 
-                # Execute callback if it exists
-                if key in self._expiration_callbacks:
-                    self._execute_callback( key, self._cache[key]['value'] )
+        # with the thread lock
+        with self._lock:
 
-                # Remove expired item
-                del self._cache[key]
+            # drop anything that has expired
+            self._purge_expired( )
 
-                # Remove callback if it exists
-                if key in self._expiration_callbacks:
-                    del self._expiration_callbacks[key]
-            
-            # If we're over capacity
-            while len( self._cache ) >= self.max_size:
+            # then the least recently used items
+            while self._cache and self.current_bytes + size > self.max_bytes:
+                self._evict_lru( )
 
-                # Pop the oldest item (FIFO)
-                key, item = self._cache.popitem( last=False )
+    # evict the least recently used item, its heap entry goes stale
+    def _evict_lru( self ) -> None:
 
-                # Execute callback if it exists
-                if key in self._expiration_callbacks:
-                    self._execute_callback( key, item['value'] )
+        # pop it
+        key, item = self._cache.popitem( last=False )
+        self.current_bytes -= item[3]
+        self._counters['evictions'] += 1
 
-                    # Remove callback
-                    del self._expiration_callbacks[key]
+        # Execute callback if it exists
+        if key in self._expiration_callbacks:
+            self._execute_callback( key, item[0] )
+
+            # Remove callback
+            del self._expiration_callbacks[key]
             
     # execute the callback
     def _execute_callback( self, key: Any, value: Any ) -> None:
@@ -234,7 +320,8 @@ class KP_Cache:
         # if there is a callback
         if callback:
 
-            # attemp to execute it
+            # attemp to execute it, timing it
+            _start = time.perf_counter( )
             try:
 
                 callback( key, value )
@@ -245,6 +332,11 @@ class KP_Cache:
                 # Don't let callback exceptions break cache operations
                 import traceback
                 traceback.print_exc( )
+
+            # count it
+            finally:
+                self._counters['callbacks'] += 1
+                self._counters['callback_time'] += time.perf_counter( ) - _start
             
     # check if a key exists in the cache
     def __contains__( self, key: Any ) -> bool:
@@ -253,26 +345,15 @@ class KP_Cache:
         with self._lock:
 
             # if the key doesn't exist
-            if key not in self._cache:
+            item = self._cache.get( key )
+            if item is None:
                 return False
-                
-            # Get the item
-            item = self._cache[key]
 
             # Check if item has expired
-            if item['expiration'] < time.time( ):
-
-                # Execute callback if it exists
-                self._execute_callback( key, item['value'] )
-
-                # Remove expired item
-                del self._cache[key]
+            if item[1] < time.time( ):
 
-                # Remove callback if it exists
-                if key in self._expiration_callbacks:
-                    del self._expiration_callbacks[key]
-
-                # return False
+                # expire it and return False
+                self._expire( key, item )
                 return False
                 
             # by default, return true
@@ -286,4 +367,680 @@ class KP_Cache:
 
             # return the length of the cache
             return len( self._cache )
-        
+
+    # get the current entries and bytes, for monitoring
+    def memory_usage( self ) -> dict:
+
+        # with the thread lock
+        with self._lock:
+            return { 'entries': len( self._cache ), 'bytes': self.current_bytes, 'max_size': self.max_size, 'max_bytes': self.max_bytes }
+
+    # get the counters, with the hit ratio and current usage
+    def stats( self ) -> dict:
+
+        # with the thread lock
+        with self._lock:
+            _stats = dict( self._counters )
+            _stats.update( self.memory_usage( ) )
+
+        # add the hit ratio
+        _lookups = _stats['hits'] + _stats['misses']
+        _stats['hit_ratio'] = _stats['hits'] / _lookups if _lookups else 0.0
+        return _stats
+
+    # reset the counters
+    def reset_stats( self ) -> None:
+        with self._lock:
+            self._counters = self._new_counters( )
+
+
+# our lock-striped cache: keys hash to independently locked KP_Cache segments
+class KP_Sharded_Cache:
+
+    # initialize the cache
+    def __init__( self, max_size: int = 1000, default_ttl: float = 3600.0, shards: int = 16, max_bytes: Optional[int] = None, sizer: Optional[Callable[[Any], int]] = None ):
+
+        # setup the internal variables
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.shard_count = max( 1, int( shards ) )
+
+        # each shard gets its share of the size and memory, its own lock, LRU order and TTL index
+        _per_shard = max( 1, -( -max_size // self.shard_count ) )
+        _bytes_per_shard = max( 1, max_bytes // self.shard_count ) if max_bytes is not None else None
+        self._shards = [KP_Cache( max_size=_per_shard, default_ttl=default_ttl, max_bytes=_bytes_per_shard, sizer=sizer ) for _ in range( self.shard_count )]
+
+    # get the shard for a key
+    def _shard( self, key: Any ) -> KP_Cache:
+        return self._shards[hash( key ) % self.shard_count]
+
+    # set an item in the cache
+    def set( self, key: Any, value: Any, ttl_seconds: Optional[float] = None, on_expire: Optional[Callable[[Any, Any], None]] = None ) -> None:
+        self._shard( key ).set( key, value, ttl_seconds, on_expire )
+
+    # get an item from the cache
+    def get( self, key: Any ) -> Any:
+        return self._shard( key ).get( key )
+
+    # delete an item from the cache
+    def delete( self, key: Any ) -> None:
+        self._shard( key ).delete( key )
+
+    # clear the entire cache
+    def clear( self ) -> None:
+        for shard in self._shards:
+            shard.clear( )
+
+    # get the keys in the cache
+    def keys( self ) -> list:
+
+        # hold the keys
+        _keys = []
+        for shard in self._shards:
+            _keys.extend( shard.keys( ) )
+
+        # return them
+        return _keys
+
+    # set a callback for an item in the cache
+    def set_callback( self, key: Any, callback: Optional[Callable[[Any, Any], None]] ) -> None:
+        self._shard( key ).set_callback( key, callback )
+
+    # set the default TTL for the cached items in seconds
+    def set_default_ttl( self, ttl_seconds: float ) -> None:
+        self.default_ttl = ttl_seconds
+        for shard in self._shards:
+            shard.set_default_ttl( ttl_seconds )
+
+    # check if a key exists in the cache
+    def __contains__( self, key: Any ) -> bool:
+        return key in self._shard( key )
+
+    # get the number of items in the cache
+    def __len__( self ) -> int:
+        return sum( len( shard ) for shard in self._shards )
+
+    # the current bytes across all the shards
+    @property
+    def current_bytes( self ) -> int:
+        return sum( shard.current_bytes for shard in self._shards )
+
+    # get the current entries and bytes, for monitoring
+    def memory_usage( self ) -> dict:
+        return { 'entries': len( self ), 'bytes': self.current_bytes, 'max_size': self.max_size, 'max_bytes': self.max_bytes }
+
+    # get the counters summed across the shards
+    def stats( self ) -> dict:
+
+        # add up the shards counters
+        _stats = KP_Cache._new_counters( )
+        for shard in self._shards:
+            _shard = shard.stats( )
+            for name in _stats:
+                _stats[name] += _shard[name]
+        _stats.update( self.memory_usage( ) )
+
+        # add the hit ratio
+        _lookups = _stats['hits'] + _stats['misses']
+        _stats['hit_ratio'] = _stats['hits'] / _lookups if _lookups else 0.0
+        return _stats
+
+    # reset the counters
+    def reset_stats( self ) -> None:
+        for shard in self._shards:
+            shard.reset_stats( )
+
+# our on disk cache store: SQLite in WAL mode, shared between runs and processes
+class KP_Disk_Cache:
+
+    # initialize the store
+    def __init__( self, path: str, default_ttl: float = 3600.0, timeout: float = 10.0 ):
+
+        # setup the internal variables
+        self.path = os.path.abspath( os.path.expanduser( path ) )
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        self._local = threading.local( )
+
+        # make sure the directory is there, and only we can read the file: sqlite gives its wal and shm files the same mode
+        os.makedirs( os.path.dirname( self.path ), mode=0o700, exist_ok=True )
+        os.close( os.open( self.path, os.O_RDWR | os.O_CREAT, 0o600 ) )
+        os.chmod( self.path, 0o600 )
+
+        # setup the table, and drop whatever expired since the last run
+        _cnx = self._connection( )
+        _cnx.execute( "CREATE TABLE IF NOT EXISTS kptv_cache ( namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires REAL NOT NULL, PRIMARY KEY ( namespace, key ) )" )
+        _cnx.execute( "CREATE INDEX IF NOT EXISTS kptv_cache_expires ON kptv_cache ( expires )" )
+        self.purge_expired( )
+
+    # get this threads connection, sqlite connections can't be shared between threads
+    def _connection( self ) -> sqlite3.Connection:
+
+        # if we already have one, return it
+        _cnx = getattr( self._local, 'cnx', None )
+        if _cnx is not None:
+            return _cnx
+
+        # open it in WAL mode, so other processes can read while we write
+        _cnx = sqlite3.connect( self.path, timeout=self.timeout, isolation_level=None )
+        _cnx.execute( "PRAGMA journal_mode=WAL" )
+        _cnx.execute( "PRAGMA synchronous=NORMAL" )
+        _cnx.execute( f"PRAGMA busy_timeout={int( self.timeout * 1000 )}" )
+        self._local.cnx = _cnx
+        return _cnx
+
+    # keys are stored as text
+    @staticmethod
+    def _key( key: Any ) -> str:
+        return key if isinstance( key, str ) else repr( key )
+
+    # get a value and its expiration, None if it's missing or expired
+    def get( self, namespace: str, key: Any ) -> Optional[tuple]:
+
+        # try to read it, the disk tier is best effort
+        try:
+            _row = self._connection( ).execute( "SELECT value, expires FROM kptv_cache WHERE namespace = ? AND key = ? AND expires > ?", ( namespace, self._key( key ), time.time( ) ) ).fetchone( )
+            if _row is None:
+                return None
+            return pickle.loads( _row[0] ), _row[1]
+        except Exception as e:
+            debug_print( f"Disk cache read failed for {namespace}: {e}" )
+            return None
+
+    # set a value
+    def set( self, namespace: str, key: Any, value: Any, ttl_seconds: Optional[float] = None ) -> None:
+
+        # setup the expiration
+        expiration = time.time( ) + ( ttl_seconds if ttl_seconds is not None else self.default_ttl )
+
+        # try to write it, anything that can't be pickled just stays in memory
+        try:
+            self._connection( ).execute( "INSERT OR REPLACE INTO kptv_cache ( namespace, key, value, expires ) VALUES ( ?, ?, ?, ? )", ( namespace, self._key( key ), pickle.dumps( value, pickle.HIGHEST_PROTOCOL ), expiration ) )
+        except Exception as e:
+            debug_print( f"Disk cache write failed for {namespace}: {e}" )
+
+    # delete a value
+    def delete( self, namespace: str, key: Any ) -> None:
+        try:
+            self._connection( ).execute( "DELETE FROM kptv_cache WHERE namespace = ? AND key = ?", ( namespace, self._key( key ) ) )
+        except Exception as e:
+            debug_print( f"Disk cache delete failed for {namespace}: {e}" )
+
+    # clear a namespace, or everything
+    def clear( self, namespace: Optional[str] = None ) -> None:
+        try:
+            if namespace is None:
+                self._connection( ).execute( "DELETE FROM kptv_cache" )
+            else:
+                self._connection( ).execute( "DELETE FROM kptv_cache WHERE namespace = ?", ( namespace, ) )
+        except Exception as e:
+            debug_print( f"Disk cache clear failed: {e}" )
+
+    # drop everything that has expired
+    def purge_expired( self ) -> None:
+        try:
+            self._connection( ).execute( "DELETE FROM kptv_cache WHERE expires <= ?", ( time.time( ), ) )
+        except Exception as e:
+            debug_print( f"Disk cache purge failed: {e}" )
+
+    # how many live entries a namespace has
+    def count( self, namespace: str ) -> int:
+        try:
+            return self._connection( ).execute( "SELECT COUNT(*) FROM kptv_cache WHERE namespace = ? AND expires > ?", ( namespace, time.time( ) ) ).fetchone( )[0]
+        except Exception:
+            return 0
+
+# a namespace cached in memory, backed by the on disk store
+class KP_Tiered_Cache:
+
+    # wrap the memory cache
+    def __init__( self, memory: KP_Cache, disk: KP_Disk_Cache, namespace: str ):
+
+        # setup the internal variables
+        self.memory = memory
+        self.disk = disk
+        self.namespace = namespace
+        self._disk_counters = { 'disk_hits': 0, 'disk_misses': 0 }
+
+    # the default ttl is the memory caches
+    @property
+    def default_ttl( self ) -> float:
+        return self.memory.default_ttl
+
+    # the max size is the memory caches
+    @property
+    def max_size( self ) -> int:
+        return self.memory.max_size
+
+    # set a value in both tiers
+    def set( self, key: Any, value: Any, ttl_seconds: Optional[float] = None ) -> None:
+
+        # setup the ttl
+        _ttl = ttl_seconds if ttl_seconds is not None else self.memory.default_ttl
+
+        # write it through
+        self.memory.set( key, value, _ttl )
+        self.disk.set( self.namespace, key, value, _ttl )
+
+    # get a value, promoting it from disk on a memory miss
+    def get( self, key: Any ) -> Any:
+
+        # check memory first
+        value = self.memory.get( key )
+        if value is not None:
+            return value
+
+        # then the disk, keeping whatever ttl it had left
+        _entry = self.disk.get( self.namespace, key )
+        if _entry is None:
+            self._disk_counters['disk_misses'] += 1
+            return None
+        self._disk_counters['disk_hits'] += 1
+        value, expiration = _entry
+        self.memory.set( key, value, expiration - time.time( ) )
+
+        # return it
+        return value
+
+    # delete a value from both tiers
+    def delete( self, key: Any ) -> None:
+        self.memory.delete( key )
+        self.disk.delete( self.namespace, key )
+
+    # clear both tiers
+    def clear( self ) -> None:
+        self.memory.clear( )
+        self.disk.clear( self.namespace )
+
+    # get the keys in memory
+    def keys( self ) -> list:
+        return self.memory.keys( )
+
+    # set a callback for when the memory copy expires
+    def set_callback( self, key: Any, callback: Callable[[Any, Any], None] ) -> None:
+        self.memory.set_callback( key, callback )
+
+    # set the default ttl
+    def set_default_ttl( self, ttl_seconds: float ) -> None:
+        self.memory.set_default_ttl( ttl_seconds )
+
+    # check if a key is in either tier
+    def __contains__( self, key: Any ) -> bool:
+        return key in self.memory or self.disk.get( self.namespace, key ) is not None
+
+    # get the number of items in memory
+    def __len__( self ) -> int:
+        return len( self.memory )
+
+    # get the memory usage, and the entries on disk
+    def memory_usage( self ) -> dict:
+        _usage = self.memory.memory_usage( )
+        _usage['disk_entries'] = self.disk.count( self.namespace )
+        return _usage
+
+    # get the memory counters, and how often the disk filled a memory miss
+    def stats( self ) -> dict:
+        _stats = self.memory.stats( )
+        _stats.update( self._disk_counters )
+        _stats['disk_entries'] = self.disk.count( self.namespace )
+        return _stats
+
+    # reset the counters
+    def reset_stats( self ) -> None:
+        self.memory.reset_stats( )
+        self._disk_counters = { 'disk_hits': 0, 'disk_misses': 0 }
+
+# our process-wide registry of named caches
+class KP_Cache_Registry:
+
+    # the namespaces we know about, with their size and TTL in seconds
+    PROVIDERS = "providers"
+    FILTERS = "filters"
+    COMPILED_FILTERS = "compiled_filters"
+    STREAM_TESTS = "stream_tests"
+    DEFAULTS = {
+        PROVIDERS: { 'max_size': 64, 'default_ttl': 300.0, 'max_bytes': 16 * 1024 * 1024 },
+        FILTERS: { 'max_size': 1024, 'default_ttl': 300.0, 'shards': 8, 'max_bytes': 64 * 1024 * 1024, 'persist': True },
+        COMPILED_FILTERS: { 'max_size': 1024, 'default_ttl': 300.0, 'shards': 8 },
+        STREAM_TESTS: { 'max_size': 100000, 'default_ttl': 21600.0, 'shards': 8, 'persist': True },
+    }
+
+    # where the on disk tier lives, unless the config says otherwise
+    DEFAULT_DISK_PATH = os.path.join( '~', '.cache', 'kptv', 'cache.sqlite3' )
+
+    # hold the shared instance
+    _instance = None
+    _instance_lock = threading.Lock( )
+
+    # initialize the registry
+    def __init__( self ):
+
+        # hold the caches by namespace, and the on disk tier if it's enabled
+        self._caches = {}
+        self._lock = threading.Lock( )
+        self.disk = None
+
+        # hold the cached functions loading into each namespace
+        self._loaders = {}
+
+    # get the shared registry
+    @classmethod
+    def instance( cls ) -> 'KP_Cache_Registry':
+
+        # create it once
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls( )
+
+        # return it
+        return cls._instance
+
+    # get (or create) the cache for a namespace
+    def namespace( self, name: str, max_size: Optional[int] = None, default_ttl: Optional[float] = None, shards: Optional[int] = None, max_bytes: Optional[int] = None ) -> KP_Cache:
+
+        # if we already have it, return it
+        cache = self._caches.get( name )
+        if cache is not None:
+            return cache
+
+        # with the thread lock
+        with self._lock:
+
+            # someone else may have beaten us to it
+            if name not in self._caches:
+
+                # setup the size, ttl and sharding for the namespace
+                defaults = self.DEFAULTS.get( name, {} )
+                _size = max_size or defaults.get( 'max_size', 1000 )
+                _ttl = default_ttl or defaults.get( 'default_ttl', 3600.0 )
+                _shards = shards or defaults.get( 'shards', 1 )
+                _bytes = max_bytes or defaults.get( 'max_bytes' )
+
+                # namespaces hit by many worker threads get a sharded cache
+                if _shards > 1:
+                    cache = KP_Sharded_Cache( max_size=_size, default_ttl=_ttl, shards=_shards, max_bytes=_bytes )
+                else:
+                    cache = KP_Cache( max_size=_size, default_ttl=_ttl, max_bytes=_bytes )
+
+                # persistent namespaces are backed by the disk tier, if we have one
+                if self.disk is not None and defaults.get( 'persist', False ):
+                    cache = KP_Tiered_Cache( cache, self.disk, name )
+                self._caches[name] = cache
+
+            # return it
+            return self._caches[name]
+
+    # enable the on disk tier for the persistent namespaces created from here on
+    def enable_disk( self, path: Optional[str] = None ) -> bool:
+
+        # try to open it, if we can't we just stay in memory
+        try:
+            self.disk = KP_Disk_Cache( path or self.DEFAULT_DISK_PATH )
+            debug_print( f"Disk cache enabled at: {self.disk.path}" )
+
+            # drop what an older version kept for namespaces we no longer persist, like the provider rows and their credentials
+            for name, defaults in self.DEFAULTS.items( ):
+                if not defaults.get( 'persist', False ):
+                    self.disk.clear( name )
+            return True
+        except Exception as e:
+            debug_print( f"Disk cache unavailable, using memory only: {e}" )
+            self.disk = None
+            return False
+
+    # invalidate a single key, or the whole namespace
+    def invalidate( self, name: str, key: Any = None ) -> None:
+
+        # if we don't have it, there's nothing to do
+        cache = self._caches.get( name )
+        if cache is None:
+            return
+
+        # clear the key or the whole namespace
+        if key is None:
+            cache.clear( )
+        else:
+            cache.delete( key )
+
+    # invalidate everything
+    def invalidate_all( self ) -> None:
+
+        # loop the namespaces and clear them
+        for cache in list( self._caches.values( ) ):
+            cache.clear( )
+
+    # get the namespaces we have
+    def names( self ) -> list:
+        return list( self._caches.keys( ) )
+
+    # get the entries and bytes for every namespace, for monitoring
+    def memory_usage( self ) -> dict:
+        return { name: cache.memory_usage( ) for name, cache in list( self._caches.items( ) ) }
+
+    # register a cached function loading into a namespace, so its load latency is reported
+    def register_loader( self, loader: 'KP_Cached_Function' ) -> None:
+        with self._lock:
+            self._loaders.setdefault( loader.namespace, [] ).append( loader )
+
+    # get the stats for every namespace
+    def stats( self ) -> dict:
+
+        # hold the stats
+        _stats = {}
+
+        # loop the namespaces
+        for name, cache in list( self._caches.items( ) ):
+
+            # the caches own counters
+            _ns = _stats[name] = cache.stats( )
+
+            # plus the load latency of anything loading into it
+            _ns.update( { 'loads': 0, 'load_errors': 0, 'coalesced': 0, 'load_time': 0.0 } )
+            for loader in self._loaders.get( name, [] ):
+                _loader = loader.stats( )
+                for metric in ( 'loads', 'load_errors', 'coalesced', 'load_time' ):
+                    _ns[metric] += _loader[metric]
+            _ns['mean_load_time'] = _ns['load_time'] / _ns['loads'] if _ns['loads'] else 0.0
+
+        # return them
+        return _stats
+
+    # format the stats as a text table
+    def format_stats( self ) -> list:
+
+        # hold the lines
+        lines = [f"{'NAMESPACE':<18} {'ENTRIES':>8} {'HITS':>9} {'MISSES':>9} {'HIT %':>6} {'EXPIRED':>8} {'EVICTED':>8} {'CB ms':>8} {'LOADS':>6} {'LOAD ms':>8}"]
+
+        # loop the namespaces
+        for name, s in sorted( self.stats( ).items( ) ):
+            lines.append( f"{name:<18} {s['entries']:>8} {s['hits']:>9} {s['misses']:>9} {s['hit_ratio'] * 100:>6.1f} {s['expirations']:>8} {s['evictions']:>8} {s['callback_time'] * 1000:>8.1f} {s['loads']:>6} {s['mean_load_time'] * 1000:>8.1f}" )
+
+        # return the lines
+        return lines
+
+    # key builder: the providers list, 0 for all of them
+    @staticmethod
+    def provider_key( provider_id: Optional[int] = None ) -> str:
+        return f"providers:{provider_id or 0}"
+
+    # key builder: a users active filters
+    @staticmethod
+    def filter_key( u_id: int ) -> str:
+        return f"filters:{u_id}"
+
+    # key builder: a users compiled filter set
+    @staticmethod
+    def compiled_filter_key( u_id: int ) -> str:
+        return f"compiled_filters:{u_id}"
+
+    # key builder: the last test result for a stream url, hashed so credentials in the url are not kept
+    @staticmethod
+    def stream_test_key( url: str ) -> str:
+        return "stream_tests:" + hashlib.sha1( url.encode( 'utf-8' ) ).hexdigest( )
+
+# get a namespaced cache from the shared registry
+def get_cache( name: str ) -> KP_Cache:
+    return KP_Cache_Registry.instance( ).namespace( name )
+
+
+# our single-flight memoizer, backed by a namespaced cache
+class KP_Cached_Function:
+
+    # wrap the function
+    def __init__( self, func: Callable, namespace: str, ttl: Optional[float] = None, key: Optional[Callable] = None, stale_ttl: Optional[float] = None ):
+
+        # setup the internal variables
+        self.func = func
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl or 0.0
+        self.key_func = key
+        self._inflight = {}
+        self._lock = threading.Lock( )
+
+        # setup the metrics, and report them with the namespace
+        self.metrics = { 'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'loads': 0, 'load_errors': 0, 'load_time': 0.0 }
+        functools.update_wrapper( self, func )
+        KP_Cache_Registry.instance( ).register_loader( self )
+
+    # bind to an instance when used on a method
+    def __get__( self, instance, owner ):
+        if instance is None:
+            return self
+        return functools.partial( self.__call__, instance )
+
+    # get the cache for our namespace
+    @property
+    def cache( self ):
+        return get_cache( self.namespace )
+
+    # build the cache key for a call
+    def _key( self, args: tuple, kwargs: dict ) -> Any:
+
+        # use the callers key builder if we have one
+        if self.key_func is not None:
+            return self.key_func( *args, **kwargs )
+
+        # otherwise key on the function and its arguments
+        return ( self.func.__qualname__, args, tuple( sorted( kwargs.items( ) ) ) )
+
+    # count a metric
+    def _count( self, name: str, amount: Any = 1 ) -> None:
+        with self._lock:
+            self.metrics[name] += amount
+
+    # call the function through the cache
+    def __call__( self, *args, **kwargs ) -> Any:
+
+        # setup the key and look it up, entries are (value, fresh until)
+        _key = self._key( args, kwargs )
+        _entry = self.cache.get( _key )
+
+        # if we have it
+        if _entry is not None:
+
+            # fresh: just return it
+            if _entry[1] >= time.time( ):
+                self._count( 'hits' )
+                return _entry[0]
+
+            # stale: return it, and refresh it in the background
+            self._count( 'stale_hits' )
+            self._load( _key, args, kwargs, background=True )
+            return _entry[0]
+
+        # otherwise load it, waiting on anyone already loading it
+        self._count( 'misses' )
+        return self._load( _key, args, kwargs ).result( )
+
+    # load a value, only one load per key runs at a time
+    def _load( self, _key: Any, args: tuple, kwargs: dict, background: bool = False ) -> Future:
+
+        # with the thread lock
+        with self._lock:
+
+            # if someone is already loading it, wait on them
+            _future = self._inflight.get( _key )
+            if _future is not None:
+                if not background:
+                    self.metrics['coalesced'] += 1
+                return _future
+
+            # a load may have finished since we checked the cache, checking membership first keeps the miss from counting twice
+            if not background and _key in self.cache:
+                _entry = self.cache.get( _key )
+                if _entry is not None and _entry[1] >= time.time( ):
+                    _future = Future( )
+                    _future.set_result( _entry[0] )
+                    return _future
+
+            # otherwise we're the loader
+            _future = self._inflight[_key] = Future( )
+
+        # run it here, or in the background for a stale refresh
+        if background:
+            threading.Thread( target=self._run, args=( _key, args, kwargs, _future ), daemon=True ).start( )
+        else:
+            self._run( _key, args, kwargs, _future )
+
+        # return the future
+        return _future
+
+    # run the function and cache the result
+    def _run( self, _key: Any, args: tuple, kwargs: dict, _future: Future ) -> None:
+
+        # time the load
+        _start = time.perf_counter( )
+
+        # try to run it
+        try:
+            _value = self.func( *args, **kwargs )
+
+            # cache it, keeping it around past its ttl if we serve stale values
+            _ttl = self.ttl if self.ttl is not None else self.cache.default_ttl
+            self.cache.set( _key, ( _value, time.time( ) + _ttl ), ttl_seconds=_ttl + self.stale_ttl )
+            _future.set_result( _value )
+
+        # hand the error to everyone waiting
+        except BaseException as e:
+            self._count( 'load_errors' )
+            _future.set_exception( e )
+
+        # and finally, we're done loading
+        finally:
+            with self._lock:
+                self.metrics['loads'] += 1
+                self.metrics['load_time'] += time.perf_counter( ) - _start
+                self._inflight.pop( _key, None )
+
+    # forget a cached call
+    def invalidate( self, *args, **kwargs ) -> None:
+        self.cache.delete( self._key( args, kwargs ) )
+
+    # seed the cache for a call, as if it had just been loaded
+    def prime( self, value: Any, *args, **kwargs ) -> None:
+        _ttl = self.ttl if self.ttl is not None else self.cache.default_ttl
+        self.cache.set( self._key( args, kwargs ), ( value, time.time( ) + _ttl ), ttl_seconds=_ttl + self.stale_ttl )
+
+    # get the metrics
+    def stats( self ) -> dict:
+
+        # with the thread lock
+        with self._lock:
+            _stats = dict( self.metrics )
+
+        # add the mean load time
+        _stats['mean_load_time'] = _stats['load_time'] / _stats['loads'] if _stats['loads'] else 0.0
+        return _stats
+
+# memoize a function in a namespaced cache with single-flight loading
+def cached( namespace: str, ttl: Optional[float] = None, key: Optional[Callable] = None, stale_ttl: Optional[float] = None ) -> Callable:
+
+    # the decorator
+    def _decorator( func: Callable ) -> KP_Cached_Function:
+        return KP_Cached_Function( func, namespace, ttl, key, stale_ttl )
+
+    # return it
+    return _decorator
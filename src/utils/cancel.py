@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import time
+import weakref
+import threading
+from typing import Optional, Tuple
+
+# raised at a checkpoint once its token is cancelled, or past its deadline
+class KP_Cancelled( Exception ):
+
+    # fire us up
+    def __init__( self, reason: str, timed_out: bool = False ):
+        super( ).__init__( reason )
+        self.reason = reason
+        self.timed_out = timed_out
+
+# our cooperative cancellation token: work checks it between stages and chunks, and stops cleanly when it's set.
+# a child token has its own deadline, and is cancelled along with its parent
+class KP_Cancel_Token:
+
+    # the root tokens still around, so an interrupt can cancel them all
+    _roots = weakref.WeakSet( )
+    _roots_lock = threading.Lock( )
+
+    # fire us up: timeout is in seconds from now, None for no deadline
+    def __init__( self, timeout: Optional[float] = None, name: str = "run", parent: Optional['KP_Cancel_Token'] = None ):
+
+        # setup the internal variables
+        self.name = name
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.deadline = time.monotonic( ) + self.timeout if self.timeout else None
+        self.parent = parent
+        self._event = threading.Event( )
+        self._reason = None
+        self._timed_out = False
+
+        # keep track of the roots
+        if parent is None:
+            with KP_Cancel_Token._roots_lock:
+                KP_Cancel_Token._roots.add( self )
+
+    # a child token, with its own deadline
+    def child( self, timeout: Optional[float] = None, name: str = "" ) -> 'KP_Cancel_Token':
+        return KP_Cancel_Token( timeout, name, self )
+
+    # cancel it, and every child
+    def cancel( self, reason: str = "cancelled", timed_out: bool = False ) -> None:
+        if not self._event.is_set( ):
+            self._reason = reason
+            self._timed_out = timed_out
+            self._event.set( )
+
+    # why it's cancelled: ( reason, timed out ), None if it isn't
+    def state( self ) -> Optional[Tuple[str, bool]]:
+
+        # cancelled outright
+        if self._event.is_set( ):
+            return self._reason, self._timed_out
+
+        # past our deadline
+        if self.deadline is not None and time.monotonic( ) >= self.deadline:
+            return f"{self.name} deadline of {self.timeout:g}s passed", True
+
+        # otherwise whatever our parent says
+        return self.parent.state( ) if self.parent is not None else None
+
+    # is it cancelled
+    @property
+    def cancelled( self ) -> bool:
+        return self.state( ) is not None
+
+    # raise if it's cancelled
+    def check( self ) -> None:
+        _state = self.state( )
+        if _state is not None:
+            raise KP_Cancelled( *_state )
+
+    # seconds until the nearest deadline, None if there isn't one
+    def remaining( self ) -> Optional[float]:
+
+        # ours, and our parents
+        _remaining = self.deadline - time.monotonic( ) if self.deadline is not None else None
+        _parent = self.parent.remaining( ) if self.parent is not None else None
+
+        # the nearest
+        if _remaining is None or _parent is None:
+            return _remaining if _parent is None else _parent
+        return min( _remaining, _parent )
+
+    # cancel every root token, on an interrupt
+    @classmethod
+    def cancel_all( cls, reason: str = "interrupted" ) -> None:
+        with cls._roots_lock:
+            _roots = list( cls._roots )
+        for token in _roots:
+            token.cancel( reason )
@@ -2,79 +2,234 @@
 
 """
 Debug utilities to control debug output throughout the application
+
+Messages are grouped by category (CONFIG, DB, SYNC, REQUEST) and level, and
+use lazy %-style arguments so nothing is formatted unless it will be shown.
+When enabled, output is handed to a background writer thread that buffers it
+to stdout.
 """
 
 import sys
-from typing import Any, Optional
-
-# Global debug state
-_debug_enabled: Optional[bool] = None
-
-def set_debug(enabled: bool) -> None:
-    """Set the global debug state"""
-    global _debug_enabled
-    _debug_enabled = enabled
-
-def is_debug_enabled() -> bool:
-    """Check if debug mode is enabled"""
-    global _debug_enabled
-    
-    # If not explicitly set, try to detect from command line args
-    if _debug_enabled is None:
-        # Try to detect --debug flag from sys.argv
-        _debug_enabled = '--debug' in sys.argv
-    
-    return _debug_enabled
+import atexit
+import queue
+import threading
+from typing import Any, Optional, Iterable
+
+# our levels, lower is chattier
+TRACE = 5
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+# map the level names for the command line
+LEVELS = {'trace': TRACE, 'debug': DEBUG, 'info': INFO, 'warn': WARN, 'error': ERROR}
+
+# Global debug state: the fast path boolean, checked before anything else
+enabled: bool = '--debug' in sys.argv
+
+# the minimum level to show, and the categories to show (None = all)
+_level: int = DEBUG
+_categories: Optional[frozenset] = None
+
+# the background writer, only started once something is written
+_writer = None
+_writer_lock = threading.Lock()
+
+# our buffered background writer
+class KP_Debug_Writer:
+    """Writes queued debug lines to a stream from a background thread"""
+
+    def __init__(self, stream=None, max_batch: int = 512):
+        self.stream = stream or sys.stdout
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="kptv-debug-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, line: str) -> None:
+        """Queue a line for writing"""
+        self._queue.put(line)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until everything queued so far has been written"""
+        if not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self) -> None:
+        """Drain the queue in batches so the stream is written once per batch"""
+        while True:
+            item = self._queue.get()
+            batch = []
+            waiters = []
+
+            # grab whatever else is already waiting, up to the batch size
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            # write the batch out
+            if batch:
+                try:
+                    self.stream.write("\n".join(batch) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    pass
+
+            # let anyone waiting on a flush know
+            for waiter in waiters:
+                waiter.set()
+
+def _get_writer() -> KP_Debug_Writer:
+    """Get the shared writer, starting it if needed"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = KP_Debug_Writer()
+                atexit.register(_writer.flush)
+    return _writer
+
+def set_debug(enabled_: bool, level: Any = None, categories: Optional[Iterable[str]] = None) -> None:
+    """Set the global debug state, and optionally the level and categories to show"""
+    global enabled, _level, _categories
+    enabled = bool(enabled_)
+    if level is not None:
+        _level = LEVELS.get(str(level).lower(), DEBUG) if isinstance(level, str) else int(level)
+    if categories is not None:
+        _categories = frozenset(c.strip().upper() for c in categories if c and c.strip()) or None
+
+def is_debug_enabled(category: Optional[str] = None, level: int = DEBUG) -> bool:
+    """Check if debug mode is enabled, optionally for a category and level"""
+    if not enabled or level < _level:
+        return False
+    return category is None or _categories is None or category in _categories
+
+def flush() -> None:
+    """Wait for any queued debug output to be written"""
+    if _writer is not None:
+        _writer.flush()
+
+def log(category: Optional[str], level: int, message: Any, *args) -> None:
+    """Write a debug message, formatting the %-style arguments only if it will be shown"""
+    if not enabled or level < _level or (category is not None and _categories is not None and category not in _categories):
+        return
+    try:
+        text = (message % args) if args else str(message)
+    except Exception:
+        text = f"{message} {args}"
+    prefix = f"DEBUG {category}:" if category else "DEBUG:"
+    _get_writer().write(f"{prefix} {text}")
+
+# our category logger
+class KP_Logger:
+    """A small logger bound to a category"""
+
+    def __init__(self, category: Optional[str] = None):
+        self.category = category
+
+    def is_enabled(self, level: int = DEBUG) -> bool:
+        return is_debug_enabled(self.category, level)
+
+    def trace(self, message: Any, *args) -> None:
+        if enabled:
+            log(self.category, TRACE, message, *args)
+
+    def debug(self, message: Any, *args) -> None:
+        if enabled:
+            log(self.category, DEBUG, message, *args)
+
+    def info(self, message: Any, *args) -> None:
+        if enabled:
+            log(self.category, INFO, message, *args)
+
+    def warn(self, message: Any, *args) -> None:
+        if enabled:
+            log(self.category, WARN, message, *args)
+
+    def error(self, message: Any, *args) -> None:
+        if enabled:
+            log(self.category, ERROR, message, *args)
+
+# hold the loggers we hand out
+_loggers = {}
+
+def get_logger(category: Optional[str] = None) -> KP_Logger:
+    """Get the logger for a category"""
+    category = category.upper() if category else None
+    if category not in _loggers:
+        _loggers[category] = KP_Logger(category)
+    return _loggers[category]
 
 def debug_print(*args, **kwargs) -> None:
     """Print debug message only if debug mode is enabled"""
-    if is_debug_enabled():
-        print("DEBUG:", *args, **kwargs)
+    if enabled:
+        log(None, DEBUG, " ".join(str(a) for a in args))
 
-def debug_print_config_search(message: str) -> None:
+def debug_print_config_search(message: str, *args) -> None:
     """Print config search debug message"""
-    if is_debug_enabled():
-        print(f"DEBUG CONFIG: {message}")
+    if enabled:
+        log("CONFIG", DEBUG, message, *args)
 
-def debug_print_db(message: str) -> None:
+def debug_print_db(message: str, *args) -> None:
     """Print database debug message"""
-    if is_debug_enabled():
-        print(f"DEBUG DB: {message}")
+    if enabled:
+        log("DB", DEBUG, message, *args)
 
-def debug_print_sync(message: str) -> None:
+def debug_print_sync(message: str, *args) -> None:
     """Print sync debug message"""
-    if is_debug_enabled():
-        print(f"DEBUG SYNC: {message}")
+    if enabled:
+        log("SYNC", DEBUG, message, *args)
 
-def debug_print_request(message: str) -> None:
+def debug_trace_sync(message: str, *args) -> None:
+    """Print a per-item sync debug message, only shown at the trace level"""
+    if enabled:
+        log("SYNC", TRACE, message, *args)
+
+def debug_print_request(message: str, *args) -> None:
     """Print request debug message"""
-    if is_debug_enabled():
-        print(f"DEBUG REQUEST: {message}")
+    if enabled:
+        log("REQUEST", DEBUG, message, *args)
 
 # Context manager for conditional debug output
 class DebugContext:
     """Context manager that only executes if debug is enabled"""
-    
-    def __init__(self):
-        self.enabled = is_debug_enabled()
-    
+
+    def __init__(self, category: Optional[str] = None, level: int = DEBUG):
+        self.enabled = is_debug_enabled(category, level)
+
     def __enter__(self):
         return self.enabled
-    
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
 # Usage examples:
-# 
-# from utils.debug import debug_print, DebugContext, set_debug
-# 
+#
+# from utils.debug import debug_print, debug_print_sync, DebugContext, set_debug
+#
 # # In main or common initialization:
-# set_debug(args.debug)
-# 
-# # Throughout the code:
-# debug_print("This only prints in debug mode")
-# 
-# with DebugContext() as debug:
+# set_debug(args.debug, args.debug_level, args.debug_categories)
+#
+# # Throughout the code, pass arguments instead of pre-formatting them:
+# debug_print_sync("Stream %s is valid", stream_id)
+#
+# # Or use a category logger:
+# _log = get_logger("SYNC")
+# _log.trace("Extracted stream ID: %s", stream_id)
+#
+# with DebugContext("DB") as debug:
 #     if debug:
 #         # This block only executes in debug mode
-#         expensive_debug_operation()
\ No newline at end of file
+#         expensive_debug_operation()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import time
+import asyncio
+import threading
+import tracemalloc
+from typing import Optional, Dict, Any
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print
+except ImportError:
+    def debug_print(*args): pass
+
+# read the process resident set size in bytes, None if we can't
+def read_rss( ) -> Optional[int]:
+
+    # linux has it in our status file
+    try:
+        with open( '/proc/self/status', 'rb' ) as f:
+            for line in f:
+                if line.startswith( b'VmRSS:' ):
+                    return int( line.split( )[1] ) * 1024
+    except ( OSError, ValueError, IndexError ):
+        pass
+
+    # otherwise the peak is the best we can do
+    try:
+        import resource
+        return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss * 1024
+    except ( ImportError, OSError ):
+        return None
+
+# our process memory monitor: samples rss and traced bytes, and attributes the peaks to whatever is running
+class KP_Memory_Monitor:
+
+    # fire us up
+    def __init__( self, budget: Optional[int] = None, interval: float = 0.25 ):
+
+        # setup the internal variables
+        self.budget = budget or None
+        self.interval = interval
+        self.rss = read_rss( ) or 0
+        self.peak_rss = self.rss
+        self.held = 0
+
+        # what's being tracked right now: id -> record
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock( )
+        self._stop = threading.Event( )
+        self._thread = None
+
+    # start sampling in the background
+    def start( self ) -> None:
+
+        # if it's already running, there's nothing to do
+        if self._thread is not None and self._thread.is_alive( ):
+            return
+
+        # fire up the sampler
+        self._stop.clear( )
+        self._thread = threading.Thread( target=self._run, name="kptv-memory", daemon=True )
+        self._thread.start( )
+
+    # stop sampling
+    def stop( self ) -> None:
+        self._stop.set( )
+        if self._thread is not None:
+            self._thread.join( )
+            self._thread = None
+
+    # the sampler loop
+    def _run( self ) -> None:
+        while not self._stop.wait( self.interval ):
+            self.sample( )
+
+    # take a sample, raising the peaks of everything being tracked
+    def sample( self ) -> int:
+
+        # read the memory
+        _rss = read_rss( ) or 0
+        _traced = tracemalloc.get_traced_memory( )[0] if tracemalloc.is_tracing( ) else None
+
+        # raise the peaks
+        with self._lock:
+            self.rss = _rss
+            self.peak_rss = max( self.peak_rss, _rss )
+            for record in self._active.values( ):
+                record['rss_peak'] = max( record['rss_peak'], _rss )
+                if _traced is not None:
+                    record['traced_peak'] = max( record.get( 'traced_peak', 0 ), _traced )
+
+        # return the rss
+        return _rss
+
+    # are we over the budget
+    def over_budget( self ) -> bool:
+        return self.budget is not None and self.rss > self.budget
+
+    # should a new provider wait: only while over budget and something else is running to free memory
+    def should_wait( self ) -> bool:
+
+        # no budget, no waiting
+        if self.budget is None:
+            return False
+
+        # check the current picture
+        self.sample( )
+        with self._lock:
+            return self.rss > self.budget and bool( self._active )
+
+    # hold a new provider back: returns whether it has to wait
+    def _hold( self, name: str ) -> bool:
+
+        # no budget, no waiting
+        if not self.should_wait( ):
+            return False
+
+        debug_print(f"Memory budget exceeded ({self.rss / 1048576:.0f} MiB > {self.budget / 1048576:.0f} MiB), holding {name} until it frees up")
+        self.held += 1
+        return True
+
+    # should a held provider keep waiting: until it's back under, or the run was cancelled
+    def _holding( self, cancel=None ) -> bool:
+        return self.should_wait( ) and not ( cancel is not None and cancel.cancelled )
+
+    # block until a new provider can start
+    def wait_for_budget( self, name: str, cancel=None ) -> None:
+        if self._hold( name ):
+            while self._holding( cancel ):
+                time.sleep( self.interval )
+
+    # the same, for the async engine
+    async def wait_for_budget_async( self, name: str, cancel=None ) -> None:
+        if self._hold( name ):
+            while self._holding( cancel ):
+                await asyncio.sleep( self.interval )
+
+    # start tracking a provider: returns its token
+    def begin( self ) -> int:
+
+        # sample now, so short providers still get a reading
+        _rss = self.sample( )
+        _record = { 'rss_start': _rss, 'rss_peak': _rss }
+        if tracemalloc.is_tracing( ):
+            _record['traced_peak'] = tracemalloc.get_traced_memory( )[0]
+
+        # register it
+        with self._lock:
+            _token = id( _record )
+            self._active[_token] = _record
+
+        # return the token
+        return _token
+
+    # stop tracking a provider: returns its memory counts
+    def end( self, token: int ) -> Dict[str, int]:
+
+        # one last sample, then drop it
+        self.sample( )
+        with self._lock:
+            _record = self._active.pop( token, None ) or { 'rss_start': 0, 'rss_peak': 0 }
+
+        # return its counts
+        _counts = { 'rss_peak': _record['rss_peak'], 'rss_growth': max( 0, _record['rss_peak'] - _record['rss_start'] ) }
+        if 'traced_peak' in _record:
+            _counts['traced_peak'] = _record['traced_peak']
+        return _counts
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import io
+import os
+import time
+import heapq
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from typing import Dict, List, Tuple
+
+# Import debug utilities
+try:
+    from utils.debug import debug_print
+except ImportError:
+    def debug_print(*args): pass
+
+# the allocation sites we leave out of the reports: the profilers own allocations and the import machinery
+_SKIPPED_FILES = frozenset( ( __file__, tracemalloc.__file__, heapq.__file__, pstats.__file__, cProfile.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>" ) )
+
+# is an allocation site one we leave out
+def _skipped( traceback: tracemalloc.Traceback ) -> bool:
+    return len( traceback ) > 0 and traceback[0].filename in _SKIPPED_FILES
+
+# the live allocations by line: traceback -> ( size, count ). the snapshot is taken as it is, filtering its traces
+# pattern matches every one of them in python, so our own sites are only dropped from the few we report
+def _by_line( ) -> Dict[tracemalloc.Traceback, Tuple[int, int]]:
+    return { stat.traceback: ( stat.size, stat.count ) for stat in tracemalloc.take_snapshot( ).statistics( 'lineno' ) }
+
+# a providers memory probe: snapshots at its stage boundaries, diffed into the top allocation sites per stage.
+# the snapshots are process-wide, so a stage also holds what any provider running alongside it allocated
+class KP_Memory_Probe:
+
+    # the finished probes for the run: ( name, [( stage, [sites], other providers running )] )
+    reports: List[Tuple[str, list]] = []
+    _lock = threading.Lock( )
+
+    # the probes running right now
+    _running: List['KP_Memory_Probe'] = []
+
+    # how many allocation sites to keep per stage
+    top = 10
+
+    # start probing, only if tracemalloc is tracing
+    def __init__( self, name: str ):
+
+        # setup the internal variables
+        self.name = name
+        self.enabled = tracemalloc.is_tracing( )
+        self._stages = []
+        self._last = _by_line( ) if self.enabled else None
+
+        # how many other providers ran during the current stage, everyone already running sees one more
+        self._others = 0
+        if self.enabled:
+            with KP_Memory_Probe._lock:
+                for probe in KP_Memory_Probe._running:
+                    probe._others += 1
+                self._others = len( KP_Memory_Probe._running )
+                KP_Memory_Probe._running.append( self )
+
+    # mark the end of a stage
+    def mark( self, stage: str ) -> None:
+
+        # nothing to do if we're not tracing
+        if not self.enabled:
+            return
+
+        # diff against the last boundary, keeping the biggest growers: the last boundary is already grouped, so only this one is
+        _current, _last = _by_line( ), self._last
+        _grown = ( ( traceback, size - _last.get( traceback, ( 0, 0 ) )[0], count - _last.get( traceback, ( 0, 0 ) )[1] ) for traceback, ( size, count ) in _current.items( ) )
+        _top = heapq.nlargest( self.top, ( site for site in _grown if site[1] > 0 and not _skipped( site[0] ) ), key=lambda site: site[1] )
+        with KP_Memory_Probe._lock:
+            _others, self._others = self._others, len( KP_Memory_Probe._running ) - 1
+        self._stages.append( ( stage, [( str( traceback ), size_diff, count_diff ) for traceback, size_diff, count_diff in _top], _others ) )
+        self._last = _current
+
+    # we're done with this provider
+    def finish( self ) -> None:
+
+        # nothing to do if we're not tracing
+        if not self.enabled:
+            return
+
+        # drop the last snapshot and keep the report
+        self._last = None
+        with KP_Memory_Probe._lock:
+            if self in KP_Memory_Probe._running:
+                KP_Memory_Probe._running.remove( self )
+            KP_Memory_Probe.reports.append( ( self.name, self._stages ) )
+
+# our cProfile and tracemalloc profiler
+class KP_Profiler:
+
+    # fire us up
+    def __init__( self, cpu: bool = True, memory: bool = False, prefix: str = "profile", top: int = 30, frames: int = 1 ):
+
+        # setup the internal variables
+        self.cpu = cpu
+        self.memory = memory
+        self.prefix = prefix
+        self.top = top
+        self.frames = frames
+        self.files = []
+
+        # the main threads profile, and the finished ones from every other thread
+        self._main = None
+        self._profiles = []
+        self._lock = threading.Lock( )
+        self._thread_run = None
+
+    # start profiling
+    def start( self ) -> None:
+
+        # the cpu profiler
+        if self.cpu:
+
+            # every thread started from here gets its own profile, merged when it finishes
+            self._thread_run = threading.Thread.run
+            _run = self._thread_run
+            _profiler = self
+
+            def _profiled_run( thread ):
+
+                # python 3.12+ profiles every thread from the main profile, so a second one can't start
+                _profile = cProfile.Profile( )
+                try:
+                    _profile.enable( )
+                except ValueError:
+                    _profile = None
+
+                # run the thread
+                try:
+                    _run( thread )
+
+                # and finally, keep its profile
+                finally:
+                    if _profile is not None:
+                        _profile.disable( )
+                        with _profiler._lock:
+                            _profiler._profiles.append( _profile )
+
+            threading.Thread.run = _profiled_run
+
+            # and profile this one
+            self._main = cProfile.Profile( )
+            self._main.enable( )
+
+        # the memory profiler
+        if self.memory and not tracemalloc.is_tracing( ):
+            tracemalloc.start( self.frames )
+            KP_Memory_Probe.reports = []
+            KP_Memory_Probe._running = []
+
+        debug_print(f"Profiling started (cpu: {self.cpu}, memory: {self.memory})")
+
+    # stop profiling and write the reports: returns the files written
+    def stop( self ) -> List[str]:
+
+        # setup the file name stamp, with our pid so runs started in the same second don't overwrite each other
+        _stamp = f"{time.strftime( '%Y%m%d_%H%M%S' )}_{os.getpid( )}"
+
+        # the cpu profile
+        if self._main is not None:
+
+            # stop it, and put the thread class back
+            self._main.disable( )
+            threading.Thread.run = self._thread_run
+
+            # merge every threads profile into the main one
+            _stats = pstats.Stats( self._main )
+            with self._lock:
+                for _profile in self._profiles:
+                    _stats.add( _profile )
+                _threads = len( self._profiles )
+
+            # dump the raw stats for snakeviz, pstats and friends
+            _pstats = f"{self.prefix}_{_stamp}.pstats"
+            _stats.dump_stats( _pstats )
+            self.files.append( _pstats )
+
+            # and the top functions as text
+            _text = f"{self.prefix}_{_stamp}.txt"
+            with open( _text, 'w', encoding='utf-8' ) as f:
+                f.write( f"Profile generated: {time.strftime( '%Y-%m-%d %H:%M:%S' )}, main thread plus {_threads} worker threads\n\n" )
+                for _sort in ( 'cumulative', 'tottime' ):
+                    _stats.stream = io.StringIO( )
+                    _stats.sort_stats( _sort ).print_stats( self.top )
+                    f.write( f"TOP {self.top} BY {_sort.upper( )}\n{_stats.stream.getvalue( )}\n" )
+            self.files.append( _text )
+            self._main = None
+
+        # the memory profile
+        if self.memory and tracemalloc.is_tracing( ):
+            self.files.append( self._write_memory( f"{self.prefix}_memory_{_stamp}.txt" ) )
+            tracemalloc.stop( )
+
+        debug_print(f"Profiling stopped, wrote: {', '.join( self.files )}")
+
+        # return the files
+        return self.files
+
+    # write the memory report
+    def _write_memory( self, filename: str ) -> str:
+
+        # grab the overall picture before we stop
+        _current, _peak = tracemalloc.get_traced_memory( )
+        _top = [stat for stat in tracemalloc.take_snapshot( ).statistics( 'lineno' ) if not _skipped( stat.traceback )][:self.top]
+
+        # write it out
+        with open( filename, 'w', encoding='utf-8' ) as f:
+            f.write( f"Memory profile generated: {time.strftime( '%Y-%m-%d %H:%M:%S' )}\n" )
+            f.write( f"Traced memory: {_current / 1048576:.1f} MiB current, {_peak / 1048576:.1f} MiB peak\n\n" )
+
+            # the biggest allocation sites still alive
+            f.write( f"TOP {self.top} LIVE ALLOCATION SITES\n" )
+            for stat in _top:
+                f.write( f"{stat.size / 1024:>12.1f} KiB {stat.count:>10} blocks  {stat.traceback}\n" )
+
+            # and what was allocated during each providers stages: process-wide, so it includes whoever ran alongside
+            with KP_Memory_Probe._lock:
+                _reports = list( KP_Memory_Probe.reports )
+            if _reports:
+                f.write( "\nPER PROVIDER STAGES (process-wide: a stage includes what other providers running alongside it allocated, use --provider for one on its own)\n" )
+            for name, stages in _reports:
+                f.write( f"\nPROVIDER: {name}\n" )
+                for stage, sites, others in stages:
+                    f.write( f"  {stage}: {sum( site[1] for site in sites ) / 1024:.1f} KiB in the top {len( sites )} sites" + ( f", {others} other providers running" if others else "" ) + "\n" )
+                    for traceback, size_diff, count_diff in sites:
+                        f.write( f"    {size_diff / 1024:>+12.1f} KiB {count_diff:>+10} blocks  {traceback}\n" )
+
+        # return the file
+        return filename
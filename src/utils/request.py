@@ -12,7 +12,7 @@ from functools import partial
 try:
     from utils.debug import debug_print_request
 except ImportError:
-    def debug_print_request(msg): pass
+    def debug_print_request(msg, *args): pass
 
 # our json request class
 class KP_Request:
@@ -46,6 +46,7 @@ class KP_Request:
         self.pool_block = pool_block
         self.default_headers = default_headers or {}
         self.session = self._create_session( )
+        self.bytes_read = 0  # response bytes read over this sessions life
         
         debug_print_request(f"KP_Request initialized with timeout={timeout}s, max_retries={max_retries}")
 
@@ -164,6 +165,7 @@ class KP_Request:
                         raise ValueError( f"Response exceeded maximum chunk count of {self.max_chunks}" )
             
             debug_print_request(f"JSON parsing completed: {bytes_read} bytes, {chunk_count} chunks")
+            self.bytes_read += bytes_read
             
             # return the json as a dict or list
             return json.loads( content.decode( 'utf-8' ) )
@@ -300,6 +302,7 @@ class KP_Request:
             # return the safely parsed text
             #return self._safe_parse_text( response, max_size )
             text_content = response.text
+            self.bytes_read += len( response.content )
             debug_print_request(f"Retrieved text content: {len(text_content)} characters")
             return text_content
 
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# our necessary imports
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# the provider stages, in the order they run
+PROVIDER_STAGES = ( 'fetch', 'parse', 'filter', 'convert', 'delta', 'insert', 'last_synced' )
+
+# the final database stages, after every provider
+FINAL_STAGES = ( 'streams_sync', 'streams_cleanup', 'streams_fixup' )
+
+# our per stage wall clock timer
+class KP_Stage_Timer:
+
+    # fire us up
+    def __init__( self ):
+
+        # hold the seconds spent per stage
+        self.timings: Dict[str, float] = {}
+
+    # add time to a stage
+    def add( self, stage: str, seconds: float ) -> None:
+        self.timings[stage] = self.timings.get( stage, 0.0 ) + seconds
+
+    # time a block as a stage
+    @contextmanager
+    def stage( self, name: str ):
+        _start = time.perf_counter( )
+        try:
+            yield
+        finally:
+            self.add( name, time.perf_counter( ) - _start )
+
+    # iterate something, timing how long each item takes to arrive as a stage
+    def timed_iter( self, name: str, iterable: Iterable ) -> Iterator:
+
+        # setup the iterator
+        _it = iter( iterable )
+
+        # pull each item, timing the wait
+        while True:
+            _start = time.perf_counter( )
+            try:
+                item = next( _it )
+            except StopIteration:
+                self.add( name, time.perf_counter( ) - _start )
+                return
+            self.add( name, time.perf_counter( ) - _start )
+            yield item
+
+    # the total of every stage
+    def total( self ) -> float:
+        return sum( self.timings.values( ) )
+
+# add up the stage timings from many providers
+def sum_timings( timings: Iterable[Optional[Dict[str, float]]] ) -> Dict[str, float]:
+
+    # hold the totals
+    _totals = {}
+    for _timings in timings:
+        for stage, seconds in ( _timings or {} ).items( ):
+            _totals[stage] = _totals.get( stage, 0.0 ) + seconds
+
+    # return them
+    return _totals
+
+# format a stage table: stage, seconds, and share of the total, plus rows per second for the stages we have row counts for
+def format_stage_table( timings: Dict[str, float], order: Iterable[str] = PROVIDER_STAGES, rows: Optional[Dict[str, int]] = None ) -> List[str]:
+
+    # setup the total, and the stages in order with any extras after
+    _total = sum( timings.values( ) ) or 1.0
+    _order = [stage for stage in order if stage in timings] + sorted( stage for stage in timings if stage not in order )
+
+    # build the lines
+    lines = [f"{'stage':<16} {'seconds':>10} {'share':>7}" + ( f" {'rows':>10} {'rows/s':>12}" if rows is not None else "" )]
+    for stage in _order:
+        _line = f"{stage:<16} {timings[stage]:>10.3f} {timings[stage] / _total * 100:>6.1f}%"
+        if rows is not None and stage in rows:
+            _rate = rows[stage] / timings[stage] if timings[stage] > 0 else 0.0
+            _line += f" {rows[stage]:>10} {_rate:>12,.0f}"
+        lines.append( _line )
+
+    # return them
+    return lines